@@ -1,7 +1,7 @@
 import logging
 import sys
 import os
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Union
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from .memory import Memory, State
 from .prompts_svg import LLM_grammar_sys, LLM_program_synthesis_prompt, SINGLE_CANDIDATE_GENERATION_PROMPT
@@ -9,8 +9,10 @@ from .prompts import VLM_edits_sys, VLM_edits_user_2, VLM_scene_description_prom
 from .prompts_vlm_select import VLM_CANDIDATE_SELECTION_PROMPT, VLM_CANDIDATE_SELECTION_SYS
 from .api_call_gemini import call_llm, call_vlm
 from .parser import parse_answer, parse_answer_json, format_message
-from .utils import compute_iou
-from render_svg import SVGAgent
+from .utils import TargetImage
+from .scoring import DEFAULT_LADDER, MultiResolutionScorer
+from render_svg import SVGRenderer
+from renderer.image import RenderedImage
 
 
 logging.basicConfig(
@@ -27,11 +29,20 @@ class Agent:
     """
     
     def __init__(self, model_name,
-                 target_image_path: str, canvas_w=600, canvas_h=600):
+                 target_image_path: str, canvas_w=600, canvas_h=600,
+                 scoring_ladder=DEFAULT_LADDER, save_artifacts: bool = False,
+                 target_threshold: str = "fixed"):
         self.model_name = model_name
         self.target_image_path = target_image_path
+        # Read once and handed to the VLM and the scorer in memory on every step
+        self.target_image = RenderedImage.open(target_image_path)
+        # Write candidate_{i}.png files to output_path; off by default so steps never touch disk
+        self.save_artifacts = save_artifacts
+        self.canvas_w = canvas_w
+        self.canvas_h = canvas_h
+        # Decoded, canvas-sized and binarized once for the run ("fixed", "otsu" or "adaptive")
+        self.target = TargetImage(self.target_image, canvas_w, canvas_h, method=target_threshold)
         self.memory = Memory()
-        self.SVGrender = SVGAgent(canvas_height=canvas_h, canvas_width=canvas_w)
         
         # Target scene description (set during initialization)
         self.target_scene_description: Optional[Dict[str, Any]] = None
@@ -39,6 +50,11 @@ class Agent:
         # Track feedback for VLM
         self.last_failed_suggestions: Optional[str] = None
         self.current_iou: float = 0.0
+        # Built on first scoring step from self.target; holds the target and current mask
+        # per rung of the ladder. ((1.0, None),) scores every candidate at full resolution.
+        self.scoring_ladder = scoring_ladder
+        self.iou_engine: Optional[MultiResolutionScorer] = None
+        self.last_coarse_ious: List[Dict[float, float]] = []
         
         # Track optimization history
         self.optimization_history: List[Dict[str, Any]] = []
@@ -49,7 +65,7 @@ class Agent:
         logging.info("🎯 Step 1: Analyzing target image and generating initial program...")
         
         # Get target scene description from VLM
-        self.target_scene_description = self._describe_scene_with_vlm(self.target_image_path, cus_instruct)
+        self.target_scene_description = self._describe_scene_with_vlm(self.target_image, cus_instruct)
         logging.info(f"📋 Target scene description: {len(self.target_scene_description.get('primitives', []))} primitives")
         
         # Generate initial program using LLM
@@ -66,16 +82,23 @@ class Agent:
         
         return initial_expression
     
-    def optimization_step(self, current_image_path: str, current_expression, output_path, cus_instruct=None) -> Tuple[str, Dict[str, Any], bool]:
+    def optimization_step(self, current_image_path: Optional[Union[str, RenderedImage]], current_expression,
+                          output_path: Optional[str] = None, cus_instruct=None) -> Tuple[str, Dict[str, Any], bool]:
         logging.info("🔄 Optimization step starting...")
-        # Calculate current IoU for comparison
-        self.current_iou = compute_iou(current_image_path, self.target_image_path)
+        current_image = self._current_image(current_image_path, current_expression)
+        # Calculate current IoU for comparison, rasterized the same way as the candidates.
+        # The engine keeps this render so candidates only redraw the shapes they change.
+        if self.iou_engine is None:
+            self.iou_engine = MultiResolutionScorer(
+                self.target, self.canvas_w, self.canvas_h, ladder=self.scoring_ladder
+            )
+        self.current_iou = self.iou_engine.set_current(current_expression)
         logging.info(f"📊 Current IoU: {self.current_iou:.4f}")
         
         # Step 1: Generate modification actions (with feedback if available)
         logging.info("⚡ Step 1: Generating modification actions...")
         actions = self._generate_modification_actions_with_feedback(
-            self.target_image_path, current_image_path, cus_instruct
+            self.target_image, current_image, cus_instruct
         )
         
         # Step 2: Generate 5 candidate expressions
@@ -90,24 +113,28 @@ class Agent:
         best_candidate, candidate_ious, improvement_made = self._select_best_candidate(
             candidates, output_path
         )
+        # Candidates pruned at low resolution have no exact IoU (None)
+        exact_ious = [iou for iou in candidate_ious if iou is not None]
+        best_candidate_iou = max(exact_ious) if exact_ious else self.current_iou
         
         # Step 4: Update state and feedback based on results
         step_info = {
             "actions": actions,
             "candidates": candidates,
             "candidate_ious": candidate_ious,
+            "candidate_coarse_ious": self.last_coarse_ious,
             "best_candidate": best_candidate,
             "improvement_made": improvement_made,
             "current_iou": self.current_iou,
-            "best_candidate_iou": max(candidate_ious) if candidate_ious else self.current_iou
+            "best_candidate_iou": best_candidate_iou
         }
         
         if improvement_made:
-            logging.info(f"✅ Improvement found! IoU: {self.current_iou:.4f} → {max(candidate_ious):.4f}")
+            logging.info(f"✅ Improvement found! IoU: {self.current_iou:.4f} → {best_candidate_iou:.4f}")
             new_expression = best_candidate
             self.last_failed_suggestions = None  # Reset feedback
         else:
-            logging.info(f"❌ No improvement. Keeping current expression. Best candidate IoU: {max(candidate_ious):.4f}")
+            logging.info(f"❌ No improvement. Keeping current expression. Best candidate IoU: {best_candidate_iou:.4f}")
             new_expression = current_expression
             self.last_failed_suggestions = actions  # Store for feedback
         
@@ -125,13 +152,15 @@ class Agent:
         logging.info(f"🔄 Optimization step complete.")
         return new_expression, step_info, improvement_made
     
-    def optimization_step_vlm(self, current_image_path: str, current_expression, output_path, cus_instruct=None) -> Tuple[str, Dict[str, Any], bool]:
+    def optimization_step_vlm(self, current_image_path: Optional[Union[str, RenderedImage]], current_expression,
+                              output_path: Optional[str] = None, cus_instruct=None) -> Tuple[str, Dict[str, Any], bool]:
         logging.info("🔄 VLM-based optimization step starting...")
+        current_image = self._current_image(current_image_path, current_expression)
         
         # Step 1: Generate modification actions (with feedback if available)
         logging.info("⚡ Step 1: Generating modification actions...")
         actions = self._generate_modification_actions_with_feedback(
-            self.target_image_path, current_image_path, cus_instruct
+            self.target_image, current_image, cus_instruct
         )
         
         # Step 2: Generate 5 candidate expressions
@@ -144,7 +173,7 @@ class Agent:
         # Step 3: Use VLM to select the best candidate
         logging.info("🧠 Step 3: Using VLM to select best candidate...")
         best_candidate, vlm_selection_info, improvement_made = self._select_best_candidate_vlm(
-            candidates, output_path, current_image_path
+            candidates, output_path, current_image
         )
         
         # Step 4: Update state and feedback based on results
@@ -185,7 +214,7 @@ class Agent:
         logging.info(f"🔄 VLM-based optimization step complete.")
         return new_expression, step_info, improvement_made
     
-    def _describe_scene_with_vlm(self, image_path: str, cus_instruct=None) -> Dict[str, Any]:
+    def _describe_scene_with_vlm(self, image_path: Union[str, RenderedImage], cus_instruct=None) -> Dict[str, Any]:
         user_prompt = VLM_scene_description_prompt.format(customer_instruction=cus_instruct)
         # logging.info(user_prompt)
         messages = format_message(user_prompt=user_prompt)
@@ -204,7 +233,8 @@ class Agent:
         init_program = parse_answer_json(response)
         return init_program
     
-    def _generate_modification_actions_with_feedback(self, target_image_path: str, current_image_path: str, cus_instruct=None) -> str:
+    def _generate_modification_actions_with_feedback(self, target_image_path: Union[str, RenderedImage],
+                                                     current_image_path: Union[str, RenderedImage], cus_instruct=None) -> str:
         """Generate modification actions using VLM, with feedback from previous failed attempts."""
         
         if self.last_failed_suggestions is None:
@@ -279,26 +309,49 @@ class Agent:
         
         return candidates[:5]
     
-    def _select_best_candidate(self, candidates: List[List], output_path) -> Tuple[str, List[float], bool]:
-        candidate_ious = []
-        
-        for i, candidate in enumerate(candidates):
+    def _current_image(self, current_image_path: Optional[Union[str, RenderedImage]], current_expression) -> Union[str, RenderedImage]:
+        """The caller's image of the current expression, or an in-memory render of it when none is given"""
+        if current_image_path is not None:
+            return current_image_path
+        image = SVGRenderer.render_batch([current_expression], size=(self.canvas_w, self.canvas_h), fmt="image")[0]
+        if image is None:
+            raise RuntimeError("Could not render the current expression")
+        return image
+
+    def _save_candidate_images(self, images: List[Optional[RenderedImage]], output_path: str) -> List[Optional[str]]:
+        """Write candidate_{i}.png files to output_path; returns each path (None if not written)"""
+        paths: List[Optional[str]] = [None] * len(images)
+        for i, image in enumerate(images):
+            if image is None:
+                continue
             try:
-                self.SVGrender.clear()
-                self.SVGrender.create_from_dict(candidate)
-                candidate_image_path = self.SVGrender.save_png(os.path.join(output_path, f"candidate_{i}.png"))
-                # Calculate IoU with target
-                iou = compute_iou(candidate_image_path, self.target_image_path)
-                candidate_ious.append(iou)
-                
-                logging.info(f"📊 Candidate {i+1} IoU: {iou:.4f}")
-                
+                paths[i] = image.save(os.path.join(output_path, f"candidate_{i}.png"))
             except Exception as e:
-                logging.error(f"❌ Error evaluating candidate {i+1}: {e}")
-                candidate_ious.append(0.0)  # Assign lowest score on error
+                logging.error(f"❌ Error saving image for candidate {i+1}: {e}")
+        return paths
+
+    def _select_best_candidate(self, candidates: List[List], output_path: Optional[str]) -> Tuple[str, List[Optional[float]], bool]:
+        # Score everything at low resolution, then only the leaders exactly at full
+        # resolution; each rung re-rasterizes only the shapes changed from current and
+        # counts every fully re-rendered candidate in one batch (compute_iou_batch)
+        candidate_ious, rung_scores = self.iou_engine.score_candidates(candidates)
+        self.last_coarse_ious = rung_scores
+
+        if self.save_artifacts and output_path:
+            # Scoring never renders PNGs, so render them only when they are kept
+            images = SVGRenderer.render_batch(candidates, size=(self.canvas_w, self.canvas_h), fmt="image")
+            self._save_candidate_images(images, output_path)
+
+        for i, iou in enumerate(candidate_ious):
+            if iou is None:
+                coarse = ", ".join(f"{scale:g}x: {score:.4f}" for scale, score in rung_scores[i].items())
+                logging.info(f"📊 Candidate {i+1} pruned ({coarse})")
+            else:
+                logging.info(f"📊 Candidate {i+1} IoU: {iou:.4f}")
         
         # Find best candidate
-        best_idx = candidate_ious.index(max(candidate_ious))
+        scored = [iou if iou is not None else -1.0 for iou in candidate_ious]
+        best_idx = scored.index(max(scored))
         best_candidate = candidates[best_idx]
         best_iou = candidate_ious[best_idx]
         
@@ -309,29 +362,26 @@ class Agent:
         
         return best_candidate, candidate_ious, improvement_made
 
-    def _select_best_candidate_vlm(self, candidates: List[List], output_path: str, current_image_path) -> Tuple[str, Dict[str, Any], bool]:
-        candidate_image_paths = []
-        
-        # Generate images for all candidates
-        for i, candidate in enumerate(candidates):
-            try:
-                self.SVGrender.clear()
-                self.SVGrender.create_from_dict(candidate)
-                candidate_image_path = self.SVGrender.save_png(os.path.join(output_path, f"candidate_{i}.png"))
-                candidate_image_paths.append(candidate_image_path)
+    def _select_best_candidate_vlm(self, candidates: List[List], output_path: Optional[str],
+                                   current_image_path: Union[str, RenderedImage]) -> Tuple[str, Dict[str, Any], bool]:
+        # Render all candidates in parallel; the images stay in memory for the VLM
+        candidate_images = SVGRenderer.render_batch(candidates, size=(self.canvas_w, self.canvas_h), fmt="image")
+        for i, image in enumerate(candidate_images):
+            if image is None:
+                logging.error(f"❌ Error generating image for candidate {i+1}: PNG rendering failed")
+            else:
                 logging.info(f"📷 Generated image for candidate {i+1}")
-                
-            except Exception as e:
-                logging.error(f"❌ Error generating image for candidate {i+1}: {e}")
-                candidate_image_paths.append(None)
+        candidate_image_paths = [None] * len(candidate_images)
+        if self.save_artifacts and output_path:
+            candidate_image_paths = self._save_candidate_images(candidate_images, output_path)
         
         # Prepare images for VLM: target + current + valid candidates
-        vlm_image_paths = [self.target_image_path, current_image_path]
+        vlm_image_paths = [self.target_image, current_image_path]
         valid_candidate_indices = []
         
-        for i, img_path in enumerate(candidate_image_paths):
-            if img_path is not None:
-                vlm_image_paths.append(img_path)
+        for i, image in enumerate(candidate_images):
+            if image is not None:
+                vlm_image_paths.append(image)
                 valid_candidate_indices.append(i)
         
         # Call VLM for selection
@@ -388,7 +438,7 @@ class Agent:
             }
             return best_candidate, selection_info, False
 
-    def _call_vlm_for_candidate_selection(self, image_paths: List[str], num_candidates: int) -> str:
+    def _call_vlm_for_candidate_selection(self, image_paths: List[Union[str, RenderedImage]], num_candidates: int) -> str:
         """Call VLM to select the best candidate."""
         
         user_prompt = VLM_CANDIDATE_SELECTION_PROMPT.format(
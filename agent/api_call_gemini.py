@@ -2,7 +2,9 @@ import os
 from google import genai
 from google.genai import types
 from PIL import Image
-from typing import List, Dict
+from typing import List, Dict, Union
+
+from renderer.image import PNG_MIME_TYPE, RenderedImage
 
 # Configure Gemini API
 client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
@@ -39,13 +41,17 @@ def call_llm(
 
 def call_vlm(
     messages: List[Dict[str, str]],
-    image_paths: List[str],
+    image_paths: List[Union[str, RenderedImage]],
     model_name: str = "gemini-2.5-pro",
     temperature: float = 0.3
 ) -> str:
     gemini_messages, sys_instruction = format_for_gemini(messages=messages)
     for image_path in image_paths:
-        image = Image.open(image_path)
+        # In-memory renders go up as their PNG bytes, with no decode or disk round-trip
+        if isinstance(image_path, RenderedImage):
+            image = types.Part.from_bytes(data=image_path.png, mime_type=PNG_MIME_TYPE)
+        else:
+            image = Image.open(image_path)
         gemini_messages.append(image)
     
     response = client.models.generate_content(
@@ -2,7 +2,9 @@ import os
 import base64
 import mimetypes
 from openai import OpenAI
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
+
+from renderer.image import RenderedImage
 
 # instantiate once
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
@@ -33,15 +35,24 @@ def local_image_to_data_url(image_path: str) -> str:
     return f"data:{mime_type};base64,{b64}"
 
 
+def image_to_data_url(image: Union[str, RenderedImage]) -> str:
+    """
+    Data URL for a file path or an in-memory RenderedImage (encoded without touching disk).
+    """
+    if isinstance(image, RenderedImage):
+        return image.to_data_url()
+    return local_image_to_data_url(image)
+
+
 def call_vlm(
     messages: List[Dict[str, str]],
-    image_paths: List[str],
+    image_paths: List[Union[str, RenderedImage]],
     model_name: str = "gpt-4o",
     temperature: float = 1,
     max_tokens: int = 2000,
 ) -> str:
     # convert all images to data URLs
-    data_urls = [local_image_to_data_url(path) for path in image_paths]
+    data_urls = [image_to_data_url(path) for path in image_paths]
 
     # locate last user message
     last_user_idx = max(i for i, m in enumerate(messages) if m["role"] == "user")
@@ -77,8 +88,8 @@ def call_vlm(
 
 def call_vlm_flexible(
     messages: List[Dict[str, str]],
-    image_paths: List[str] = None,
-    image_path: str = None,  # backward compatibility
+    image_paths: List[Union[str, RenderedImage]] = None,
+    image_path: Union[str, RenderedImage] = None,  # backward compatibility
     model_name: str = "gpt-4o",
     temperature: float = 0.3,
     max_tokens: int = 500,
@@ -94,7 +105,7 @@ def call_vlm_flexible(
         print("Warning: Both image_paths and image_path provided. Using image_paths.")
     
     # convert all images to data URLs
-    data_urls = [local_image_to_data_url(path) for path in image_paths]
+    data_urls = [image_to_data_url(path) for path in image_paths]
 
     # locate last user message
     last_user_idx = max(i for i, m in enumerate(messages) if m["role"] == "user")
@@ -0,0 +1,344 @@
+import json
+import logging
+from collections import Counter
+from typing import List, Dict, Any, Optional, Sequence, Tuple, Union
+
+import cv2
+import numpy as np
+
+from .utils import ImageSource, IoUBatch, TargetImage, load_and_preprocess_image, load_rgb_image
+from renderer.color import JND_DELTA_E, image_delta_e
+from renderer.raster import rasterize_shapes, shape_bounds
+
+
+Rect = Tuple[int, int, int, int]  # (c0, r0, c1, r1), end-exclusive
+
+# (scale, candidates promoted to the next rung); the last rung is full resolution
+DEFAULT_LADDER = ((0.25, 2), (1.0, None))
+
+# Fields measured in canvas pixels, rescaled for low-resolution scoring
+_LENGTH_FIELDS = ("x", "y", "scale_x", "scale_y", "stroke_width", "font_size", "arrowhead_size")
+
+
+def load_target_mask(image_path: ImageSource, width: int, height: int, threshold: int = 128) -> np.ndarray:
+    """Binarize the target exactly as compute_iou does when scoring a width x height render.
+
+    A TargetImage of that size returns its own mask (and binarization).
+    """
+    if isinstance(image_path, TargetImage) and (image_path.width, image_path.height) == (width, height):
+        return image_path.mask
+    img = load_and_preprocess_image(image_path)
+    if img.shape != (height, width):
+        img = cv2.resize(img, (width, height))
+    return img > threshold
+
+
+def color_fidelity(target: ImageSource, candidate: ImageSource,
+                   mask: Optional[np.ndarray] = None) -> Dict[str, float]:
+    """Per-pixel CIE76 color distance of candidate from target, in one vectorized pass.
+
+    The candidate is resized to the target first, as compute_iou does; mask
+    (target-sized, boolean) limits the comparison, e.g. to the target's ink.
+    Returns mean and 95th-percentile ΔE and the share of pixels within a
+    just noticeable difference.
+    """
+    target_rgb = load_rgb_image(target)
+    candidate_rgb = load_rgb_image(candidate)
+    if candidate_rgb.shape != target_rgb.shape:
+        candidate_rgb = cv2.resize(candidate_rgb, (target_rgb.shape[1], target_rgb.shape[0]))
+    de = image_delta_e(target_rgb, candidate_rgb, mask)
+    if de.size == 0:
+        return {"mean_delta_e": 0.0, "p95_delta_e": 0.0, "matched": 1.0}
+    return {"mean_delta_e": float(de.mean()), "p95_delta_e": float(np.percentile(de, 95)),
+            "matched": float(np.count_nonzero(de <= JND_DELTA_E) / de.size)}
+
+
+def scale_shape(shape: Any, factor: float) -> Dict[str, Any]:
+    """Copy of shape with every length multiplied by factor (rotation is unchanged)"""
+    if not isinstance(shape, dict):
+        shape = shape.to_dict() if hasattr(shape, "to_dict") else vars(shape)
+    scaled = dict(shape)
+    for key in _LENGTH_FIELDS:
+        if key in scaled:
+            try:
+                scaled[key] = float(scaled[key]) * factor
+            except (TypeError, ValueError):
+                pass
+    if scaled.get("points"):
+        try:
+            scaled["points"] = [[float(p[0]) * factor, float(p[1]) * factor] for p in scaled["points"]]
+        except (TypeError, ValueError, IndexError):
+            pass
+    return scaled
+
+
+def _shape_key(shape: Any) -> str:
+    if not isinstance(shape, dict):
+        # Shape dataclasses and ShapeTable rows
+        shape = shape.to_dict() if hasattr(shape, "to_dict") else vars(shape)
+    return json.dumps(shape, sort_keys=True, separators=(",", ":"), default=str)
+
+
+def _merge_rects(rects: List[Rect]) -> List[Rect]:
+    """Merge overlapping rectangles until the set is disjoint, so no pixel is counted twice."""
+    rects = list(rects)
+    merged = True
+    while merged:
+        merged = False
+        out: List[Rect] = []
+        for rect in rects:
+            for i, other in enumerate(out):
+                if rect[0] < other[2] and other[0] < rect[2] and rect[1] < other[3] and other[1] < rect[3]:
+                    out[i] = (min(rect[0], other[0]), min(rect[1], other[1]),
+                              max(rect[2], other[2]), max(rect[3], other[3]))
+                    merged = True
+                    break
+            else:
+                out.append(rect)
+        rects = out
+    return rects
+
+
+class IncrementalIoU:
+    """
+    IoU scorer that re-rasterizes only what changed relative to the current expression.
+
+    The current expression's mask and its intersection/union counts with the
+    target are kept. A candidate is diffed shape-by-shape against it; only the
+    bounding boxes of added and removed shapes are redrawn (with every shape
+    of the candidate that overlaps them, in paint order), and the counts are
+    patched from those dirty regions. Scores equal compute_iou on a full
+    rasterization of the candidate.
+
+    score_batch scores several candidates at once: those that need a full
+    render are binarized into one preallocated stack and counted together
+    (IoUBatch), so a batch costs its rasterization plus one pass over memory.
+    """
+
+    def __init__(self, target_mask: np.ndarray, background: str = "white", threshold: int = 128,
+                 max_dirty_fraction: float = 0.5):
+        self.target_mask = target_mask
+        self.height, self.width = target_mask.shape
+        self.background = background
+        self.threshold = threshold
+        # Above this share of the canvas a plain full render is cheaper
+        self.max_dirty_fraction = max_dirty_fraction
+        self._batch = IoUBatch(target_mask)
+
+        self.current_shapes: List[Any] = []
+        self.current_keys: List[str] = []
+        self.current_mask: Optional[np.ndarray] = None
+        self.intersection = 0
+        self.union = 0
+        self._bounds: Dict[str, Optional[Rect]] = {}
+
+    @classmethod
+    def from_image(cls, image_path: ImageSource, width: int, height: int, **kwargs) -> "IncrementalIoU":
+        threshold = kwargs.get("threshold", 128)
+        return cls(load_target_mask(image_path, width, height, threshold), **kwargs)
+
+    @staticmethod
+    def _iou(intersection: int, union: int) -> float:
+        if union == 0:
+            return 1.0 if intersection == 0 else 0.0
+        return float(intersection / union)
+
+    @property
+    def current_iou(self) -> float:
+        return self._iou(self.intersection, self.union)
+
+    def _bounds_of(self, shape: Any, key: str) -> Optional[Rect]:
+        """Memoized shape_bounds; most shapes recur across candidates and steps"""
+        if key not in self._bounds:
+            if len(self._bounds) > 100000:
+                self._bounds.clear()
+            self._bounds[key] = shape_bounds(shape)
+        return self._bounds[key]
+
+    def _full_mask(self, shapes: List[Any]) -> np.ndarray:
+        return rasterize_shapes(shapes, self.width, self.height, self.background) > self.threshold
+
+    def set_current(self, shapes: Union[List[Any], Dict[str, Any]]) -> float:
+        """Make shapes the baseline expression; returns its IoU"""
+        if isinstance(shapes, dict):
+            shapes = [shapes]
+        shapes = list(shapes or [])
+        self.current_shapes = shapes
+        self.current_keys = [_shape_key(s) for s in shapes]
+        self.current_mask = self._full_mask(shapes)
+        self.intersection = int(np.count_nonzero(self.current_mask & self.target_mask))
+        self.union = int(np.count_nonzero(self.current_mask | self.target_mask))
+        return self.current_iou
+
+    def _dirty_rects(self, candidate: List[Any], candidate_keys: List[str]) -> Optional[List[Rect]]:
+        """Clipped, disjoint rectangles covering every changed shape; None means re-render fully."""
+        removed = Counter(self.current_keys) - Counter(candidate_keys)
+        added = Counter(candidate_keys) - Counter(self.current_keys)
+
+        # Shapes kept by both must stay in the same paint order, or overlaps may change anywhere
+        kept_current = [k for k in self.current_keys if k not in removed]
+        kept_candidate = [k for k in candidate_keys if k not in added]
+        if kept_current != kept_candidate:
+            return None
+
+        changed = [(s, k) for s, k in zip(self.current_shapes, self.current_keys) if k in removed]
+        changed += [(s, k) for s, k in zip(candidate, candidate_keys) if k in added]
+        rects = []
+        for shape, key in changed:
+            bounds = self._bounds_of(shape, key)
+            if bounds is None:
+                continue
+            c0, r0 = max(bounds[0], 0), max(bounds[1], 0)
+            c1, r1 = min(bounds[2], self.width), min(bounds[3], self.height)
+            if c0 < c1 and r0 < r1:
+                rects.append((c0, r0, c1, r1))
+
+        rects = _merge_rects(rects)
+        dirty_area = sum((c1 - c0) * (r1 - r0) for c0, r0, c1, r1 in rects)
+        if dirty_area > self.max_dirty_fraction * self.width * self.height:
+            return None
+        return rects
+
+    def _prepare(self, candidate: Union[List[Any], Dict[str, Any]]) -> Tuple[List[Any], List[str], Optional[List[Rect]]]:
+        """(shapes, keys, dirty rects) of a candidate; rects None means it needs a full render"""
+        if isinstance(candidate, dict):
+            candidate = [candidate]
+        candidate = list(candidate or [])
+        if self.current_mask is None:
+            self.set_current([])
+        candidate_keys = [_shape_key(s) for s in candidate]
+        return candidate, candidate_keys, self._dirty_rects(candidate, candidate_keys)
+
+    def score(self, candidate: Union[List[Any], Dict[str, Any]]) -> float:
+        """IoU of candidate against the target, updated from the dirty regions only"""
+        candidate, candidate_keys, rects = self._prepare(candidate)
+        if rects is None:
+            return float(self._batch.iou((self._full_mask(candidate),))[0])
+        return self._patched_iou(candidate, candidate_keys, rects)
+
+    def score_batch(self, candidates: List[Any]) -> Tuple[List[float], Dict[int, Exception]]:
+        """IoU of every candidate, and the errors of those that failed (scored 0.0) by index"""
+        scores = [0.0] * len(candidates)
+        errors: Dict[int, Exception] = {}
+        full: List[Tuple[int, List[Any]]] = []
+        for i, candidate in enumerate(candidates):
+            try:
+                candidate, candidate_keys, rects = self._prepare(candidate)
+                if rects is None:
+                    full.append((i, candidate))
+                else:
+                    scores[i] = self._patched_iou(candidate, candidate_keys, rects)
+            except Exception as e:
+                errors[i] = e
+
+        stack = self._batch.stack(len(full))
+        rendered: List[int] = []
+        for i, candidate in full:
+            try:
+                raster = rasterize_shapes(candidate, self.width, self.height, self.background)
+                np.greater(raster, self.threshold, out=stack[len(rendered)])
+                rendered.append(i)
+            except Exception as e:
+                errors[i] = e
+        for i, iou in zip(rendered, self._batch.iou(stack[:len(rendered)])):
+            scores[i] = float(iou)
+        return scores, errors
+
+    def _patched_iou(self, candidate: List[Any], candidate_keys: List[str], rects: List[Rect]) -> float:
+        intersection, union = self.intersection, self.union
+        candidate_bounds = [self._bounds_of(s, k) for s, k in zip(candidate, candidate_keys)]
+        for rect in rects:
+            c0, r0, c1, r1 = rect
+            # Only shapes touching this window can affect it
+            overlapping = []
+            for shape, bounds in zip(candidate, candidate_bounds):
+                if bounds is not None and bounds[0] < c1 and c0 < bounds[2] and bounds[1] < r1 and r0 < bounds[3]:
+                    overlapping.append(shape)
+            new = rasterize_shapes(overlapping, self.width, self.height, self.background, window=rect) > self.threshold
+            old = self.current_mask[r0:r1, c0:c1]
+            tgt = self.target_mask[r0:r1, c0:c1]
+            intersection += int(np.count_nonzero(new & tgt)) - int(np.count_nonzero(old & tgt))
+            union += int(np.count_nonzero(new | tgt)) - int(np.count_nonzero(old | tgt))
+        return self._iou(intersection, union)
+
+
+class MultiResolutionScorer:
+    """
+    Coarse-to-fine candidate scoring over a resolution ladder.
+
+    Every rung holds an IncrementalIoU against the target's mask at that
+    scale (TargetImage.mask_at: INTER_AREA, then binarized). All candidates are scored on the
+    first rung, only the best `keep` move up, and the last rung is always
+    full resolution, so every score it returns is exact. Candidates pruned
+    before the last rung get None.
+    """
+
+    def __init__(self, target: Union[np.ndarray, TargetImage], width: int, height: int,
+                 ladder: Sequence[Tuple[float, Optional[int]]] = DEFAULT_LADDER,
+                 background: str = "white", threshold: int = 128):
+        ladder = [(float(scale), keep) for scale, keep in ladder]
+        if not ladder or ladder[-1][0] != 1.0:
+            raise ValueError("The resolution ladder must end at scale 1.0")
+        if any(not 0 < scale < 1 for scale, _ in ladder[:-1]):
+            raise ValueError("Ladder scales before the last rung must be in (0, 1)")
+        if not isinstance(target, TargetImage):
+            target = TargetImage(target, width, height, threshold=threshold)
+        elif (target.width, target.height) != (width, height):
+            raise ValueError(f"Target is prepared for {target.width}x{target.height}, not {width}x{height}")
+        self.ladder = ladder
+        self.width, self.height = width, height
+        self.target = target
+        self.engines: List[IncrementalIoU] = []
+        for scale, _ in ladder:
+            self.engines.append(IncrementalIoU(target.mask_at(scale), background=background, threshold=threshold))
+
+    @classmethod
+    def from_image(cls, image_path: ImageSource, width: int, height: int, **kwargs) -> "MultiResolutionScorer":
+        if not isinstance(image_path, TargetImage):
+            image_path = load_and_preprocess_image(image_path)
+        return cls(image_path, width, height, **kwargs)
+
+    @property
+    def current_iou(self) -> float:
+        return self.engines[-1].current_iou
+
+    def _scaled(self, shapes: List[Any], scale: float) -> List[Any]:
+        return shapes if scale == 1.0 else [scale_shape(s, scale) for s in shapes]
+
+    def set_current(self, shapes: Union[List[Any], Dict[str, Any]]) -> float:
+        """Make shapes the baseline on every rung; returns the exact full-resolution IoU"""
+        if isinstance(shapes, dict):
+            shapes = [shapes]
+        shapes = list(shapes or [])
+        for (scale, _), engine in zip(self.ladder, self.engines):
+            engine.set_current(self._scaled(shapes, scale))
+        return self.current_iou
+
+    def score_candidates(self, candidates: List[Any]) -> Tuple[List[Optional[float]], List[Dict[float, float]]]:
+        """Exact IoU per candidate (None if pruned early) and every rung's score per candidate"""
+        alive = list(range(len(candidates)))
+        history: List[Dict[float, float]] = [{} for _ in candidates]
+        exact: List[Optional[float]] = [None] * len(candidates)
+        for (scale, keep), engine in zip(self.ladder, self.engines):
+            # One batch per rung: full renders share a mask stack and a single count pass
+            batch, batch_ids = [], []
+            for i in alive:
+                try:
+                    batch.append(self._scaled(candidates[i], scale))
+                    batch_ids.append(i)
+                except Exception as e:
+                    logging.error(f"❌ Error scoring candidate {i+1} at scale {scale}: {e}")
+                    history[i][scale] = 0.0
+            scores, errors = engine.score_batch(batch)
+            for j, i in enumerate(batch_ids):
+                if j in errors:
+                    logging.error(f"❌ Error scoring candidate {i+1} at scale {scale}: {errors[j]}")
+                history[i][scale] = scores[j]
+            if scale == 1.0:
+                for i in alive:
+                    exact[i] = history[i][scale]
+                break
+            if keep is not None:
+                # Stable sort keeps the earlier candidate on ties, like list.index(max(...))
+                alive = sorted(sorted(alive, key=lambda i: -history[i][scale])[:keep])
+        return exact, history
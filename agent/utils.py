@@ -2,23 +2,141 @@ import cv2
 import numpy as np
 from PIL import Image
 import logging
-from typing import Union
+from typing import Dict, Optional, Sequence, Tuple, Union
 
+from renderer.image import RenderedImage
 
-def compute_iou(image1_path: str, image2_path: str, threshold: int = 128) -> float:
+ImageSource = Union[str, np.ndarray, RenderedImage, "TargetImage"]
+
+THRESHOLD_METHODS = ("fixed", "otsu", "adaptive")
+# Masks kept in TargetImage.pyramid: full size, then halved each level
+PYRAMID_LEVELS = 3
+
+
+class TargetImage:
+    """
+    The target sketch, prepared once for a whole run.
+
+    Decoded to grayscale and resized to the canvas on construction, then
+    binarized with one of THRESHOLD_METHODS (mask: True where the pixel is
+    brighter than the threshold, as compute_iou counts it):
+
+        fixed     gray > threshold (128 by default, the historical rule)
+        otsu      gray > the Otsu threshold of the whole image
+        adaptive  gray > Gaussian-weighted local mean - adaptive_c over
+                  adaptive_block px, for scans with uneven lighting
+
+    Downsampled masks (mask_at, pyramid), the distance transform and the edge
+    map are computed on first use and kept. Every metric that takes an
+    ImageSource accepts a TargetImage and uses its mask instead of
+    re-thresholding.
+    """
+
+    def __init__(self, image: ImageSource, width: int, height: int, method: str = "fixed",
+                 threshold: int = 128, adaptive_block: int = 51, adaptive_c: int = 10):
+        if method not in THRESHOLD_METHODS:
+            raise ValueError(f"Unknown threshold method {method!r}; use one of {', '.join(THRESHOLD_METHODS)}")
+        self.source = image
+        self.width, self.height = width, height
+        self.method = method
+        self.adaptive_block = adaptive_block
+        self.adaptive_c = adaptive_c
+        # Pyramid levels are downsampled from the decoded image, not the resized one
+        self._source_gray = load_and_preprocess_image(image)
+        if self._source_gray.shape == (height, width):
+            self.gray = self._source_gray
+        else:
+            self.gray = cv2.resize(self._source_gray, (width, height))
+        if method == "otsu":
+            threshold, _ = cv2.threshold(self.gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        # None for adaptive, which has no single threshold
+        self.threshold: Optional[float] = None if method == "adaptive" else threshold
+        self.mask = self._binarize(self.gray, 1.0)
+        self._masks: Dict[Tuple[int, int], np.ndarray] = {(width, height): self.mask}
+        self._rgb: Optional[np.ndarray] = None
+        self._distance: Optional[np.ndarray] = None
+        self._edges: Optional[np.ndarray] = None
+        self._iou_batch: Optional["IoUBatch"] = None
+
+    def _binarize(self, gray: np.ndarray, scale: float) -> np.ndarray:
+        if self.threshold is not None:
+            return gray > self.threshold
+        block = max(3, int(round(self.adaptive_block * scale)) | 1)
+        return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                     block, self.adaptive_c) > 0
+
+    def mask_at(self, scale: float) -> np.ndarray:
+        """Mask at a fraction of the canvas size (INTER_AREA downsampling, then binarized)"""
+        size = (max(1, round(self.width * scale)), max(1, round(self.height * scale)))
+        mask = self._masks.get(size)
+        if mask is None:
+            small = cv2.resize(self._source_gray, size, interpolation=cv2.INTER_AREA)
+            mask = self._masks[size] = self._binarize(small, scale)
+        return mask
+
+    @property
+    def pyramid(self) -> Tuple[np.ndarray, ...]:
+        """Masks at full, half, quarter ... size"""
+        return tuple(self.mask_at(0.5 ** level) for level in range(PYRAMID_LEVELS))
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """Canvas-sized RGB pixels (for color metrics)"""
+        if self._rgb is None:
+            rgb = load_rgb_image(self.source)
+            if rgb.shape[:2] != (self.height, self.width):
+                rgb = cv2.resize(rgb, (self.width, self.height))
+            self._rgb = rgb
+        return self._rgb
+
+    @property
+    def distance(self) -> np.ndarray:
+        """float32 distance in px from each pixel to the nearest ink (mask False) pixel"""
+        if self._distance is None:
+            self._distance = cv2.distanceTransform(self.mask.astype(np.uint8), cv2.DIST_L2, 5)
+        return self._distance
+
+    @property
+    def iou_batch(self) -> "IoUBatch":
+        """Buffers for compute_iou_batch against this target, kept across calls"""
+        if self._iou_batch is None:
+            self._iou_batch = IoUBatch(self.mask)
+        return self._iou_batch
+
+    @property
+    def edges(self) -> np.ndarray:
+        """Canny edge map of the canvas-sized target"""
+        if self._edges is None:
+            self._edges = cv2.Canny(self.gray, 50, 150) > 0
+        return self._edges
+
+
+def compute_iou(image1_path: ImageSource, image2_path: ImageSource, threshold: int = 128) -> float:
+    """IoU of the thresholded images; each argument may be a path, an array, a RenderedImage or a TargetImage.
+
+    A TargetImage keeps its own binarization and size; the other image is
+    resized to it.
+    """
     try:
+        # IoU is symmetric, so put a TargetImage first
+        if isinstance(image2_path, TargetImage) and not isinstance(image1_path, TargetImage):
+            image1_path, image2_path = image2_path, image1_path
+
         # Load images
-        img1 = load_and_preprocess_image(image1_path)
         img2 = load_and_preprocess_image(image2_path)
+        if isinstance(image1_path, TargetImage):
+            mask1 = image1_path.mask
+        else:
+            img1 = load_and_preprocess_image(image1_path)
+            mask1 = img1 > threshold
         
         # Ensure images are the same size
-        if img1.shape != img2.shape:
+        if mask1.shape != img2.shape:
             # Resize img2 to match img1
-            img2 = cv2.resize(img2, (img1.shape[1], img1.shape[0]))
+            img2 = cv2.resize(img2, (mask1.shape[1], mask1.shape[0]))
         
         # Convert to binary masks
-        mask1 = (img1 > threshold).astype(np.uint8)
-        mask2 = (img2 > threshold).astype(np.uint8)
+        mask2 = img2 > threshold
         
         # Calculate intersection and union
         intersection = np.logical_and(mask1, mask2).sum()
@@ -36,7 +154,78 @@ def compute_iou(image1_path: str, image2_path: str, threshold: int = 128) -> flo
         return 0.0
 
 
-def load_and_preprocess_image(image_path: str) -> np.ndarray:
+class IoUBatch:
+    """
+    Preallocated buffers for scoring many candidate masks against one target mask.
+
+    stack(n) hands out an (n, h, w) boolean array for candidates to be
+    binarized into in place (np.greater(gray, threshold, out=stack[i])).
+    iou() then reduces a stack plane by plane into a reused scratch plane.
+    A plane is small enough to stay in cache, which makes this faster than
+    one axis-wise reduction over the whole stack. Only the intersection is
+    counted; union = |target| + |mask| - intersection.
+    """
+
+    def __init__(self, target_mask: np.ndarray):
+        self.target_mask = np.ascontiguousarray(target_mask, dtype=bool)
+        self.target_count = int(np.count_nonzero(self.target_mask))
+        self._scratch = np.empty_like(self.target_mask)
+        self._stack = np.empty((0,) + self.target_mask.shape, dtype=bool)
+
+    def stack(self, n: int) -> np.ndarray:
+        """An (n, h, w) bool buffer; contents are left over from earlier batches"""
+        if len(self._stack) < n:
+            self._stack = np.empty((n,) + self.target_mask.shape, dtype=bool)
+        return self._stack[:n]
+
+    def iou(self, masks: Union[np.ndarray, Sequence[np.ndarray]]) -> np.ndarray:
+        """float64 IoU of each target-sized bool mask, with compute_iou's empty-union rule"""
+        n = len(masks)
+        intersection = np.empty(n, dtype=np.int64)
+        counts = np.empty(n, dtype=np.int64)
+        for i in range(n):
+            intersection[i] = np.count_nonzero(np.logical_and(masks[i], self.target_mask, out=self._scratch))
+            counts[i] = np.count_nonzero(masks[i])
+        union = counts + (self.target_count - intersection)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            iou = intersection / union
+        # Both empty counts as a perfect match, as in compute_iou
+        iou[union == 0] = 1.0
+        return iou
+
+
+def compute_iou_batch(target: Union[TargetImage, np.ndarray],
+                      masks: Union[np.ndarray, Sequence[np.ndarray]]) -> np.ndarray:
+    """IoU of every candidate mask against one target in a single pass; equals compute_iou per mask.
+
+    target is a TargetImage (whose buffers are reused across calls) or a bool
+    mask; masks is an (n, h, w) bool stack or a sequence of target-sized bool
+    masks, e.g. rasterize_mask outputs.
+    """
+    if isinstance(target, TargetImage):
+        batch = target.iou_batch
+    else:
+        batch = IoUBatch(target)
+    if len(masks) and np.shape(masks[0]) != batch.target_mask.shape:
+        raise ValueError(f"Masks of shape {np.shape(masks[0])} for a {batch.target_mask.shape} target")
+    return batch.iou(masks)
+
+
+def load_and_preprocess_image(image_path: ImageSource) -> np.ndarray:
+    # Prepared targets are already canvas-sized grayscale
+    if isinstance(image_path, TargetImage):
+        return image_path.gray
+
+    # In-memory renders decode once and keep the grayscale copy
+    if isinstance(image_path, RenderedImage):
+        return image_path.gray
+
+    # Arrays (e.g. from renderer.raster) are already decoded
+    if isinstance(image_path, np.ndarray):
+        if image_path.ndim == 3:
+            return cv2.cvtColor(image_path, cv2.COLOR_RGB2GRAY)
+        return image_path
+
     # Try loading with PIL first
     try:
         img = Image.open(image_path)
@@ -58,4 +247,19 @@ def load_and_preprocess_image(image_path: str) -> np.ndarray:
             return img
         except Exception as e2:
             logging.error(f"Failed to load image {image_path}: {e1}, {e2}")
-            raise
\ No newline at end of file
+            raise
+
+
+def load_rgb_image(image_path: ImageSource) -> np.ndarray:
+    """(h, w, 3) uint8 RGB pixels of a path, array, RenderedImage or TargetImage; alpha is dropped"""
+    if isinstance(image_path, TargetImage):
+        return image_path.rgb
+    if isinstance(image_path, RenderedImage):
+        pixels = image_path.pixels
+    elif isinstance(image_path, np.ndarray):
+        pixels = image_path
+    else:
+        pixels = RenderedImage.open(image_path).pixels
+    if pixels.ndim == 2:
+        return np.repeat(pixels[:, :, None], 3, axis=2)
+    return pixels[:, :, :3]
@@ -0,0 +1,72 @@
+"""
+Memory and render cost of ShapeTable versus a list of Shape dataclasses.
+
+Usage:
+    python benchmarks/bench_shape_table.py --shapes 100000
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+# The root render_svg.py shares the module name, so the editor's copy must come first
+sys.path.insert(0, os.path.join(ROOT, "flowchart_editor"))
+
+from render_svg import SVGRenderer  # flowchart_editor/render_svg.py
+from renderer.shape_table import ShapeTable
+from documents import make_document
+
+
+def measure(build):
+    """Traced bytes still held by build()'s result, and untraced wall time"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    gc.collect()
+    start = time.perf_counter()
+    obj = build()
+    return obj, current, time.perf_counter() - start
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ShapeTable memory benchmark")
+    parser.add_argument("--shapes", type=int, default=100000)
+    args = parser.parse_args()
+
+    # Both sides start from the JSON text, as the Flask endpoint does, so the
+    # float and string objects kept alive by Shape instances are counted
+    payload = json.dumps(make_document(args.shapes))
+    shapes, list_bytes, list_s = measure(lambda: SVGRenderer.parse_shapes(json.loads(payload)))
+    table, table_bytes, table_s = measure(lambda: ShapeTable.from_dicts(json.loads(payload)))
+
+    print(f"{args.shapes} shapes")
+    print(f"  List[Shape]: {list_bytes / 1e6:8.1f} MB  built in {list_s * 1000:8.1f} ms")
+    print(f"  ShapeTable : {table_bytes / 1e6:8.1f} MB  built in {table_s * 1000:8.1f} ms")
+    print(f"  reduction  : {list_bytes / table_bytes:.1f}x")
+
+    renderer = SVGRenderer(use_cache=False)
+    print(f"  identical SVG: {renderer.render_svg(shapes) == renderer.render_svg(table)}")
+    for name, source in (("List[Shape]", shapes), ("ShapeTable", table)):
+        seconds = best_of(lambda: renderer.render_svg(source))
+        print(f"  render_svg from {name}: {seconds * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
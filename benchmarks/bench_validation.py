@@ -0,0 +1,91 @@
+"""
+Compare bulk schema validation in add_shapes with the old per-shape try/except loop.
+
+Usage:
+    python benchmarks/bench_validation.py --shapes 10000 --dirty 0.2
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+# The root render_svg.py shares the module name, so the editor's copy must come first
+sys.path.insert(0, os.path.join(ROOT, "flowchart_editor"))
+
+from render_svg import SVGRenderer, Shape, SHAPE_SCHEMA  # flowchart_editor/render_svg.py
+from documents import make_document
+
+
+def dirty(shapes, fraction: float, seed: int = 0):
+    """Inject the mistakes LLM output tends to contain"""
+    rng = random.Random(seed)
+    for shape in shapes:
+        if rng.random() >= fraction:
+            continue
+        mistake = rng.randrange(4)
+        if mistake == 0:
+            shape["x"] = str(shape.get("x", 0))
+        elif mistake == 1:
+            shape["stroke_width"] = None
+        elif mistake == 2:
+            shape["label"] = "unexpected"
+        else:
+            shape["opacity"] = "half"
+    return shapes
+
+
+def legacy_add_shapes(shapes_data):
+    """The per-shape Shape(**d) loop add_shapes used before"""
+    shapes = []
+    for shape_data in shapes_data:
+        try:
+            shapes.append(Shape(**shape_data))
+        except Exception as e:
+            print(f"Error adding shape: {e}")
+    return shapes
+
+
+def best_of(fn, repeat: int):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = fn()
+            best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shape validation benchmark")
+    parser.add_argument("--shapes", type=int, default=10000)
+    parser.add_argument("--dirty", type=float, default=0.2, help="fraction of shapes with a bad field")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    data = dirty(make_document(args.shapes), args.dirty)
+    validated = SHAPE_SCHEMA.validate(data).shapes
+
+    def add(shapes_data, **kwargs):
+        renderer = SVGRenderer(use_cache=False)
+        renderer.add_shapes(shapes_data, **kwargs)
+        return renderer
+
+    legacy_s, legacy = best_of(lambda: legacy_add_shapes(data), args.repeat)
+    bulk_s, bulk = best_of(lambda: add(data), args.repeat)
+    fast_s, _ = best_of(lambda: add(validated, validated=True), args.repeat)
+
+    print(f"{args.shapes} shapes, {args.dirty:.0%} with a bad field")
+    print(f"  per-shape try/except : {legacy_s * 1000:8.1f} ms   kept {len(legacy)}")
+    print(f"  bulk validation      : {bulk_s * 1000:8.1f} ms   kept {len(bulk.shapes)}"
+          f"   ({len(bulk.validation_errors)} errors recorded)")
+    print(f"  pre-validated input  : {fast_s * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
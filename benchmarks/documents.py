@@ -0,0 +1,107 @@
+"""
+Synthetic shape documents for the benchmarks.
+
+Every generator takes (n, seed) and returns n shape dicts on an 800x600
+canvas, deterministic for a given seed. Colors mix CSS names, colloquial
+names, hex and rgb()/hsl() strings so color normalization sees every path.
+"""
+
+import random
+from typing import Callable, Dict, List, Any
+
+CANVAS = (800, 600)
+
+COLORS = ["black", "navy", "red", "light blue", "pastel green", "#2c3e50", "#abc",
+          "rgb(200, 40, 90)", "hsl(210, 60%, 40%)", "desaturate-20 coral", "matcha"]
+
+# Points per polyline shrink as the document grows so 100k shapes stays in memory
+MAX_POLYLINE_POINTS = 500
+MIN_POLYLINE_POINTS = 10
+POLYLINE_POINT_BUDGET = 1_000_000
+
+
+def make_document(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Synthetic flowchart: boxes, labels and connecting arrows"""
+    rng = random.Random(seed)
+    colors = ["red", "navy", "#2c3e50", "light blue", "none"]
+    shapes = []
+    for i in range(n):
+        kind = i % 4
+        x, y = rng.uniform(0, 800), rng.uniform(0, 600)
+        if kind == 0:
+            shapes.append({"shape_type": "rectangle", "x": x, "y": y, "scale_x": rng.uniform(20, 120),
+                           "scale_y": rng.uniform(20, 60), "fill_color": rng.choice(colors)})
+        elif kind == 1:
+            shapes.append({"shape_type": "text", "x": x, "y": y, "text": f"Step {i}",
+                           "text_color": rng.choice(colors[:-1])})
+        elif kind == 2:
+            shapes.append({"shape_type": "arrow", "points": [[x, y], [x + rng.uniform(-80, 80), y + 60]],
+                           "stroke_color": rng.choice(colors[:-1]), "arrow_end": "yes"})
+        else:
+            shapes.append({"shape_type": "ellipse", "x": x, "y": y, "scale_x": rng.uniform(10, 80),
+                           "scale_y": rng.uniform(10, 80), "rotation": rng.choice([0, 30])})
+    return shapes
+
+
+def arrow_document(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Flowchart where most shapes are arrows between a few boxes, with varied heads and colors"""
+    rng = random.Random(seed)
+    shapes = []
+    for i in range(n):
+        x, y = rng.uniform(0, 800), rng.uniform(0, 600)
+        if i % 5 == 0:
+            shapes.append({"shape_type": "rectangle", "x": x, "y": y, "scale_x": rng.uniform(40, 120),
+                           "scale_y": rng.uniform(20, 60), "fill_color": rng.choice(COLORS)})
+            continue
+        bends = [[x, y]] + [[x + rng.uniform(-120, 120), y + rng.uniform(-90, 90)] for _ in range(rng.randint(1, 3))]
+        shapes.append({"shape_type": "arrow", "points": bends, "stroke_color": rng.choice(COLORS),
+                       "stroke_width": rng.choice([1, 2, 3]), "arrow_end": "yes",
+                       "arrow_start": rng.choice(["yes", "no", "no"]),
+                       "arrowhead_type": rng.choice(["triangle", "circle", "diamond"]),
+                       "arrowhead_size": rng.choice([8, 10, 12])})
+    return shapes
+
+
+def text_document(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Labels of varying length, font and alignment, with a box behind every fourth one"""
+    rng = random.Random(seed)
+    words = ["start", "validate input", "retry", "write to cache", "end", "check <limits> & bounds", "loop"]
+    shapes = []
+    for i in range(n):
+        x, y = rng.uniform(0, 800), rng.uniform(0, 600)
+        if i % 4 == 0:
+            shapes.append({"shape_type": "rectangle", "x": x, "y": y, "scale_x": 140, "scale_y": 40,
+                           "fill_color": rng.choice(COLORS)})
+        else:
+            shapes.append({"shape_type": "text", "x": x, "y": y,
+                           "text": " ".join(rng.choice(words) for _ in range(rng.randint(1, 4))),
+                           "font_size": rng.choice([10, 12, 16, 24]),
+                           "font_family": rng.choice(["Arial", "Monospace", "Times New Roman"]),
+                           "text_anchor": rng.choice(["start", "middle", "end"]),
+                           "text_color": rng.choice(COLORS)})
+    return shapes
+
+
+def polyline_document(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Long random-walk polylines"""
+    rng = random.Random(seed)
+    points_per_line = max(MIN_POLYLINE_POINTS, min(MAX_POLYLINE_POINTS, POLYLINE_POINT_BUDGET // max(n, 1)))
+    shapes = []
+    for _ in range(n):
+        x, y = rng.uniform(0, 800), rng.uniform(0, 600)
+        points = []
+        for _ in range(points_per_line):
+            x = min(800.0, max(0.0, x + rng.uniform(-6, 6)))
+            y = min(600.0, max(0.0, y + rng.uniform(-6, 6)))
+            points.append([round(x, 2), round(y, 2)])
+        shapes.append({"shape_type": "polyline", "points": points, "stroke_color": rng.choice(COLORS),
+                       "stroke_width": rng.choice([1, 2])})
+    return shapes
+
+
+DOCUMENTS: Dict[str, Callable[[int, int], List[Dict[str, Any]]]] = {
+    "mixed": make_document,
+    "arrows": arrow_document,
+    "text": text_document,
+    "polylines": polyline_document,
+}
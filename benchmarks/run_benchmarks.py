@@ -0,0 +1,366 @@
+"""
+Renderer benchmark suite.
+
+Generates synthetic documents (see documents.py) at each size and times,
+separately for the agent renderer (render_svg.py) and the flowchart
+editor's renderer (flowchart_editor/render_svg.py):
+
+    render_svg  - shapes already parsed, render cache off
+    render_svg_compact
+                - the same with compact=True; both record svg_bytes, and the
+                  compact case its size as a fraction of the default output
+    save_png    - through the rasterizer pool; skipped without cairosvg
+    compute_iou - target vs. candidate PNG, decoded from bytes every run
+                  (PNGs from cairo, or from renderer.raster without it)
+    compute_iou_target
+                - the same against a TargetImage prepared once, as the
+                  agent scores; only the candidate is decoded per run
+
+plus steps both renderers share: color normalization
+(color_utils.normalize_color over every color in the document), a
+theme-wide recolor of the same colors (color_utils.recolor) and text
+layout (renderer.text_metrics.text_box over every text shape). Each case runs until --repeat
+runs or --budget seconds, whichever comes first (at least --min-runs), and
+then once more under tracemalloc for peak memory. Peak memory covers this
+process only, so save_png excludes the rasterizer workers.
+
+Results are printed as JSON (or written to --output) and compared with a
+stored baseline: a case regresses when its --metric time (min_ms by
+default, the least sensitive to a busy machine) grows by more than
+--threshold and --min-delta-ms, or its peak memory by more than
+--memory-threshold and 1 MB. Baseline times are first scaled by the ratio
+of the two runs' calibration loops, so a baseline recorded on a faster or
+slower machine still compares. Any regression makes the exit status 1.
+
+Before timing, check_theme_cache_orders renders a themed document through
+render_batch and render_svg/render_themed in both orders on a cleared
+render cache; output that depends on the order also makes the exit status 1.
+
+Usage:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 10 1000 --docs arrows text --output results.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EDITOR = os.path.join(ROOT, "flowchart_editor")
+sys.path.append(ROOT)
+sys.path.append(EDITOR)  # for color_utils; the renderers are loaded by path below
+
+from color_utils import normalize_color, recolor
+from documents import CANVAS, DOCUMENTS
+from agent.utils import TargetImage, compute_iou
+from renderer.daemon import CAIROSVG_AVAILABLE
+from renderer.cache import get_render_cache
+from renderer.image import RenderedImage
+from renderer.raster import rasterize_shapes
+from renderer.text_metrics import DEFAULT_FONT_FAMILY, text_box
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+COLOR_FIELDS = ("stroke_color", "fill_color", "text_color")
+
+
+def _load_renderer(name: str, path: str):
+    """Import a render_svg.py under its own module name; the two files share a name"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+RENDERERS = {
+    "agent": _load_renderer("agent_render_svg", os.path.join(ROOT, "render_svg.py")),
+    "flowchart": _load_renderer("flowchart_render_svg", os.path.join(EDITOR, "render_svg.py")),
+}
+
+
+def check_theme_cache_orders() -> bool:
+    """True when batch and themed renders of one document agree whichever fills the cache first"""
+    module = RENDERERS["agent"]
+    width, height = CANVAS
+    shapes = module.SVGRenderer.parse_shapes([
+        {"shape_type": "circle", "x": 100, "y": 100, "scale_x": 50, "fill_color": "primary", "stroke_color": "accent1"},
+        {"shape_type": "text", "x": 300, "y": 200, "text": "themed", "text_color": "secondary"},
+    ])
+    # Complete records, so batch keys are computed from the same fields as the renderer's own
+    doc = [dict(vars(shape)) for shape in shapes]
+    outputs = []
+    for batch_first in (True, False):
+        get_render_cache().clear()
+        renderer = module.SVGRenderer(width, height)
+        with contextlib.redirect_stdout(io.StringIO()):
+            if batch_first:
+                batch = module.SVGRenderer.render_batch([doc], CANVAS, "svg")[0]
+            renderer.set_theme("dark")
+            themed = renderer.render_themed(shapes)
+            output = (renderer.render_svg(shapes), themed.tokens)
+            if not batch_first:
+                batch = module.SVGRenderer.render_batch([doc], CANVAS, "svg")[0]
+        outputs.append(output + (batch,))
+    get_render_cache().clear()
+    return outputs[0] == outputs[1] and "\0" not in outputs[0][2] and bool(outputs[0][1])
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def measure(fn: Callable[[], Any], repeat: int, min_runs: int, budget: float) -> Dict[str, Any]:
+    """Time fn after one warm-up call, then measure its peak traced memory"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        times: List[float] = []
+        started = time.perf_counter()
+        while len(times) < repeat and (len(times) < min_runs or time.perf_counter() - started < budget):
+            start = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        try:
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return {
+        "runs": len(times),
+        "p50_ms": round(percentile(times, 0.50) * 1000, 4),
+        "p95_ms": round(percentile(times, 0.95) * 1000, 4),
+        "min_ms": round(min(times) * 1000, 4),
+        "peak_mb": round(peak / 1e6, 4),
+    }
+
+
+def calibrate(rounds: int = 5) -> float:
+    """Best time (ms) of a fixed pure-Python and NumPy workload, to scale baselines across machines"""
+    rng = np.random.default_rng(0)
+    data = rng.random((600, 800))
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        total = 0
+        for i in range(200000):
+            total += i * i % 7
+        np.count_nonzero(data > 0.5)
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 4)
+
+
+def _record(renderer: str, op: str, doc: str, n: int, items: int, stats: Dict[str, Any], **extra) -> Dict[str, Any]:
+    seconds = stats["p50_ms"] / 1000
+    return {
+        "id": f"{renderer}/{op}/{doc}/{n}",
+        "renderer": renderer, "op": op, "doc": doc, "shapes": n, "items": items,
+        **stats,
+        "throughput_per_s": round(items / seconds, 1) if seconds > 0 else None,
+        **extra,
+    }
+
+
+def _shape_dict(shape: Any) -> Dict[str, Any]:
+    return dict(vars(shape))
+
+
+def _png_of(renderer: Any, shapes: List[Any], width: int, height: int) -> Optional[bytes]:
+    if CAIROSVG_AVAILABLE:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return renderer.render_png(shapes, width, height)
+    return RenderedImage.from_array(
+        rasterize_shapes([_shape_dict(s) for s in shapes], width, height, renderer.background)).png
+
+
+def run_suite(args) -> List[Dict[str, Any]]:
+    width, height = CANVAS
+    timing = dict(repeat=args.repeat, min_runs=args.min_runs, budget=args.budget)
+    results = []
+    png_dir = tempfile.mkdtemp(prefix="bench_png_")
+    for doc in args.docs:
+        for n in args.sizes:
+            data = DOCUMENTS[doc](n, args.seed)
+            # Candidate for IoU: the same document with every shape nudged a few pixels
+            nudged = DOCUMENTS[doc](n, args.seed + 1)
+
+            colors = [shape[f] for shape in data for f in COLOR_FIELDS if isinstance(shape.get(f), str)]
+            stats = measure(lambda: [normalize_color(c) for c in colors], **timing)
+            results.append(_record("shared", "normalize_color", doc, n, len(colors), stats))
+            _progress(results[-1])
+
+            stats = measure(lambda: recolor(colors, d_l=10, desaturate=20), **timing)
+            results.append(_record("shared", "recolor", doc, n, len(colors), stats))
+            _progress(results[-1])
+
+            texts = [shape for shape in data if shape["shape_type"] == "text"]
+            if texts:
+                stats = measure(lambda: [text_box(t["text"], t.get("font_size", 16),
+                                                  t.get("font_family", DEFAULT_FONT_FAMILY),
+                                                  t.get("text_anchor", "middle")) for t in texts], **timing)
+                results.append(_record("shared", "text_box", doc, n, len(texts), stats))
+                _progress(results[-1])
+
+            for name, module in RENDERERS.items():
+                renderer = module.SVGRenderer(width, height, use_cache=False)
+                with contextlib.redirect_stdout(io.StringIO()):
+                    renderer.add_shapes(data)
+                    candidate = module.SVGRenderer.parse_shapes(nudged)
+                accepted = len(renderer.shapes)
+
+                stats = measure(renderer.render_svg, **timing)
+                svg_bytes = len(renderer.render_svg().encode("utf-8"))
+                results.append(_record(name, "render_svg", doc, n, accepted, stats, accepted=accepted,
+                                       svg_bytes=svg_bytes))
+                _progress(results[-1])
+
+                compact = module.SVGRenderer(width, height, use_cache=False, compact=True)
+                compact.shapes = renderer.shapes
+                stats = measure(compact.render_svg, **timing)
+                compact_bytes = len(compact.render_svg().encode("utf-8"))
+                results.append(_record(name, "render_svg_compact", doc, n, accepted, stats, accepted=accepted,
+                                       svg_bytes=compact_bytes,
+                                       size_ratio=round(compact_bytes / svg_bytes, 3) if svg_bytes else None))
+                _progress(results[-1])
+
+                if CAIROSVG_AVAILABLE and n <= args.png_max_shapes:
+                    path = os.path.join(png_dir, f"{name}.png")
+                    stats = measure(lambda: renderer.save_png(path), **timing)
+                    results.append(_record(name, "save_png", doc, n, accepted, stats, accepted=accepted))
+                    _progress(results[-1])
+
+                target_png = _png_of(renderer, renderer.shapes, width, height)
+                candidate_png = _png_of(renderer, candidate, width, height)
+                if target_png is None or candidate_png is None:
+                    continue
+                stats = measure(lambda: compute_iou(RenderedImage.from_png(target_png),
+                                                    RenderedImage.from_png(candidate_png)), **timing)
+                results.append(_record(name, "compute_iou", doc, n, width * height, stats, accepted=accepted,
+                                       image_source="cairo" if CAIROSVG_AVAILABLE else "raster"))
+                _progress(results[-1])
+
+                target = TargetImage(RenderedImage.from_png(target_png), width, height)
+                stats = measure(lambda: compute_iou(target, RenderedImage.from_png(candidate_png)), **timing)
+                results.append(_record(name, "compute_iou_target", doc, n, width * height, stats, accepted=accepted,
+                                       image_source="cairo" if CAIROSVG_AVAILABLE else "raster"))
+                _progress(results[-1])
+    return results
+
+
+def compare(results: List[Dict[str, Any]], meta: Dict[str, Any], baseline: Dict[str, Any], metric: str,
+            threshold: float, memory_threshold: float, min_delta_ms: float) -> Dict[str, Any]:
+    """Match cases by id against the baseline's results and flag regressions"""
+    base = {r["id"]: r for r in baseline.get("results", [])}
+    base_calibration = baseline.get("meta", {}).get("calibration_ms")
+    scale = meta["calibration_ms"] / base_calibration if base_calibration else 1.0
+    cases, regressions = [], []
+    for r in results:
+        b = base.get(r["id"])
+        if b is None:
+            continue
+        expected = b[metric] * scale
+        time_ratio = r[metric] / expected if expected > 0 else None
+        memory_ratio = r["peak_mb"] / b["peak_mb"] if b["peak_mb"] > 0 else None
+        slower = (time_ratio is not None and time_ratio > 1 + threshold
+                  and r[metric] - expected > min_delta_ms)
+        bigger = (memory_ratio is not None and memory_ratio > 1 + memory_threshold
+                  and r["peak_mb"] - b["peak_mb"] > 1.0)
+        case = {"id": r["id"], "time_ratio": round(time_ratio, 3) if time_ratio else None,
+                "peak_ratio": round(memory_ratio, 3) if memory_ratio else None,
+                "time_regression": slower, "memory_regression": bigger}
+        cases.append(case)
+        if slower or bigger:
+            regressions.append(case)
+    return {"metric": metric, "calibration_scale": round(scale, 3),
+            "threshold": threshold, "memory_threshold": memory_threshold, "min_delta_ms": min_delta_ms,
+            "compared": len(cases), "regressions": regressions, "cases": cases}
+
+
+def _progress(record: Dict[str, Any]) -> None:
+    print(f"{record['id']:<42} p50 {record['p50_ms']:10.3f} ms   p95 {record['p95_ms']:10.3f} ms"
+          f"   peak {record['peak_mb']:9.3f} MB"
+          + (f"   {record['size_ratio']:.0%} of default size" if record.get("size_ratio") else ""), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Renderer benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--docs", nargs="+", choices=sorted(DOCUMENTS), default=list(DOCUMENTS))
+    parser.add_argument("--repeat", type=int, default=20, help="maximum timed runs per case")
+    parser.add_argument("--min-runs", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds of timed runs per case")
+    parser.add_argument("--png-max-shapes", type=int, default=10000, help="largest document sent to save_png")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--no-compare", action="store_true")
+    parser.add_argument("--save-baseline", metavar="PATH", help="store this run as the baseline")
+    parser.add_argument("--metric", choices=["min_ms", "p50_ms", "p95_ms"], default="min_ms",
+                        help="time compared against the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative time growth")
+    parser.add_argument("--memory-threshold", type=float, default=0.25, help="allowed relative peak-memory growth")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore time growth smaller than this")
+    args = parser.parse_args()
+
+    themes_consistent = check_theme_cache_orders()
+    if not themes_consistent:
+        print("CHECK FAILED: themed and batch renders depend on render cache order", file=sys.stderr)
+
+    report: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "cairosvg": CAIROSVG_AVAILABLE,
+            "sizes": args.sizes,
+            "docs": args.docs,
+            "seed": args.seed,
+            "calibration_ms": calibrate(),
+            "theme_cache_consistent": themes_consistent,
+        },
+        "results": run_suite(args),
+    }
+
+    regressed = False
+    if not args.no_compare and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report["results"], report["meta"], json.load(f), args.metric,
+                                           args.threshold, args.memory_threshold, args.min_delta_ms)
+        comparison = report["comparison"]
+        regressed = bool(comparison["regressions"])
+        print(f"Compared {comparison['compared']} cases with {args.baseline} "
+              f"({args.metric}, baseline scaled x{comparison['calibration_scale']}): "
+              f"{len(comparison['regressions'])} regressions", file=sys.stderr)
+        for case in comparison["regressions"]:
+            print(f"  REGRESSION {case['id']}: time x{case['time_ratio']}, peak x{case['peak_ratio']}", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"meta": report["meta"], "results": report["results"]}, f, indent=2)
+            f.write("\n")
+    sys.exit(1 if regressed or not themes_consistent else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,19 @@
 # color_utils.py
 
 from __future__ import annotations
+import difflib
+import os
 import re
-from typing import Tuple
-
-#  CSS named colors 
-CSS_COLOR_MAP = {
-    "black": "#000000", "white": "#ffffff", "red": "#ff0000", "green": "#008000",
-    "blue": "#0000ff", "yellow": "#ffff00", "purple": "#800080", "orange": "#ffa500",
-    "coral": "#ff7f50", "navy": "#000080", "teal": "#008080", "olive": "#808000",
-    "gray": "#808080", "grey": "#808080", "pink": "#ffc0cb", "brown": "#a52a2a",
-    "gold": "#ffd700", "silver": "#c0c0c0", "indigo": "#4b0082", "violet": "#ee82ee",
-    "salmon": "#fa8072", "tomato": "#ff6347", "crimson": "#dc143c", "khaki": "#f0e68c",
-    "plum": "#dda0dd", "orchid": "#da70d6", "turquoise": "#40e0d0", "cyan": "#00ffff",
-    "magenta": "#ff00ff", "aquamarine": "#7fffd4", "beige": "#f5f5dc",
-    "chocolate": "#d2691e", "darkblue": "#00008b", "darkgreen": "#006400",
-    "darkred": "#8b0000", "lightblue": "#add8e6", "lightgreen": "#90ee90",
-    "lightpink": "#ffb6c1",
-    # ... can add more
-}
+import sys
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from renderer.color import CSS_COLOR_MAP, LabIndex, delta_e, rgb_to_lab
+from renderer.theme import THEME_SLOTS
 
 
 COLLOQUIAL_BASE = {
@@ -121,91 +116,322 @@ MODIFIERS = {
     "baby":   {"d_s": -25, "d_l": +20}, 
     "pastel": {"d_s": -30, "d_l": +18},   
     "light":  {"d_s":   0, "d_l": +15},
+    "pale":   {"d_s": -20, "d_l": +25},
     "dark":   {"d_s":   0, "d_l": -15},
     "bright": {"d_s": +20, "d_l":  0},
     "deep":   {"d_s": +10, "d_l": -10},
     "neon":   {"d_s": +35, "d_l":  0},
 }
 
-def _apply_modifiers(hexv: str, tokens) -> str:
-    out = hexv
+# Every base name, looked up with one dict probe. The two tables share only
+# "lavender", with the same value.
+NAMED_COLORS: Dict[str, str] = {**COLLOQUIAL_BASE, **CSS_COLOR_MAP}
+# Longest base name in words; longer suffixes of a color phrase cannot match
+MAX_NAME_WORDS = max(len(name.split()) for name in NAMED_COLORS)
+
+# Distinct raw strings whose resolution is cached
+COLOR_CACHE_SIZE = 4096
+# What normalize_color returns for a string it cannot resolve
+FALLBACK_COLOR = "#000000"
+# difflib ratio a misspelled name needs to be read as a known one
+SPELLING_CUTOFF = 0.8
+
+# hex is the resolved color ("none" for none); reason is None, or why the
+# string did not resolve exactly (hex is then the closest-spelled name's
+# color, or FALLBACK_COLOR if none is close)
+ColorResolution = namedtuple("ColorResolution", ["hex", "reason"])
+
+
+@lru_cache(maxsize=256)
+def _compile_modifiers(tokens: Tuple[str, ...]) -> Tuple[Tuple[str, int, int], ...]:
+    """Modifier words -> ("adjust", d_s, d_l) / ("desaturate", pct, 0) steps; other words are ignored"""
+    steps = []
     i = 0
     while i < len(tokens):
         t = tokens[i]
 
         m = MODIFIERS.get(t)
         if m:
-            out = adjust_hsl(out, d_s=m.get("d_s", 0), d_l=m.get("d_l", 0))
+            steps.append(("adjust", m.get("d_s", 0), m.get("d_l", 0)))
             i += 1
             continue
 
         m_desat = DESAT_ONE_TOKEN_RE.match(t)
         if m_desat:
-            pct = int(m_desat.group(1))
-            out = desaturate_hex(out, pct)
+            steps.append(("desaturate", int(m_desat.group(1)), 0))
             i += 1
             continue
 
         if t == "desaturate" and i + 1 < len(tokens):
             m_pct = PCT_RE.match(tokens[i+1])
             if m_pct:
-                pct = int(m_pct.group(1))
-                out = desaturate_hex(out, pct)
+                steps.append(("desaturate", int(m_pct.group(1)), 0))
                 i += 2
                 continue
         i += 1
 
+    return tuple(steps)
+
+
+def _apply_modifiers(hexv: str, tokens) -> str:
+    out = hexv
+    for op, a, b in _compile_modifiers(tuple(tokens)):
+        if op == "adjust":
+            out = adjust_hsl(out, d_s=a, d_l=b)
+        else:
+            out = desaturate_hex(out, a)
     return out
 
 
 def _parse_tokens(name: str) -> str | None:
+    """Colloquial name, or modifiers followed by the shortest known base name ("light pastel blue")"""
     if name in COLLOQUIAL_BASE:
         return COLLOQUIAL_BASE[name]
-    
+
     parts = name.split()
-    for k in range(len(parts)-1, -1, -1):
-        base = " ".join(parts[k:])
-        if base in COLLOQUIAL_BASE:
-            base_hex = COLLOQUIAL_BASE[base]
-            return _apply_modifiers(base_hex, parts[:k])
-        if base in CSS_COLOR_MAP:
-            base_hex = CSS_COLOR_MAP[base]
+    for k in range(len(parts) - 1, max(len(parts) - MAX_NAME_WORDS, 0) - 1, -1):
+        base = parts[k] if k == len(parts) - 1 else " ".join(parts[k:])
+        base_hex = NAMED_COLORS.get(base)
+        if base_hex is not None:
             return _apply_modifiers(base_hex, parts[:k])
 
     return None
 
-def normalize_color(value: str) -> str:
-    """Return a #rrggbb hex (or 'none') for a wide range of inputs."""
+
+@lru_cache(maxsize=COLOR_CACHE_SIZE)
+def resolve_color(value: str) -> ColorResolution:
+    """Resolve a color string once; see normalize_color for the accepted forms"""
     v = value.strip().lower()
     if v == "none":
-        return "none"
-
-    if HEX_RE.match(v):
-        if len(v) == 4:
-            r,g,b = v[1], v[2], v[3]
-            v = f"#{r}{r}{g}{g}{b}{b}"
-        return v
-
-    m = RGB_RE.match(v)
-    if m:
-        r,g,b = [clamp(int(x), 0, 255) for x in m.groups()]
-        return rgb_to_hex(int(r), int(g), int(b))
-
-    m = HSL_RE.match(v)
-    if m:
-        h = clamp(int(m.group(1)), 0, 360)
-        s = clamp(int(m.group(2)), 0, 100)
-        l = clamp(int(m.group(3)), 0, 100)
-        r,g,b = hsl_to_rgb(h, s, l)
-        return rgb_to_hex(r,g,b)
+        return ColorResolution("none", None)
+    if not v:
+        return ColorResolution(FALLBACK_COLOR, "empty color")
+
+    # The first characters pick the one pattern that can match; a string that
+    # fails it is still tried as a name, as "#abc green" always has been
+    if v[0] == "#":
+        if HEX_RE.match(v):
+            if len(v) == 4:
+                r,g,b = v[1], v[2], v[3]
+                v = f"#{r}{r}{g}{g}{b}{b}"
+            return ColorResolution(v, None)
+    elif v.startswith("rgb("):
+        m = RGB_RE.match(v)
+        if m:
+            r,g,b = [clamp(int(x), 0, 255) for x in m.groups()]
+            return ColorResolution(rgb_to_hex(int(r), int(g), int(b)), None)
+    elif v.startswith("hsl("):
+        m = HSL_RE.match(v)
+        if m:
+            h = clamp(int(m.group(1)), 0, 360)
+            s = clamp(int(m.group(2)), 0, 100)
+            l = clamp(int(m.group(3)), 0, 100)
+            r,g,b = hsl_to_rgb(h, s, l)
+            return ColorResolution(rgb_to_hex(r,g,b), None)
 
     if v in CSS_COLOR_MAP:
-        return CSS_COLOR_MAP[v]
+        return ColorResolution(CSS_COLOR_MAP[v], None)
 
     parsed = _parse_tokens(v)
     if parsed:
-        return parsed
+        return ColorResolution(parsed, None)
+
+    joined = v.replace(" ", "")
+    if joined in CSS_COLOR_MAP:
+        return ColorResolution(CSS_COLOR_MAP[joined], None)
+
+    if v[0] == "#":
+        reason = f"malformed hex color {value!r}"
+    elif v.startswith(("rgb(", "hsl(")):
+        reason = f"malformed {v[:3]}() color {value!r}"
+    else:
+        guess = closest_color_name(v)
+        if guess is not None:
+            return ColorResolution(NAMED_COLORS[guess], f"unknown color name {value!r}, read as {guess!r}")
+        reason = f"unknown color name {value!r}"
+    return ColorResolution(FALLBACK_COLOR, reason)
+
+
+# Known names with spaces removed -> name, for spelling matches
+_SPELLINGS = {name.replace(" ", ""): name for name in NAMED_COLORS}
+
+
+def closest_color_name(name: str) -> str | None:
+    """Known name spelled most like name ("cornflowerblu" -> "cornflowerblue"), if any is close"""
+    matches = difflib.get_close_matches(name.strip().lower().replace(" ", ""), list(_SPELLINGS),
+                                        n=1, cutoff=SPELLING_CUTOFF)
+    return _SPELLINGS[matches[0]] if matches else None
+
+
+def normalize_color(value: str) -> str:
+    """Return a #rrggbb hex (or 'none') for a wide range of inputs.
+
+    Accepts #rgb/#rrggbb, rgb(), hsl(), CSS and colloquial names, and names
+    with modifiers ("pastel blue", "dark desaturate 20% teal"). Anything else
+    gives FALLBACK_COLOR; resolve_color says why.
+    """
+    return resolve_color(value).hex
+
+
+def normalize_colors(values: Iterable[str]) -> List[str]:
+    """normalize_color over many values, resolving each distinct string once"""
+    values = list(values)
+    resolved = {v: resolve_color(v).hex for v in set(values)}
+    return [resolved[v] for v in values]
+
+
+def color_misses(values: Iterable[str]) -> Dict[str, str]:
+    """value -> reason for every value normalize_color does not resolve exactly"""
+    misses = {}
+    for v in set(values):
+        reason = resolve_color(v).reason
+        if reason is not None:
+            misses[v] = reason
+    return misses
+
+
+# ---------------------------------------------------------------------------
+# Array versions: whole palettes at once, (n, 3) arrays in the same units as
+# the scalar functions (rgb 0-255; h in degrees, s and l in percent)
+# ---------------------------------------------------------------------------
+
+# Shape fields that hold colors
+COLOR_FIELDS = ("fill_color", "stroke_color", "text_color")
+
+
+def hex_to_rgb_array(hexes: Iterable[str]) -> np.ndarray:
+    """#rgb/#rrggbb strings -> (n, 3) uint8 array"""
+    digits = []
+    for hexv in hexes:
+        hexv = hexv.lstrip("#")
+        if len(hexv) == 3:
+            hexv = "".join(ch*2 for ch in hexv)
+        digits.append(hexv)
+    return np.frombuffer(bytes.fromhex("".join(digits)), dtype=np.uint8).reshape(-1, 3)
+
+
+def rgb_to_hex_array(rgb: np.ndarray) -> List[str]:
+    digits = np.asarray(rgb, dtype=np.uint8).tobytes().hex()
+    return ["#" + digits[i:i+6] for i in range(0, len(digits), 6)]
+
+
+def rgb_to_hsl_array(rgb: np.ndarray) -> np.ndarray:
+    """(n, 3) rgb -> (n, 3) hsl; same values as rgb_to_hsl row by row"""
+    c = np.asarray(rgb, dtype=np.float64).reshape(-1, 3) / 255.0
+    r_, g_, b_ = c[:, 0], c[:, 1], c[:, 2]
+    mx, mn = c.max(axis=1), c.min(axis=1)
+    l = (mx + mn) / 2.0
+    d = mx - mn
+    grey = d == 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(l > 0.5, d / (2 - mx - mn), d / (mx + mn))
+        h = np.select([mx == r_, mx == g_],
+                      [(g_ - b_) / d + np.where(g_ < b_, 6, 0), (b_ - r_) / d + 2],
+                      (r_ - g_) / d + 4)
+    s[grey] = 0.0
+    h[grey] = 0.0
+    h /= 6
+    return np.stack([h*360.0, s*100.0, l*100.0], axis=1)
+
+
+def _hue_to_rgb_array(p: np.ndarray, q: np.ndarray, t: np.ndarray) -> np.ndarray:
+    t = np.where(t < 0, t + 1, t)
+    t = np.where(t > 1, t - 1, t)
+    return np.select([t < 1/6, t < 1/2, t < 2/3],
+                     [p + (q - p) * 6 * t, q, p + (q - p) * (2/3 - t) * 6], p)
+
+
+def hsl_to_rgb_array(hsl: np.ndarray) -> np.ndarray:
+    """(n, 3) hsl -> (n, 3) uint8 rgb; same values as hsl_to_rgb row by row"""
+    hsl = np.asarray(hsl, dtype=np.float64).reshape(-1, 3)
+    h_, s_, l_ = hsl[:, 0]/360.0, hsl[:, 1]/100.0, hsl[:, 2]/100.0
+    # s == 0 needs no special case: then q == p == l and every branch gives l
+    q = np.where(l_ < 0.5, l_ * (1 + s_), l_ + s_ - l_ * s_)
+    p = 2*l_ - q
+    rgb = np.stack([_hue_to_rgb_array(p, q, h_ + 1/3), _hue_to_rgb_array(p, q, h_),
+                    _hue_to_rgb_array(p, q, h_ - 1/3)], axis=1)
+    return np.round(rgb * 255).astype(np.uint8)
+
+
+def adjust_hsl_array(hsl: np.ndarray, d_h=0, d_s=0, d_l=0, desaturate=0) -> np.ndarray:
+    """Shifted copy of an (n, 3) hsl array.
+
+    desaturate scales saturation down by that percentage first (as
+    desaturate_hex), then the deltas are added as in adjust_hsl. Deltas may
+    be scalars or per-row arrays.
+    """
+    h, s, l = hsl[:, 0], hsl[:, 1], hsl[:, 2]
+    if np.any(desaturate):
+        s = s * (1 - np.clip(desaturate, 0, 100) / 100.0)
+    return np.stack([(h + d_h) % 360, np.clip(s + d_s, 0, 100), np.clip(l + d_l, 0, 100)], axis=1)
+
+
+def adjust_hsl_colors(hexes: Sequence[str], d_h=0, d_s=0, d_l=0) -> List[str]:
+    """adjust_hsl over a whole palette of hex colors"""
+    hsl = rgb_to_hsl_array(hex_to_rgb_array(hexes))
+    return rgb_to_hex_array(hsl_to_rgb_array(adjust_hsl_array(hsl, d_h, d_s, d_l)))
+
+
+def desaturate_colors(hexes: Sequence[str], pct: int) -> List[str]:
+    """desaturate_hex over a whole palette of hex colors"""
+    hsl = rgb_to_hsl_array(hex_to_rgb_array(hexes))
+    return rgb_to_hex_array(hsl_to_rgb_array(adjust_hsl_array(hsl, desaturate=int(clamp(pct, 0, 100)))))
+
+
+def recolor(colors: Iterable[str], d_h=0, d_s=0, d_l=0, desaturate=0) -> List[str]:
+    """Normalize any color strings and shift them all in one HSL round trip.
+
+    "none" stays "none", and theme tokens ("primary", ...) stay tokens so the
+    theme that renders them still picks their color.
+    """
+    colors = list(colors)
+    normalized = normalize_colors([c for c in colors if c not in THEME_SLOTS])
+    mapping = {token: token for token in THEME_SLOTS}
+    mapping["none"] = "none"
+    palette = sorted(set(normalized) - {"none"})
+    if palette:
+        hsl = rgb_to_hsl_array(hex_to_rgb_array(palette))
+        shifted = hsl_to_rgb_array(adjust_hsl_array(hsl, d_h, d_s, d_l, desaturate))
+        mapping.update(zip(palette, rgb_to_hex_array(shifted)))
+    plain = iter(normalized)
+    return [mapping[c if c in THEME_SLOTS else next(plain)] for c in colors]
+
+
+def recolor_shapes(shapes_data: List[Dict[str, Any]], d_h=0, d_s=0, d_l=0, desaturate=0,
+                   fields: Sequence[str] = COLOR_FIELDS) -> List[Dict[str, Any]]:
+    """Copies of shape dicts with every color field recolored in one pass (for theme-wide restyling)"""
+    slots = [(i, f) for i, shape in enumerate(shapes_data) for f in fields if isinstance(shape.get(f), str)]
+    recolored = recolor([shapes_data[i][f] for i, f in slots], d_h, d_s, d_l, desaturate)
+    result = [dict(shape) for shape in shapes_data]
+    for (i, f), color in zip(slots, recolored):
+        result[i][f] = color
+    return result
+
+
+# ---------------------------------------------------------------------------
+# Perceptual distances: the named colors in CIELAB (see renderer.color)
+# ---------------------------------------------------------------------------
+
+@lru_cache(maxsize=1)
+def named_color_index() -> LabIndex:
+    """LabIndex over every CSS and colloquial name, built on first use"""
+    names = list(NAMED_COLORS)
+    return LabIndex(names, hex_to_rgb_array([NAMED_COLORS[n] for n in names]))
+
+
+def colors_to_lab(colors: Iterable[str]) -> np.ndarray:
+    """(n, 3) Lab of any color strings; "none" is treated as white (the canvas)"""
+    normalized = ["#ffffff" if c == "none" else c for c in normalize_colors(colors)]
+    return rgb_to_lab(hex_to_rgb_array(normalized))
+
+
+def nearest_color_names(colors: Iterable[str]) -> List[Tuple[str, float]]:
+    """(closest named color, ΔE) for each color, e.g. "#6495ec" -> ("cornflowerblue", 0.3)"""
+    index = named_color_index()
+    found, distances = index.nearest(colors_to_lab(colors))
+    return [(index.names[i], float(d)) for i, d in zip(found[:, 0], distances[:, 0])]
+
 
-    if v.replace(" ", "") in CSS_COLOR_MAP:
-        return CSS_COLOR_MAP[v.replace(" ", "")]
-    return "#000000"
+def color_delta_e(colors_a: Iterable[str], colors_b: Iterable[str]) -> np.ndarray:
+    """CIE76 ΔE between two equally long lists of color strings, pair by pair"""
+    return delta_e(colors_to_lab(colors_a), colors_to_lab(colors_b))
@@ -3,10 +3,19 @@ API Routes for the SVG Editor application
 Separated from main server file for better organization
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 import base64
+import json
+import threading
+import uuid
+from collections import OrderedDict
+from color_utils import recolor_shapes
 from render_svg import SVGAgent
+from renderer.daemon import CAIROSVG_AVAILABLE, RasterizeError, RasterizeTimeout, get_rasterizer
+from renderer.geometry import Simplifier
+from renderer.svg import COMPACT_PRECISION
+from renderer.theme import DEFAULT_THEME
 from agent.agent_svg import Agent
 from agent.api_call_gpt import call_llm
 
@@ -16,6 +25,11 @@ CORS(app)
 # Global conversation history for agent
 conversation_history = []
 
+# Themed renders kept for /restyle: id -> (ThemedSVG, renderer whose dialect wrote it)
+MAX_THEME_TEMPLATES = 32
+theme_templates = OrderedDict()
+theme_templates_lock = threading.Lock()
+
 
 # ============================================================================
 # Static File Routes
@@ -39,7 +53,20 @@ def serve_index():
 
 @app.route('/json-to-svg', methods=['POST', 'OPTIONS'])
 def json_to_svg():
-    """Convert JSON dictionary to SVG"""
+    """Convert JSON dictionary to SVG (or to a base64 PNG with "format": "png").
+
+    "simplify": true (or {"tolerance", "decimals", "remove_collinear"})
+    thins polyline/arrow points first; the response then carries a
+    "simplify" object with the points removed and bytes saved.
+
+    "compact": true writes the smaller SVG (numbers rounded to "precision"
+    decimals, default 2; defaults omitted; styles shared as CSS classes).
+
+    "theme" picks the palette for theme tokens ("primary", "accent1", ...).
+    With it, the SVG response also carries a "theme_template" id that
+    /restyle accepts to switch themes without sending or rendering the
+    shapes again.
+    """
     if request.method == 'OPTIONS':
         # Handle CORS preflight
         return '', 204
@@ -51,16 +78,54 @@ def json_to_svg():
         height = data.get('height', 600)
         background = data.get('background', 'white')
         
+        simplifier = Simplifier.from_options(data.get('simplify'))
+        
+        precision = int(data.get('precision', COMPACT_PRECISION))
+        if precision < 0:
+            raise ValueError(f"precision must be >= 0, got {precision}")
+        
         # Use your existing Python SVG renderer
-        agent = SVGAgent(width, height)
+        agent = SVGAgent(width, height, compact=bool(data.get('compact')), precision=precision,
+                         theme=data.get('theme', DEFAULT_THEME))
         agent.renderer.background = background
-        agent.create_from_dict(shapes)
-        svg = agent.render()
-        
-        return jsonify({
-            'success': True,
-            'svg': svg
-        })
+        agent.create_from_dict(shapes, simplify=simplifier)
+        stats = agent.renderer.simplify_stats
+        extra = {'simplify': stats.to_dict()} if stats is not None else {}
+
+        if data.get('format') == 'png':
+            return _json_to_png(agent, width, height, extra)
+
+        chunks = agent.render_iter()
+        if 'theme' in data:
+            themed = agent.renderer.render_themed()
+            chunks = [themed.fill(agent.renderer.theme_table)]
+            agent.renderer.clear()
+            extra['theme_template'] = _keep_theme_template(themed, agent.renderer)
+
+        # Render the first chunk (which walks every shape once) before any bytes
+        # go out, so documents that fail to render still get the 400 below
+        chunks = iter(chunks)
+        first = next(chunks, '')
+
+        # Same {"success", "svg"} body as before, streamed so large documents
+        # are never held in memory whole. "success" comes last: a failure after
+        # the headers have gone out closes the body with success false and the error.
+        def generate():
+            yield '{'
+            for key, value in extra.items():
+                yield f'{json.dumps(key)}: {json.dumps(value)}, '
+            yield '"svg": "'
+            yield json.dumps(first)[1:-1]
+            try:
+                for chunk in chunks:
+                    yield json.dumps(chunk)[1:-1]
+            except Exception as e:
+                print(f"Error: {e}")
+                yield f'", "success": false, "error": {json.dumps(str(e))}}}'
+                return
+            yield '", "success": true}'
+
+        return Response(stream_with_context(generate()), mimetype='application/json')
     except Exception as e:
         print(f"Error: {e}")
         import traceback
@@ -71,6 +136,86 @@ def json_to_svg():
         }), 400
 
 
+def _keep_theme_template(themed, renderer):
+    template_id = uuid.uuid4().hex
+    with theme_templates_lock:
+        theme_templates[template_id] = (themed, renderer)
+        while len(theme_templates) > MAX_THEME_TEMPLATES:
+            theme_templates.popitem(last=False)
+    return template_id
+
+
+@app.route('/restyle', methods=['POST'])
+def restyle():
+    """Re-theme an earlier render: {"theme_template", "theme"} -> {"success", "svg"}.
+
+    Only the theme slots are refilled, so this costs a fraction of the
+    original render. Templates expire oldest first; on 404, send the
+    shapes to /json-to-svg again.
+    """
+    try:
+        data = request.get_json()
+        with theme_templates_lock:
+            entry = theme_templates.get(data.get('theme_template'))
+            if entry is not None:
+                theme_templates.move_to_end(data['theme_template'])
+        if entry is None:
+            return jsonify({'success': False, 'error': 'Unknown or expired theme_template'}), 404
+        themed, renderer = entry
+        return jsonify({'success': True, 'svg': themed.fill(renderer.theme_table_for(data.get('theme', DEFAULT_THEME)))})
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+def _json_to_png(agent, width, height, extra):
+    """Rasterize through the shared worker pool so a pathological document cannot stall this worker"""
+    if not CAIROSVG_AVAILABLE:
+        return jsonify({'success': False, 'error': 'PNG conversion is not available (pip install cairosvg)'}), 501
+    try:
+        png_bytes = get_rasterizer().rasterize(agent.render(), width, height)
+    except RasterizeTimeout as e:
+        return jsonify({'success': False, 'error': str(e)}), 504
+    except RasterizeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 422
+    return jsonify({
+        'success': True,
+        **extra,
+        'png': base64.b64encode(png_bytes).decode('utf-8')
+    })
+
+
+@app.route('/recolor', methods=['POST'])
+def recolor():
+    """Restyle a whole diagram at once.
+
+    {"shapes", "d_h", "d_s", "d_l", "desaturate"} -> {"success", "shapes"}:
+    every fill/stroke/text color is desaturated by "desaturate" percent,
+    then shifted by the hue (degrees), saturation and lightness (percent)
+    deltas. "none" stays "none".
+    """
+    try:
+        data = request.get_json()
+        adjust = {key: float(data.get(key, 0)) for key in ('d_h', 'd_s', 'd_l', 'desaturate')}
+        shapes = recolor_shapes(data.get('shapes', []), **adjust)
+        return jsonify({'success': True, 'shapes': shapes})
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+
+@app.route('/rasterizer-stats', methods=['GET'])
+def rasterizer_stats():
+    """Queue depth, job counters and latency percentiles of the rasterizer pool"""
+    return jsonify(get_rasterizer().stats())
+
+
 @app.route('/agent', methods=['POST'])
 def agent():
     # Read image if present
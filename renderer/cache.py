@@ -0,0 +1,212 @@
+"""
+Content-addressed cache for rendered shape lists.
+
+Keys are a canonical hash of (shapes, canvas size, background, output kind),
+so identical expressions hit no matter which renderer instance asks. Values
+are SVG text, PNG bytes or raster arrays. The in-process tier is an LRU bounded
+by bytes; an optional directory adds a second, persistent tier.
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Union
+
+import numpy as np
+
+
+CacheValue = Union[str, bytes, np.ndarray]
+
+# File suffix for each cached output kind on the disk tier
+KIND_SUFFIXES = {"svg": ".svg", "template": ".svgt", "png": ".png", "array": ".npy"}
+# Suffixes whose entries are read back as str
+TEXT_SUFFIXES = (".svg", ".svgt")
+
+
+def _shape_record(shape: Any) -> Dict[str, Any]:
+    """Plain dict for a Shape dataclass, a ShapeTable row or a raw shape dict."""
+    if isinstance(shape, dict):
+        return shape
+    if hasattr(shape, "to_dict"):
+        return shape.to_dict()
+    return vars(shape)
+
+
+def shapes_key(shapes: Union[List[Any], Dict[str, Any]], width: int, height: int,
+               background: str = "white", kind: str = "svg", namespace: str = "") -> str:
+    """Canonical key for a render request.
+
+    namespace separates renderers that emit different output for the same
+    shapes (e.g. the agent and flowchart editor dialects).
+    """
+    if isinstance(shapes, dict):
+        shapes = [shapes]
+    if hasattr(shapes, "content_hash"):
+        # ShapeTable: hash the columns instead of walking rows
+        records = shapes.content_hash()
+    else:
+        records = [_shape_record(s) for s in shapes]
+    payload = json.dumps(
+        [namespace, kind, width, height, background, records],
+        sort_keys=True, separators=(",", ":"), default=str,
+    )
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"{kind}-{digest}"
+
+
+def _value_size(value: CacheValue) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    return len(value)
+
+
+class RenderCache:
+    """Two-tier LRU cache (memory, then optional disk) for render outputs"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, disk_dir: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._entries: "OrderedDict[str, CacheValue]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+
+    def get(self, key: str) -> Optional[CacheValue]:
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._insert(key, value)
+        return value
+
+    def put(self, key: str, value: CacheValue) -> None:
+        """Store value in memory and, if configured, on disk"""
+        if value is None:
+            return
+        if isinstance(value, np.ndarray):
+            # Cached arrays are shared between callers, so freeze them
+            value = value.copy()
+            value.flags.writeable = False
+        with self._lock:
+            self._insert(key, value)
+        self._write_disk(key, value)
+
+    def _insert(self, key: str, value: CacheValue) -> None:
+        size = _value_size(value)
+        if size > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= _value_size(old)
+        self._entries[key] = value
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= _value_size(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.disk_dir:
+            return None
+        kind = key.split("-", 1)[0]
+        return os.path.join(self.disk_dir, key + KIND_SUFFIXES.get(kind, ".bin"))
+
+    def _read_disk(self, key: str) -> Optional[CacheValue]:
+        path = self._disk_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if path.endswith(TEXT_SUFFIXES):
+                return data.decode("utf-8")
+            if path.endswith(".npy"):
+                value = np.load(io.BytesIO(data), allow_pickle=False)
+                value.flags.writeable = False
+                return value
+            return data
+        except (OSError, ValueError) as e:
+            print(f"Error reading render cache entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, value: CacheValue) -> None:
+        path = self._disk_path(key)
+        if path is None or os.path.exists(path):
+            return
+        try:
+            if isinstance(value, np.ndarray):
+                buf = io.BytesIO()
+                np.save(buf, value, allow_pickle=False)
+                data = buf.getvalue()
+            elif isinstance(value, str):
+                data = value.encode("utf-8")
+            else:
+                data = value
+            # Write then rename so concurrent readers never see a partial file
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self.disk_writes += 1
+        except OSError as e:
+            print(f"Error writing render cache entry {key}: {e}")
+
+    def clear(self) -> None:
+        """Drop the in-memory tier (the disk tier is left alone)"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters and current memory footprint"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "disk_hits": self.disk_hits,
+                "disk_writes": self.disk_writes,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+_default_cache: Optional[RenderCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    """Process-wide cache shared by all renderers.
+
+    RENDER_CACHE_MAX_BYTES and RENDER_CACHE_DIR configure the bound and the
+    optional disk tier.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = RenderCache(
+                max_bytes=int(os.getenv("RENDER_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+                disk_dir=os.getenv("RENDER_CACHE_DIR") or None,
+            )
+        return _default_cache
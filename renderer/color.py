@@ -0,0 +1,153 @@
+"""
+CIELAB color math for color names and render scoring.
+
+rgb_to_lab converts sRGB (0-255) arrays of any leading shape (a palette,
+a table column or a whole (h, w, 3) image) to CIE L*a*b* under D65.
+delta_e is the CIE76 distance, Euclidean in Lab (about 2.3 is a just
+noticeable difference), and broadcasts like any NumPy operation.
+
+CSS_COLOR_MAP is the CSS named-color table, shared by the rasterizer and
+the flowchart editor's color parsing.
+
+LabIndex holds the Lab coordinates of a fixed palette and answers
+nearest-color queries for many colors at once. Palettes here are small
+(the named colors are ~160 entries), so one matrix product per chunk of
+queries beats a KD-tree and needs nothing beyond NumPy.
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# CSS named colors (all 148 of CSS Color Module Level 4)
+CSS_COLOR_MAP: Dict[str, str] = {
+    "aliceblue": "#f0f8ff", "antiquewhite": "#faebd7", "aqua": "#00ffff", "aquamarine": "#7fffd4",
+    "azure": "#f0ffff", "beige": "#f5f5dc", "bisque": "#ffe4c4", "black": "#000000",
+    "blanchedalmond": "#ffebcd", "blue": "#0000ff", "blueviolet": "#8a2be2", "brown": "#a52a2a",
+    "burlywood": "#deb887", "cadetblue": "#5f9ea0", "chartreuse": "#7fff00", "chocolate": "#d2691e",
+    "coral": "#ff7f50", "cornflowerblue": "#6495ed", "cornsilk": "#fff8dc", "crimson": "#dc143c",
+    "cyan": "#00ffff", "darkblue": "#00008b", "darkcyan": "#008b8b", "darkgoldenrod": "#b8860b",
+    "darkgray": "#a9a9a9", "darkgreen": "#006400", "darkgrey": "#a9a9a9", "darkkhaki": "#bdb76b",
+    "darkmagenta": "#8b008b", "darkolivegreen": "#556b2f", "darkorange": "#ff8c00", "darkorchid": "#9932cc",
+    "darkred": "#8b0000", "darksalmon": "#e9967a", "darkseagreen": "#8fbc8f", "darkslateblue": "#483d8b",
+    "darkslategray": "#2f4f4f", "darkslategrey": "#2f4f4f", "darkturquoise": "#00ced1", "darkviolet": "#9400d3",
+    "deeppink": "#ff1493", "deepskyblue": "#00bfff", "dimgray": "#696969", "dimgrey": "#696969",
+    "dodgerblue": "#1e90ff", "firebrick": "#b22222", "floralwhite": "#fffaf0", "forestgreen": "#228b22",
+    "fuchsia": "#ff00ff", "gainsboro": "#dcdcdc", "ghostwhite": "#f8f8ff", "gold": "#ffd700",
+    "goldenrod": "#daa520", "gray": "#808080", "green": "#008000", "greenyellow": "#adff2f",
+    "grey": "#808080", "honeydew": "#f0fff0", "hotpink": "#ff69b4", "indianred": "#cd5c5c",
+    "indigo": "#4b0082", "ivory": "#fffff0", "khaki": "#f0e68c", "lavender": "#e6e6fa",
+    "lavenderblush": "#fff0f5", "lawngreen": "#7cfc00", "lemonchiffon": "#fffacd", "lightblue": "#add8e6",
+    "lightcoral": "#f08080", "lightcyan": "#e0ffff", "lightgoldenrodyellow": "#fafad2", "lightgray": "#d3d3d3",
+    "lightgreen": "#90ee90", "lightgrey": "#d3d3d3", "lightpink": "#ffb6c1", "lightsalmon": "#ffa07a",
+    "lightseagreen": "#20b2aa", "lightskyblue": "#87cefa", "lightslategray": "#778899",
+    "lightslategrey": "#778899", "lightsteelblue": "#b0c4de", "lightyellow": "#ffffe0", "lime": "#00ff00",
+    "limegreen": "#32cd32", "linen": "#faf0e6", "magenta": "#ff00ff", "maroon": "#800000",
+    "mediumaquamarine": "#66cdaa", "mediumblue": "#0000cd", "mediumorchid": "#ba55d3",
+    "mediumpurple": "#9370db", "mediumseagreen": "#3cb371", "mediumslateblue": "#7b68ee",
+    "mediumspringgreen": "#00fa9a", "mediumturquoise": "#48d1cc", "mediumvioletred": "#c71585",
+    "midnightblue": "#191970", "mintcream": "#f5fffa", "mistyrose": "#ffe4e1", "moccasin": "#ffe4b5",
+    "navajowhite": "#ffdead", "navy": "#000080", "oldlace": "#fdf5e6", "olive": "#808000",
+    "olivedrab": "#6b8e23", "orange": "#ffa500", "orangered": "#ff4500", "orchid": "#da70d6",
+    "palegoldenrod": "#eee8aa", "palegreen": "#98fb98", "paleturquoise": "#afeeee",
+    "palevioletred": "#db7093", "papayawhip": "#ffefd5", "peachpuff": "#ffdab9", "peru": "#cd853f",
+    "pink": "#ffc0cb", "plum": "#dda0dd", "powderblue": "#b0e0e6", "purple": "#800080",
+    "rebeccapurple": "#663399", "red": "#ff0000", "rosybrown": "#bc8f8f", "royalblue": "#4169e1",
+    "saddlebrown": "#8b4513", "salmon": "#fa8072", "sandybrown": "#f4a460", "seagreen": "#2e8b57",
+    "seashell": "#fff5ee", "sienna": "#a0522d", "silver": "#c0c0c0", "skyblue": "#87ceeb",
+    "slateblue": "#6a5acd", "slategray": "#708090", "slategrey": "#708090", "snow": "#fffafa",
+    "springgreen": "#00ff7f", "steelblue": "#4682b4", "tan": "#d2b48c", "teal": "#008080",
+    "thistle": "#d8bfd8", "tomato": "#ff6347", "turquoise": "#40e0d0", "violet": "#ee82ee",
+    "wheat": "#f5deb3", "white": "#ffffff", "whitesmoke": "#f5f5f5", "yellow": "#ffff00",
+    "yellowgreen": "#9acd32",
+}
+
+# D65 reference white
+WHITE_D65 = np.array([0.95047, 1.0, 1.08883])
+# Linear sRGB -> XYZ, rows scaled by the reference white so Lab uses xyz / white directly
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+]) / WHITE_D65[:, None]
+
+# ΔE below this is treated as the same color
+JND_DELTA_E = 2.3
+# Query rows per distance matrix in LabIndex.nearest
+NEAREST_CHUNK = 65536
+
+
+def _linearize(c: np.ndarray) -> np.ndarray:
+    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+
+
+# uint8 channel value -> linear sRGB, so images skip the power per pixel
+_LINEAR_LUT = _linearize(np.arange(256) / 255.0)
+
+
+def rgb_to_lab(rgb: np.ndarray) -> np.ndarray:
+    """(..., 3) sRGB in 0-255 -> (..., 3) float64 L*a*b*; alpha channels are dropped"""
+    rgb = np.asarray(rgb)[..., :3]
+    if rgb.dtype == np.uint8:
+        linear = _LINEAR_LUT[rgb]
+    else:
+        linear = _linearize(np.clip(rgb.astype(np.float64) / 255.0, 0.0, 1.0))
+    xyz = linear @ _RGB_TO_XYZ.T
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    fx, fy, fz = f[..., 0], f[..., 1], f[..., 2]
+    return np.stack([116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)], axis=-1)
+
+
+def delta_e(lab1: np.ndarray, lab2: np.ndarray) -> np.ndarray:
+    """CIE76 ΔE between Lab arrays, broadcast over their leading dimensions"""
+    diff = np.asarray(lab1, dtype=np.float64) - np.asarray(lab2, dtype=np.float64)
+    return np.sqrt((diff * diff).sum(axis=-1))
+
+
+def image_delta_e(rgb1: np.ndarray, rgb2: np.ndarray, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """Per-pixel ΔE of two same-size RGB images, flattened to the pixels in mask (all if None)"""
+    a, b = np.asarray(rgb1)[..., :3], np.asarray(rgb2)[..., :3]
+    if a.shape != b.shape:
+        raise ValueError(f"Image shapes differ: {a.shape} vs {b.shape}")
+    if mask is not None:
+        a, b = a[mask], b[mask]
+    return delta_e(rgb_to_lab(a), rgb_to_lab(b)).reshape(-1)
+
+
+class LabIndex:
+    """Nearest-neighbour lookup in Lab over a fixed, named palette"""
+
+    def __init__(self, names: Sequence[str], rgb: np.ndarray):
+        rgb = np.asarray(rgb).reshape(-1, 3)
+        if len(names) != len(rgb):
+            raise ValueError(f"{len(names)} names for {len(rgb)} colors")
+        self.names = list(names)
+        self.rgb = rgb
+        self.lab = rgb_to_lab(rgb)
+        self._norms = (self.lab * self.lab).sum(axis=1)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def nearest(self, lab: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(indices, ΔE) of the k closest palette entries to each Lab row, closest first; both (n, k)"""
+        lab = np.asarray(lab, dtype=np.float64).reshape(-1, 3)
+        k = min(k, len(self.names))
+        indices = np.empty((len(lab), k), dtype=np.intp)
+        distances = np.empty((len(lab), k))
+        for start in range(0, len(lab), NEAREST_CHUNK):
+            chunk = lab[start:start + NEAREST_CHUNK]
+            d2 = (chunk * chunk).sum(axis=1)[:, None] - 2 * chunk @ self.lab.T + self._norms
+            if k == 1:
+                best = d2.argmin(axis=1)[:, None]
+            else:
+                best = np.argpartition(d2, k - 1, axis=1)[:, :k]
+                best = np.take_along_axis(best, np.take_along_axis(d2, best, axis=1).argsort(axis=1), axis=1)
+            indices[start:start + len(chunk)] = best
+            # Exact distances for the winners; the expanded form above can lose precision
+            distances[start:start + len(chunk)] = delta_e(chunk[:, None, :], self.lab[best])
+        return indices, distances
+
+    def nearest_rgb(self, rgb: np.ndarray, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        return self.nearest(rgb_to_lab(np.asarray(rgb).reshape(-1, 3)), k)
@@ -0,0 +1,321 @@
+"""
+Persistent rasterizer worker pool.
+
+cairosvg.svg2png pays for module import, cairo surface and fontconfig setup
+on every call in a fresh process, and one pathological document (huge stroke
+widths, million-point polylines) can pin the calling thread indefinitely.
+RasterizerPool keeps long-lived worker processes (`python -m renderer.daemon`,
+so nothing of the host application is re-imported) that have already
+imported cairosvg and rendered a warm-up document, and talks to each over a
+pair of pipes carrying pickled messages:
+
+    worker -> parent   "ready" once warmed up
+    parent -> worker   (svg_bytes, width, height)  or None to exit
+    worker -> parent   ("ok", png_bytes) | ("memory", message) | ("error", message)
+
+Every job runs under a hard wall-clock timeout (the worker is killed and
+replaced when it is exceeded) and an address-space limit set inside the
+worker. Workers are recycled after max_jobs_per_worker jobs so leaks in
+cairo or fontconfig cannot accumulate. stats() reports queue depth and
+latency percentiles.
+"""
+
+import atexit
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import Connection
+from typing import Any, Dict, Optional, Union
+
+try:
+    import resource
+except ImportError:  # not available on Windows; jobs then run without a memory limit
+    resource = None
+
+try:
+    import cairosvg
+    CAIROSVG_AVAILABLE = True
+except ImportError:
+    CAIROSVG_AVAILABLE = False
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_MEMORY_LIMIT_MB = 1024
+DEFAULT_MAX_JOBS_PER_WORKER = 500
+# Time a new worker gets to import cairosvg and render the warm-up document
+STARTUP_TIMEOUT = 60.0
+# Latencies kept for the percentile stats
+LATENCY_WINDOW = 1000
+
+_WARMUP_SVG = (b'<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16">'
+               b'<rect width="16" height="16" fill="white"/>'
+               b'<text x="1" y="12" font-family="Arial" font-size="10">Ag</text></svg>')
+
+
+class RasterizeError(Exception):
+    """A job failed inside the worker, or the worker died while running it"""
+
+
+class RasterizeTimeout(RasterizeError):
+    """A job exceeded its time limit; its worker was killed"""
+
+
+def _worker_main(jobs: Connection, results: Connection, memory_limit_mb: Optional[int]) -> None:
+    """Worker process: set limits, warm cairo and fonts, then serve jobs until told to exit"""
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    import cairosvg
+    try:
+        cairosvg.svg2png(bytestring=_WARMUP_SVG)
+    except Exception:
+        pass
+    results.send("ready")
+    while True:
+        try:
+            job = jobs.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        svg, width, height = job
+        try:
+            results.send(("ok", cairosvg.svg2png(bytestring=svg, output_width=width, output_height=height)))
+        except MemoryError:
+            results.send(("memory", f"exceeded the {memory_limit_mb} MB memory limit"))
+        except Exception as e:
+            results.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class _Worker:
+    def __init__(self, memory_limit_mb: Optional[int]):
+        job_r, job_w = os.pipe()
+        result_r, result_w = os.pipe()
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(p for p in (ROOT, env.get("PYTHONPATH")) if p)
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", "renderer.daemon", str(job_r), str(result_w), str(memory_limit_mb or 0)],
+                pass_fds=(job_r, result_w), env=env,
+            )
+        except OSError as e:
+            os.close(job_w)
+            os.close(result_r)
+            raise RasterizeError(f"Could not start rasterizer worker: {e}")
+        finally:
+            # The worker's ends of the pipes belong to the worker now
+            os.close(job_r)
+            os.close(result_w)
+        self.jobs_conn = Connection(job_w, readable=False)
+        self.results_conn = Connection(result_r, writable=False)
+        self.jobs = 0
+        try:
+            ready = self.results_conn.poll(STARTUP_TIMEOUT) and self.results_conn.recv() == "ready"
+        except (EOFError, OSError):
+            ready = False
+        if not ready:
+            self.stop(graceful=False)
+            raise RasterizeError("Rasterizer worker failed to start")
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def stop(self, graceful: bool = True) -> None:
+        if graceful and self.alive():
+            try:
+                self.jobs_conn.send(None)
+                self.process.wait(timeout=1.0)
+            except (OSError, ValueError, subprocess.TimeoutExpired):
+                pass
+        if self.alive():
+            self.process.kill()
+            self.process.wait()
+        self.jobs_conn.close()
+        self.results_conn.close()
+
+
+class RasterizerPool:
+    """Long-lived cairosvg worker processes with per-job time and memory limits"""
+
+    def __init__(self, workers: Optional[int] = None, timeout: float = DEFAULT_TIMEOUT,
+                 memory_limit_mb: Optional[int] = DEFAULT_MEMORY_LIMIT_MB,
+                 max_jobs_per_worker: int = DEFAULT_MAX_JOBS_PER_WORKER):
+        self.max_workers = workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._spawned = 0
+        self._waiting = 0
+        self._busy = 0
+        self._closed = False
+        self._latencies: deque = deque(maxlen=LATENCY_WINDOW)
+        self._counts = {"completed": 0, "failed": 0, "timeouts": 0, "memory_errors": 0,
+                        "crashed": 0, "recycled": 0, "started": 0}
+
+    def _acquire(self) -> _Worker:
+        """An idle worker, starting one if the pool is below size, else wait for one"""
+        with self._lock:
+            if self._closed:
+                raise RasterizeError("Rasterizer pool is shut down")
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                worker = None
+                if self._spawned < self.max_workers:
+                    self._spawned += 1
+                    self._counts["started"] += 1
+                    spawn = True
+                else:
+                    self._waiting += 1
+                    spawn = False
+            if worker is not None:
+                self._busy += 1
+                return worker
+        if spawn:
+            try:
+                worker = _Worker(self.memory_limit_mb)
+            except Exception:
+                with self._lock:
+                    self._spawned -= 1
+                raise
+        else:
+            try:
+                worker = self._idle.get()
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+        with self._lock:
+            self._busy += 1
+        return worker
+
+    def _release(self, worker: _Worker, healthy: bool) -> None:
+        """Return a worker to the pool, or retire it if it failed or has done its share of jobs"""
+        recycle = healthy and worker.jobs >= self.max_jobs_per_worker
+        if healthy and not recycle and not self._closed:
+            with self._lock:
+                self._busy -= 1
+            self._idle.put(worker)
+            return
+        worker.stop(graceful=healthy)
+        with self._lock:
+            self._busy -= 1
+            self._spawned -= 1
+            if recycle:
+                self._counts["recycled"] += 1
+            # Callers blocked in _acquire only wake for an idle worker, so replace this one for them
+            replace = self._waiting > 0 and not self._closed
+            if replace:
+                self._spawned += 1
+                self._counts["started"] += 1
+        if replace:
+            try:
+                self._idle.put(_Worker(self.memory_limit_mb))
+            except RasterizeError:
+                with self._lock:
+                    self._spawned -= 1
+
+    def rasterize(self, svg: Union[str, bytes], width: int, height: int, timeout: Optional[float] = None) -> bytes:
+        """PNG bytes for svg at width x height; raises RasterizeTimeout / RasterizeError"""
+        if isinstance(svg, str):
+            svg = svg.encode("utf-8")
+        timeout = self.timeout if timeout is None else timeout
+        queued = time.perf_counter()
+        worker = self._acquire()
+        healthy = False
+        try:
+            try:
+                worker.jobs_conn.send((svg, width, height))
+                if not worker.results_conn.poll(timeout):
+                    with self._lock:
+                        self._counts["timeouts"] += 1
+                    raise RasterizeTimeout(f"Rasterization exceeded {timeout:g}s")
+                status, payload = worker.results_conn.recv()
+            except (EOFError, OSError) as e:
+                with self._lock:
+                    self._counts["crashed"] += 1
+                raise RasterizeError(f"Rasterizer worker died: {str(e) or 'connection closed'}")
+            worker.jobs += 1
+            healthy = True
+            if status == "ok":
+                with self._lock:
+                    self._counts["completed"] += 1
+                    self._latencies.append(time.perf_counter() - queued)
+                return payload
+            if status == "memory":
+                # A worker that hit its address-space limit is not trusted for further jobs
+                healthy = False
+                with self._lock:
+                    self._counts["memory_errors"] += 1
+            raise RasterizeError(payload)
+        except RasterizeError:
+            with self._lock:
+                self._counts["failed"] += 1
+            raise
+        finally:
+            self._release(worker, healthy)
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool size, queue depth, job counters and latency percentiles (ms, queue wait included)"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            result: Dict[str, Any] = {
+                "workers": self._spawned,
+                "max_workers": self.max_workers,
+                "busy": self._busy,
+                "idle": self._idle.qsize(),
+                "queue_depth": self._waiting,
+                **self._counts,
+            }
+        for name, q in (("p50", 0.50), ("p95", 0.95), ("max", 1.0)):
+            value = latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else None
+            result[f"latency_{name}_ms"] = round(value * 1000, 3) if value is not None else None
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            worker.stop()
+            with self._lock:
+                self._spawned -= 1
+
+
+_rasterizer: Optional[RasterizerPool] = None
+_rasterizer_lock = threading.Lock()
+
+
+def get_rasterizer() -> RasterizerPool:
+    """The process-wide rasterizer pool, started on first use"""
+    global _rasterizer
+    with _rasterizer_lock:
+        if _rasterizer is None:
+            _rasterizer = RasterizerPool()
+        return _rasterizer
+
+
+def _shutdown_rasterizer():
+    global _rasterizer
+    with _rasterizer_lock:
+        if _rasterizer is not None:
+            _rasterizer.shutdown()
+            _rasterizer = None
+
+
+atexit.register(_shutdown_rasterizer)
+
+
+if __name__ == "__main__":
+    _worker_main(Connection(int(sys.argv[1]), writable=False), Connection(int(sys.argv[2]), readable=False),
+                 int(sys.argv[3]) or None)
@@ -0,0 +1,189 @@
+"""
+Point-list simplification for polylines and arrows.
+
+Freehand strokes from the editor carry one point per mouse sample and LLM
+output carries coordinates at full float precision. Simplifier reduces a
+point list in three steps:
+
+    quantize        round coordinates to `decimals` places (ints at 0)
+    collinear       drop points on a straight run between their neighbours,
+                    and repeated points (exact, changes no pixels)
+    Ramer-Douglas-Peucker
+                    drop points within `tolerance` px of the simplified path
+
+End points are always kept, so arrowheads stay where they were.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+# Shape types whose points are simplified
+SIMPLIFIED_TYPES = ("polyline", "arrow")
+
+DEFAULT_TOLERANCE = 1.0
+DEFAULT_DECIMALS = 2
+# Cross products below this count as collinear (squared px)
+COLLINEAR_EPSILON = 1e-9
+
+
+@dataclass
+class SimplifyStats:
+    """What a Simplifier pass removed; bytes are of the SVG points attributes, shapes those changed"""
+    shapes: int = 0
+    points_before: int = 0
+    points_after: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+    @property
+    def points_removed(self) -> int:
+        return self.points_before - self.points_after
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.bytes_before - self.bytes_after
+
+    def to_dict(self) -> Dict[str, int]:
+        return {"shapes": self.shapes, "points_before": self.points_before, "points_after": self.points_after,
+                "points_removed": self.points_removed, "bytes_before": self.bytes_before,
+                "bytes_after": self.bytes_after, "bytes_saved": self.bytes_saved}
+
+    def summary(self) -> str:
+        return (f"{self.points_removed} of {self.points_before} points removed from {self.shapes} shapes, "
+                f"{self.bytes_saved} bytes saved")
+
+
+def _points_text_size(points: Sequence[Sequence[float]]) -> int:
+    """Length of the points attribute renderer.svg writes for these points"""
+    return len(" ".join([f"{pt[0]},{pt[1]}" for pt in points]))
+
+
+def rdp_mask(pts: np.ndarray, tolerance: float) -> np.ndarray:
+    """Ramer-Douglas-Peucker over an (n, 2) array; True for the points to keep.
+
+    Distances are to the chord segment (not its infinite line), so strokes
+    that double back keep their turning points.
+    """
+    n = len(pts)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    stack: List[Tuple[int, int]] = [(0, n - 1)]
+    while stack:
+        i, j = stack.pop()
+        if j - i < 2:
+            continue
+        a = pts[i]
+        chord = pts[j] - a
+        rel = pts[i + 1:j] - a
+        length2 = float(chord @ chord)
+        if length2 > 0:
+            t = np.clip(rel @ chord / length2, 0.0, 1.0)
+            rel = rel - t[:, None] * chord
+        dist = np.hypot(rel[:, 0], rel[:, 1])
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            split = i + 1 + k
+            keep[split] = True
+            stack.append((i, split))
+            stack.append((split, j))
+    return keep
+
+
+def dedupe_mask(pts: np.ndarray) -> np.ndarray:
+    """True for points that differ from the point before them"""
+    keep = np.ones(len(pts), dtype=bool)
+    keep[1:] = (pts[1:] != pts[:-1]).any(axis=1)
+    return keep
+
+
+def collinear_mask(pts: np.ndarray) -> np.ndarray:
+    """True for points that are not interior to a straight run; pts must have no repeats.
+
+    A point is dropped when it continues in the direction its predecessor
+    came from, so dropping a whole run at once leaves the same line.
+    """
+    keep = np.ones(len(pts), dtype=bool)
+    if len(pts) < 3:
+        return keep
+    before = pts[1:-1] - pts[:-2]
+    after = pts[2:] - pts[1:-1]
+    cross = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0]
+    dot = (before * after).sum(axis=1)
+    keep[1:-1] = ~((np.abs(cross) <= COLLINEAR_EPSILON) & (dot > 0))
+    return keep
+
+
+class Simplifier:
+    """Configured simplification pass over polyline/arrow point lists.
+
+    tolerance=0 keeps every point that changes the path; decimals=None
+    leaves coordinates unrounded.
+    """
+
+    def __init__(self, tolerance: float = DEFAULT_TOLERANCE, decimals: Optional[int] = DEFAULT_DECIMALS,
+                 remove_collinear: bool = True):
+        if tolerance < 0:
+            raise ValueError(f"tolerance must be >= 0, got {tolerance}")
+        self.tolerance = float(tolerance)
+        self.decimals = None if decimals is None else int(decimals)
+        self.remove_collinear = remove_collinear
+
+    @classmethod
+    def from_options(cls, options: Any) -> Optional["Simplifier"]:
+        """None/False -> None, True -> defaults, a dict -> keyword arguments (as sent to the API)"""
+        if not options:
+            return None
+        if options is True:
+            return cls()
+        if isinstance(options, dict):
+            return cls(**options)
+        raise ValueError(f"simplify must be true or an options object, got {options!r}")
+
+    def simplify_points(self, points: Sequence[Sequence[float]]) -> List[List[float]]:
+        pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if self.decimals is not None:
+            pts = np.round(pts, self.decimals)
+        if len(pts) > 2:
+            if self.remove_collinear:
+                pts = pts[dedupe_mask(pts)]
+                if len(pts) == 1:
+                    # A stroke that never moved still needs two points to draw
+                    pts = np.repeat(pts, 2, axis=0)
+                pts = pts[collinear_mask(pts)]
+            if self.tolerance > 0:
+                pts = pts[rdp_mask(pts, self.tolerance)]
+        # Whole numbers go back as ints, so "100" is not written as "100.0"
+        return [[int(v) if v.is_integer() else v for v in pt] for pt in pts.tolist()]
+
+    def apply(self, shapes_data: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], SimplifyStats]:
+        """Simplified copies of polyline/arrow dicts (others pass through), and what was saved.
+
+        A shape keeps its own points unless the simplified list writes shorter.
+        Input dicts are never modified, so callers' documents stay intact.
+        """
+        stats = SimplifyStats()
+        result = []
+        for shape in shapes_data:
+            points = shape.get("points") if shape.get("shape_type") in SIMPLIFIED_TYPES else None
+            if not points:
+                result.append(shape)
+                continue
+            simplified = self.simplify_points(points)
+            size_before, size_after = _points_text_size(points), _points_text_size(simplified)
+            stats.points_before += len(points)
+            stats.bytes_before += size_before
+            if size_after >= size_before:
+                stats.points_after += len(points)
+                stats.bytes_after += size_before
+                result.append(shape)
+                continue
+            stats.shapes += 1
+            stats.points_after += len(simplified)
+            stats.bytes_after += size_after
+            result.append({**shape, "points": simplified})
+        return result, stats
@@ -0,0 +1,110 @@
+"""
+In-memory rendered image.
+
+A RenderedImage holds PNG bytes, a decoded pixel array, or both, and
+produces whichever form is missing on first use. Rendering, IoU scoring and
+the VLM clients pass it around in place of a file path, so a step never has
+to write a PNG just to read it back; save() writes one only when asked.
+"""
+
+import base64
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+PNG_MIME_TYPE = "image/png"
+
+
+class RenderedImage:
+    """PNG bytes and/or a uint8 pixel array (grayscale, RGB or RGBA), converted lazily"""
+
+    __slots__ = ("_png", "_pixels", "_gray")
+
+    def __init__(self, png: Optional[bytes] = None, pixels: Optional[np.ndarray] = None):
+        if png is None and pixels is None:
+            raise ValueError("RenderedImage needs PNG bytes or a pixel array")
+        self._png = png
+        self._pixels = pixels
+        self._gray: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_png(cls, png: bytes) -> "RenderedImage":
+        return cls(png=png)
+
+    @classmethod
+    def from_array(cls, pixels: np.ndarray) -> "RenderedImage":
+        return cls(pixels=np.asarray(pixels, dtype=np.uint8))
+
+    @classmethod
+    def open(cls, path: str) -> "RenderedImage":
+        """Read an image file once; non-PNG files are decoded and re-encoded as PNG on demand"""
+        with open(path, "rb") as f:
+            data = f.read()
+        if data[:8] == b"\x89PNG\r\n\x1a\n":
+            return cls(png=data)
+        return cls(pixels=_decode(data))
+
+    @property
+    def png(self) -> bytes:
+        if self._png is None:
+            pixels = self._pixels
+            if pixels.ndim == 3:
+                code = cv2.COLOR_RGBA2BGRA if pixels.shape[2] == 4 else cv2.COLOR_RGB2BGR
+                pixels = cv2.cvtColor(pixels, code)
+            ok, buf = cv2.imencode(".png", pixels)
+            if not ok:
+                raise ValueError("PNG encoding failed")
+            self._png = buf.tobytes()
+        return self._png
+
+    @property
+    def pixels(self) -> np.ndarray:
+        """Decoded pixels in RGB(A) order, or 2-D for grayscale"""
+        if self._pixels is None:
+            self._pixels = _decode(self._png)
+        return self._pixels
+
+    @property
+    def gray(self) -> np.ndarray:
+        """Grayscale pixels, converted the way agent.utils.load_and_preprocess_image does (alpha dropped)"""
+        if self._gray is None:
+            pixels = self.pixels
+            if pixels.ndim == 2:
+                self._gray = pixels
+            else:
+                self._gray = cv2.cvtColor(np.ascontiguousarray(pixels[:, :, :3]), cv2.COLOR_RGB2GRAY)
+        return self._gray
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height)"""
+        height, width = self.pixels.shape[:2]
+        return width, height
+
+    def to_data_url(self) -> str:
+        return f"data:{PNG_MIME_TYPE};base64,{base64.b64encode(self.png).decode('utf-8')}"
+
+    def to_pil(self):
+        """Pixels as a PIL image"""
+        return Image.fromarray(self.pixels)
+
+    def save(self, path: str) -> str:
+        """Write the PNG to path; returns path"""
+        with open(path, "wb") as f:
+            f.write(self.png)
+        return path
+
+
+def _decode(data: bytes) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError("Could not decode image")
+    if image.dtype != np.uint8:
+        image = (image >> 8).astype(np.uint8)
+    if image.ndim == 2:
+        return image
+    if image.shape[2] == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
@@ -0,0 +1,419 @@
+"""
+In-memory NumPy rasterizer for the shape grammar.
+
+Draws shapes straight into a grayscale array so candidates can be scored
+without the SVG -> cairosvg -> PNG -> PIL round trip. Coverage is sampled
+at pixel centers (no anti-aliasing), which is all the thresholded IoU needs.
+"""
+
+import math
+import re
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+import numpy as np
+
+from renderer.color import CSS_COLOR_MAP
+from renderer.text_metrics import text_box
+from renderer.theme import DEFAULT_THEME, THEMES
+
+
+# Every CSS color name, as cairo and browsers draw them; anything else may be hex or rgb()
+NAMED_COLORS: Dict[str, Tuple[int, int, int]] = {
+    name: (int(h[1:3], 16), int(h[3:5], 16), int(h[5:7], 16)) for name, h in CSS_COLOR_MAP.items()
+}
+
+# SVG's default stroke-miterlimit: a miter join reaches up to this * stroke_width / 2 past its vertex
+MITER_LIMIT = 4
+# Shape types with corners sharper than a right angle; a rectangle's miters stay within its padded box
+MITERED_TYPES = ("triangle", "polyline", "arrow")
+
+_HEX_RE = re.compile(r"^#([0-9a-f]{3}|[0-9a-f]{6})$")
+_RGB_RE = re.compile(r"^rgb\(\s*(\d{1,3})\s*,\s*(\d{1,3})\s*,\s*(\d{1,3})\s*\)$")
+
+# Defaults mirror the Shape dataclass in renderer/svg.py
+SHAPE_DEFAULTS = {
+    "x": 0, "y": 0, "scale_x": 1, "scale_y": 1,
+    "stroke_color": "black", "fill_color": "none", "stroke_width": 1,
+    "rotation": 0, "opacity": 1.0,
+    "text": "", "font_size": 16, "font_family": "Arial, sans-serif", "text_color": "black",
+    "text_anchor": "middle",
+    "points": None, "arrow_start": "no", "arrow_end": "no",
+    "arrowhead_type": "triangle", "arrowhead_size": 10,
+}
+
+
+def parse_color(value: Any) -> Optional[Tuple[int, int, int]]:
+    """Return an (r, g, b) tuple, or None for 'none'. Unknown names fall back to black."""
+    if value is None:
+        return None
+    v = str(value).strip().lower()
+    if v == "none" or v == "":
+        return None
+    # Theme tokens score as the default theme's colors
+    v = THEMES[DEFAULT_THEME].get(v, v)
+    if v in NAMED_COLORS:
+        return NAMED_COLORS[v]
+    if _HEX_RE.match(v):
+        h = v[1:]
+        if len(h) == 3:
+            h = "".join(ch * 2 for ch in h)
+        return (int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16))
+    m = _RGB_RE.match(v)
+    if m:
+        return tuple(min(255, int(c)) for c in m.groups())
+    return (0, 0, 0)
+
+
+def color_to_gray(rgb: Tuple[int, int, int]) -> float:
+    """Luma with the same weights as cv2.COLOR_RGB2GRAY."""
+    r, g, b = rgb
+    return 0.299 * r + 0.587 * g + 0.114 * b
+
+
+def _get(shape: Any, key: str):
+    """Read a field from a Shape object or a raw shape dict."""
+    if isinstance(shape, dict):
+        value = shape.get(key)
+        return SHAPE_DEFAULTS[key] if value is None else value
+    return getattr(shape, key, SHAPE_DEFAULTS[key])
+
+
+def _num(shape: Any, key: str) -> float:
+    return float(_get(shape, key))
+
+
+# ---------------------------------------------------------------------------
+# Local-space geometry
+# ---------------------------------------------------------------------------
+
+def _triangle_vertices(shape: Any) -> List[Tuple[float, float]]:
+    """Equilateral triangle, apex up, as the agent dialect of renderer.svg emits it."""
+    size = _num(shape, "scale_x")
+    height = size * math.sqrt(3) / 2
+    return [(0.0, -height / 2), (-size / 2, height / 2), (size / 2, height / 2)]
+
+
+def _text_box(shape: Any, ink: bool = True) -> Tuple[float, float, float, float]:
+    """Box (x0, y0, x1, y1) of a text shape around its anchor, from renderer.text_metrics.
+
+    ink=True covers cap height to baseline, which is what gets painted;
+    ink=False is the full line box used for bounds.
+    """
+    return text_box(str(_get(shape, "text")), _num(shape, "font_size"), str(_get(shape, "font_family")),
+                    _get(shape, "text_anchor"), ink=ink)
+
+
+def _arrow_geometry(shape: Any) -> Tuple[List[Tuple[float, float]], List[Tuple[str, tuple]]]:
+    """Shortened shaft points and arrowhead primitives, matching renderer.svg.arrow_points and its markers."""
+    points = [(float(p[0]), float(p[1])) for p in (_get(shape, "points") or [])]
+    heads = []
+    if len(points) < 2:
+        return points, heads
+
+    size = _num(shape, "arrowhead_size")
+    head_type = _get(shape, "arrowhead_type")
+
+    def head_at(base, direction):
+        # Marker frame: x along the path direction, refX=0, refY=size/2
+        dx, dy = direction
+        nx, ny = -dy, dx
+
+        def to_world(mx, my):
+            my -= size / 2
+            return (base[0] + mx * dx + my * nx, base[1] + mx * dy + my * ny)
+
+        if head_type == "circle":
+            return ("disc", (to_world(size * 0.5, size / 2), size / 3))
+        if head_type == "diamond":
+            return ("polygon", (to_world(size, size / 2), to_world(size * 0.6, size * 0.2),
+                                to_world(size * 0.2, size / 2), to_world(size * 0.6, size * 0.8)))
+        return ("polygon", (to_world(0, 0), to_world(size, size / 2), to_world(0, size)))
+
+    if _get(shape, "arrow_end") == "yes":
+        (ax, ay), (bx, by) = points[-2], points[-1]
+        length = math.hypot(bx - ax, by - ay)
+        if length > 0:
+            ratio = (length - size) / length
+            points[-1] = (ax + (bx - ax) * ratio, ay + (by - ay) * ratio)
+            heads.append(head_at(points[-1], ((bx - ax) / length, (by - ay) / length)))
+
+    if _get(shape, "arrow_start") == "yes":
+        (ax, ay), (bx, by) = points[0], points[1]
+        length = math.hypot(bx - ax, by - ay)
+        if length > 0:
+            ratio = size / length
+            points[0] = (ax + (bx - ax) * ratio, ay + (by - ay) * ratio)
+            # auto-start-reverse: the head points back towards the original start
+            heads.append(head_at(points[0], ((ax - bx) / length, (ay - by) / length)))
+
+    return points, heads
+
+
+def _local_extent(shape: Any, shape_type: str) -> Optional[Tuple[float, float, float, float]]:
+    """Local-space bounding box of the painted geometry, before stroke padding."""
+    if shape_type == "circle":
+        r = abs(_num(shape, "scale_x")) * 0.5
+        return (-r, -r, r, r)
+    if shape_type in ("rectangle", "ellipse"):
+        hw = abs(_num(shape, "scale_x")) * 0.5
+        hh = abs(_num(shape, "scale_y")) * 0.5
+        return (-hw, -hh, hw, hh)
+    if shape_type == "triangle":
+        pts = _triangle_vertices(shape)
+    elif shape_type == "text":
+        return _text_box(shape, ink=False)
+    elif shape_type == "polyline":
+        pts = [(float(p[0]), float(p[1])) for p in (_get(shape, "points") or [])]
+    elif shape_type == "arrow":
+        pts = [(float(p[0]), float(p[1])) for p in (_get(shape, "points") or [])]
+        pad = _num(shape, "arrowhead_size")
+        if not pts:
+            return None
+        xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+        return (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+    else:
+        return None
+    if not pts:
+        return None
+    xs, ys = [p[0] for p in pts], [p[1] for p in pts]
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+# ---------------------------------------------------------------------------
+# Coverage tests on local pixel-center coordinates (u, v)
+# ---------------------------------------------------------------------------
+
+def _segment_distance(u, v, a, b) -> np.ndarray:
+    ax, ay = a
+    bx, by = b
+    dx, dy = bx - ax, by - ay
+    denom = dx * dx + dy * dy
+    if denom == 0:
+        return np.hypot(u - ax, v - ay)
+    t = np.clip(((u - ax) * dx + (v - ay) * dy) / denom, 0.0, 1.0)
+    return np.hypot(u - (ax + t * dx), v - (ay + t * dy))
+
+
+def _grid_inverse(u, v) -> Optional[Tuple[float, float, float, float, float, float]]:
+    """(u00, v00, and the 2x2 inverse) mapping local (u, v) back to fractional (column, row) of the grid"""
+    if u.shape[0] < 2 or u.shape[1] < 2:
+        return None
+    du_c, du_r = u[0, 1] - u[0, 0], u[1, 0] - u[0, 0]
+    dv_c, dv_r = v[0, 1] - v[0, 0], v[1, 0] - v[0, 0]
+    det = du_c * dv_r - du_r * dv_c
+    if abs(det) < 1e-12:
+        return None
+    return u[0, 0], v[0, 0], dv_r / det, -du_r / det, -dv_c / det, du_c / det
+
+
+def _segment_window(inverse, a, b, half_width: float, shape) -> Tuple[slice, slice]:
+    """Rows and columns that can lie within half_width of segment ab (the grid is unit-spaced)"""
+    u00, v00, i00, i01, i10, i11 = inverse
+    cols, rows = [], []
+    for pu, pv in (a, b):
+        du, dv = pu - u00, pv - v00
+        cols.append(i00 * du + i01 * dv)
+        rows.append(i10 * du + i11 * dv)
+    reach = half_width + 1
+    c0 = max(0, int(math.floor(min(cols) - reach)))
+    c1 = min(shape[1], int(math.ceil(max(cols) + reach)) + 1)
+    r0 = max(0, int(math.floor(min(rows) - reach)))
+    r1 = min(shape[0], int(math.ceil(max(rows) + reach)) + 1)
+    return slice(r0, max(r0, r1)), slice(c0, max(c0, c1))
+
+
+def _polyline_mask(u, v, pts, half_width: float, closed: bool = False) -> np.ndarray:
+    mask = np.zeros(u.shape, dtype=bool)
+    segments = list(zip(pts[:-1], pts[1:]))
+    if closed and len(pts) > 2:
+        segments.append((pts[-1], pts[0]))
+    # Test each segment only against the pixels near it rather than the whole shape box
+    inverse = _grid_inverse(u, v) if len(segments) > 1 else None
+    for a, b in segments:
+        if inverse is None:
+            mask |= _segment_distance(u, v, a, b) <= half_width
+            continue
+        rows, cols = _segment_window(inverse, a, b, half_width, u.shape)
+        if rows.start < rows.stop and cols.start < cols.stop:
+            mask[rows, cols] |= _segment_distance(u[rows, cols], v[rows, cols], a, b) <= half_width
+    return mask
+
+
+def _polygon_mask(u, v, pts) -> np.ndarray:
+    """Even-odd point-in-polygon test (SVG default fill-rule is nonzero, same for simple polygons)."""
+    inside = np.zeros(u.shape, dtype=bool)
+    n = len(pts)
+    for i in range(n):
+        (x1, y1), (x2, y2) = pts[i], pts[(i + 1) % n]
+        if y1 == y2:
+            continue
+        crosses = (v >= min(y1, y2)) & (v < max(y1, y2))
+        x_at = x1 + (v - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (u < x_at)
+    return inside
+
+
+def _shape_coverage(shape: Any, shape_type: str, u, v) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+    """Return (fill_mask, stroke_mask) for a shape over local coordinates."""
+    half_sw = max(_num(shape, "stroke_width"), 0.0) / 2
+
+    if shape_type == "circle":
+        r = abs(_num(shape, "scale_x")) * 0.5
+        d = np.hypot(u, v)
+        return d <= r, np.abs(d - r) <= half_sw
+
+    if shape_type == "ellipse":
+        rx = max(abs(_num(shape, "scale_x")) * 0.5, 1e-9)
+        ry = max(abs(_num(shape, "scale_y")) * 0.5, 1e-9)
+        k = np.hypot(u / rx, v / ry)
+        # First-order distance to the outline: (k - 1) / |grad k|
+        grad = np.hypot(u / (rx * rx), v / (ry * ry)) / np.maximum(k, 1e-9)
+        dist = np.abs(k - 1) / np.maximum(grad, 1e-9)
+        return k <= 1, dist <= half_sw
+
+    if shape_type == "rectangle":
+        hw = abs(_num(shape, "scale_x")) * 0.5
+        hh = abs(_num(shape, "scale_y")) * 0.5
+        au, av = np.abs(u), np.abs(v)
+        fill = (au <= hw) & (av <= hh)
+        outer = (au <= hw + half_sw) & (av <= hh + half_sw)
+        inner = (au < hw - half_sw) & (av < hh - half_sw)
+        return fill, outer & ~inner
+
+    if shape_type == "triangle":
+        pts = _triangle_vertices(shape)
+        return _polygon_mask(u, v, pts), _polyline_mask(u, v, pts, half_sw, closed=True)
+
+    if shape_type == "text":
+        x0, y0, x1, y1 = _text_box(shape)
+        return (u >= x0) & (u <= x1) & (v >= y0) & (v <= y1), None
+
+    if shape_type == "polyline":
+        pts = [(float(p[0]), float(p[1])) for p in (_get(shape, "points") or [])]
+        return None, _polyline_mask(u, v, pts, half_sw)
+
+    if shape_type == "arrow":
+        pts, heads = _arrow_geometry(shape)
+        stroke = _polyline_mask(u, v, pts, half_sw)
+        for kind, geom in heads:
+            if kind == "disc":
+                (cx, cy), r = geom
+                stroke |= np.hypot(u - cx, v - cy) <= r
+            else:
+                stroke |= _polygon_mask(u, v, list(geom))
+        return None, stroke
+
+    return None, None
+
+
+# ---------------------------------------------------------------------------
+# Public API
+# ---------------------------------------------------------------------------
+
+def _paint_colors(shape: Any, shape_type: str):
+    if shape_type == "text":
+        return parse_color(_get(shape, "text_color")), None
+    if shape_type in ("polyline", "arrow"):
+        return None, parse_color(_get(shape, "stroke_color"))
+    return parse_color(_get(shape, "fill_color")), parse_color(_get(shape, "stroke_color"))
+
+
+def _shape_type(shape: Any) -> Optional[str]:
+    return shape.get("shape_type") if isinstance(shape, dict) else getattr(shape, "shape_type", None)
+
+
+def shape_bounds(shape: Any) -> Optional[Tuple[int, int, int, int]]:
+    """Pixel bounds (c0, r0, c1, r1), end-exclusive and unclipped, that a shape may paint.
+
+    Returns None for shapes that paint nothing (unknown type, no paint, bad fields).
+    """
+    shape_type = _shape_type(shape)
+    try:
+        fill_rgb, stroke_rgb = _paint_colors(shape, shape_type)
+        extent = _local_extent(shape, shape_type)
+        if extent is None or (fill_rgb is None and stroke_rgb is None):
+            return None
+
+        x, y = _num(shape, "x"), _num(shape, "y")
+        theta = math.radians(_num(shape, "rotation"))
+        cos_t, sin_t = math.cos(theta), math.sin(theta)
+        # Mitered corners (the SVG default join) can reach past the half-width of the stroke
+        reach = MITER_LIMIT if stroke_rgb is not None and shape_type in MITERED_TYPES else 1
+        pad = reach * max(_num(shape, "stroke_width"), 0.0) / 2 + 1
+        x0, y0, x1, y1 = extent[0] - pad, extent[1] - pad, extent[2] + pad, extent[3] + pad
+
+        # World bounding box of the rotated local box
+        corners = [(cx, cy) for cx in (x0, x1) for cy in (y0, y1)]
+        wx = [x + cx * cos_t - cy * sin_t for cx, cy in corners]
+        wy = [y + cx * sin_t + cy * cos_t for cx, cy in corners]
+        return (int(math.floor(min(wx))), int(math.floor(min(wy))),
+                int(math.ceil(max(wx))) + 1, int(math.ceil(max(wy))) + 1)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def draw_shape(canvas: np.ndarray, shape: Any, origin: Tuple[int, int] = (0, 0)) -> bool:
+    """Composite one shape into a float32 grayscale canvas in place.
+
+    origin is the (column, row) of canvas[0, 0] on the full canvas, so a
+    window of a larger canvas can be redrawn on its own.
+    """
+    bounds = shape_bounds(shape)
+    if bounds is None:
+        return False
+    shape_type = _shape_type(shape)
+    try:
+        fill_rgb, stroke_rgb = _paint_colors(shape, shape_type)
+        x, y = _num(shape, "x"), _num(shape, "y")
+        theta = math.radians(_num(shape, "rotation"))
+        cos_t, sin_t = math.cos(theta), math.sin(theta)
+
+        # Clip to the window
+        oc, orow = origin
+        h, w = canvas.shape
+        c0, c1 = max(bounds[0], oc), min(bounds[2], oc + w)
+        r0, r1 = max(bounds[1], orow), min(bounds[3], orow + h)
+        if c0 >= c1 or r0 >= r1:
+            return False
+
+        # Pixel centers mapped back through translate(x,y) rotate(rotation)
+        px = np.arange(c0, c1, dtype=np.float64) + 0.5 - x
+        py = np.arange(r0, r1, dtype=np.float64)[:, None] + 0.5 - y
+        u = px * cos_t + py * sin_t
+        v = -px * sin_t + py * cos_t
+
+        fill_mask, stroke_mask = _shape_coverage(shape, shape_type, u, v)
+        alpha = min(max(_num(shape, "opacity"), 0.0), 1.0)
+        region = canvas[r0 - orow:r1 - orow, c0 - oc:c1 - oc]
+        for mask, rgb in ((fill_mask, fill_rgb), (stroke_mask, stroke_rgb)):
+            if mask is None or rgb is None:
+                continue
+            region[mask] = region[mask] * (1 - alpha) + color_to_gray(rgb) * alpha
+        return True
+    except (TypeError, ValueError, IndexError) as e:
+        print(f"Error rasterizing shape: {e}")
+        return False
+
+
+def rasterize_shapes(shapes: Union[List[Any], Dict[str, Any]], width: int, height: int,
+                     background: str = "white",
+                     window: Optional[Tuple[int, int, int, int]] = None) -> np.ndarray:
+    """Rasterize shapes (dicts or Shape objects) into a uint8 grayscale array.
+
+    window=(c0, r0, c1, r1) renders only that part of the canvas; pixels come
+    out identical to the same slice of a full render.
+    """
+    if isinstance(shapes, dict):
+        shapes = [shapes]
+    c0, r0, c1, r1 = window if window is not None else (0, 0, width, height)
+    bg = parse_color(background)
+    canvas = np.full((r1 - r0, c1 - c0), color_to_gray(bg) if bg is not None else 255.0, dtype=np.float32)
+    for shape in shapes or []:
+        draw_shape(canvas, shape, origin=(c0, r0))
+    return np.clip(np.rint(canvas), 0, 255).astype(np.uint8)
+
+
+def rasterize_mask(shapes: Union[List[Any], Dict[str, Any]], width: int, height: int,
+                   background: str = "white", threshold: int = 128) -> np.ndarray:
+    """Rasterize and binarize with the same rule compute_iou uses (pixel > threshold)."""
+    return rasterize_shapes(shapes, width, height, background) > threshold
@@ -0,0 +1,231 @@
+"""
+Struct-of-arrays storage for large shape lists.
+
+ShapeTable keeps numeric fields in NumPy columns, string fields as small
+integer codes into per-column vocabularies, and all polyline/arrow points in
+one flat buffer indexed by offsets. Iterating it yields ShapeRow tuples that
+answer the same attribute names as the Shape dataclass, decoded a chunk at a
+time, so the renderers and the rasterizer can consume it without building
+Shape objects for the whole document.
+"""
+
+import hashlib
+from collections import namedtuple
+from typing import List, Dict, Any, Iterator, Optional, Union
+
+import numpy as np
+
+
+NUMERIC_FIELDS = {
+    "x": 0, "y": 0, "scale_x": 1, "scale_y": 1, "stroke_width": 1,
+    "rotation": 0, "opacity": 1.0, "font_size": 16, "arrowhead_size": 10,
+}
+
+STRING_FIELDS = {
+    "shape_type": None, "stroke_color": "black", "fill_color": "none",
+    "text": "", "font_family": "Arial, sans-serif", "text_color": "black",
+    "text_anchor": "middle", "arrow_start": "no", "arrow_end": "no",
+    "arrowhead_type": "triangle",
+}
+
+# Same field order as the Shape dataclass in renderer/svg.py
+FIELDS = ("shape_type", "x", "y", "scale_x", "scale_y", "stroke_color", "fill_color",
+          "stroke_width", "rotation", "opacity", "text", "font_size", "font_family",
+          "text_color", "text_anchor", "points", "arrow_start", "arrow_end",
+          "arrowhead_type", "arrowhead_size")
+_FIELD_SET = frozenset(FIELDS)
+
+# Rows decoded per step while iterating
+ITER_CHUNK = 4096
+
+
+class ShapeRow(namedtuple("ShapeRow", FIELDS)):
+    """Immutable, Shape-compatible row produced by iterating a ShapeTable"""
+    __slots__ = ()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(self._fields, self))
+
+
+def _code_dtype(vocab_size: int):
+    """Smallest signed dtype that holds codes 0..vocab_size-1 plus -1 for null"""
+    if vocab_size < 2 ** 7:
+        return np.int8
+    if vocab_size < 2 ** 15:
+        return np.int16
+    return np.int32
+
+
+def _compact(column: np.ndarray) -> np.ndarray:
+    """Constant columns (common for defaults) collapse to a zero-stride view of one value"""
+    if len(column) > 1 and (column == column[0]).all():
+        return np.broadcast_to(column[:1].copy(), column.shape)
+    return column
+
+
+def _column_nbytes(column: np.ndarray) -> int:
+    return column.itemsize if column.ndim and column.strides[0] == 0 else column.nbytes
+
+
+def _int_flags(values: List[Any]) -> Union[bool, np.ndarray]:
+    """Which values were ints, so decoding returns 1 where the input said 1 and 1.0 where it said 1.0"""
+    flags = [type(v) is int for v in values]
+    if all(flags):
+        return True
+    if not any(flags):
+        return False
+    return np.array(flags, dtype=bool)
+
+
+def _as_python_numbers(values: np.ndarray, int_flags: Union[bool, np.ndarray]) -> List[Any]:
+    if int_flags is False:
+        return values.tolist()
+    if int_flags is True:
+        return values.astype(np.int64).tolist()
+    ints = np.where(int_flags, values, 0).astype(np.int64).tolist()
+    return [i if w else v for v, i, w in zip(values.tolist(), ints, int_flags.tolist())]
+
+
+class ShapeTable:
+    """Columnar shape list; build with from_dicts / from_shapes"""
+
+    def __init__(self):
+        self.size = 0
+        self.numeric: Dict[str, np.ndarray] = {name: np.zeros(0) for name in NUMERIC_FIELDS}
+        self.int_flags: Dict[str, Union[bool, np.ndarray]] = {name: False for name in NUMERIC_FIELDS}
+        self.codes: Dict[str, np.ndarray] = {name: np.zeros(0, dtype=np.int8) for name in STRING_FIELDS}
+        self.vocab: Dict[str, List[Optional[str]]] = {name: [] for name in STRING_FIELDS}
+        self.point_offsets = np.zeros(1, dtype=np.int64)
+        self.points = np.zeros((0, 2), dtype=np.float64)
+        self.point_int_flags: Union[bool, np.ndarray] = False
+
+    @staticmethod
+    def _valid_rows(shapes_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Rows Shape(**d) would accept and whose numbers parse; others are skipped"""
+        valid = []
+        for shape_data in shapes_data:
+            if not _FIELD_SET.issuperset(shape_data) or "shape_type" not in shape_data:
+                unknown = sorted(set(shape_data) - _FIELD_SET)
+                print(f"Error adding shape: unexpected keys {unknown}" if unknown
+                      else "Error adding shape: missing shape_type")
+                continue
+            try:
+                for name in NUMERIC_FIELDS:
+                    float(shape_data.get(name, 0))
+                for p in shape_data.get("points") or []:
+                    float(p[0]), float(p[1])
+            except (TypeError, ValueError, IndexError) as e:
+                print(f"Error adding shape: {e}")
+                continue
+            valid.append(shape_data)
+        return valid
+
+    @classmethod
+    def from_dicts(cls, shapes_data: List[Dict[str, Any]], validate: bool = True) -> "ShapeTable":
+        """Bulk-convert shape dicts column by column.
+
+        With validate=True rows Shape(**d) would reject (unknown keys, missing
+        shape_type, unparseable numbers) are skipped first; pass False for
+        input that is known to be clean.
+        """
+        rows = cls._valid_rows(shapes_data) if validate else list(shapes_data)
+        table = cls()
+        table.size = len(rows)
+
+        for name, default in NUMERIC_FIELDS.items():
+            values = [d.get(name, default) for d in rows]
+            values = [default if v is None else v for v in values]
+            table.numeric[name] = _compact(np.array(values, dtype=np.float64))
+            table.int_flags[name] = _int_flags(values)
+
+        for name, default in STRING_FIELDS.items():
+            values = [d.get(name, default) for d in rows]
+            if not all(v is None or type(v) is str for v in values):
+                values = [v if v is None or isinstance(v, str) else str(v) for v in values]
+            index: Dict[Optional[str], int] = {}
+            codes = [index.setdefault(v, len(index)) for v in values]
+            table.vocab[name] = list(index)
+            table.codes[name] = _compact(np.array(codes, dtype=_code_dtype(len(index))))
+
+        point_lists = [d.get("points") or [] for d in rows]
+        table.point_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in point_lists], out=table.point_offsets[1:])
+        flat = [xy for pts in point_lists for xy in pts]
+        table.points = np.array(flat, dtype=np.float64).reshape(-1, 2)
+        table.point_int_flags = _int_flags([c for xy in flat for c in xy])
+        return table
+
+    @classmethod
+    def from_shapes(cls, shapes: List[Any]) -> "ShapeTable":
+        """Convert Shape dataclass instances (or rows of another table)"""
+        return cls.from_dicts([{name: getattr(s, name) for name in FIELDS if hasattr(s, name)} for s in shapes])
+
+    def _decode(self, start: int, stop: int) -> Iterator[ShapeRow]:
+        columns = {}
+        for name in NUMERIC_FIELDS:
+            flags = self.int_flags[name]
+            if isinstance(flags, np.ndarray):
+                flags = flags[start:stop]
+            columns[name] = _as_python_numbers(self.numeric[name][start:stop], flags)
+        for name in STRING_FIELDS:
+            vocab = self.vocab[name]
+            columns[name] = [vocab[c] for c in self.codes[name][start:stop].tolist()]
+
+        offsets = self.point_offsets[start:stop + 1]
+        flat = self.points[offsets[0]:offsets[-1]]
+        flags = self.point_int_flags
+        if isinstance(flags, np.ndarray):
+            flags = flags[2 * offsets[0]:2 * offsets[-1]].reshape(-1, 2)
+            xs, ys = _as_python_numbers(flat[:, 0], flags[:, 0]), _as_python_numbers(flat[:, 1], flags[:, 1])
+        else:
+            xs, ys = _as_python_numbers(flat[:, 0], flags), _as_python_numbers(flat[:, 1], flags)
+        bounds = (offsets - offsets[0]).tolist()
+        columns["points"] = [[[xs[j], ys[j]] for j in range(a, b)] for a, b in zip(bounds[:-1], bounds[1:])]
+
+        return map(ShapeRow._make, zip(*(columns[name] for name in FIELDS)))
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return [row.to_dict() for row in self]
+
+    def column(self, name: str) -> np.ndarray:
+        """Numeric column, or decoded object array for a string column"""
+        if name in self.numeric:
+            return self.numeric[name]
+        return np.asarray(self.vocab[name], dtype=object)[self.codes[name]]
+
+    def content_hash(self) -> str:
+        """Digest of the table contents, for cache keys without per-row work"""
+        h = hashlib.sha256()
+        for name in NUMERIC_FIELDS:
+            h.update(self.numeric[name].tobytes())
+            h.update(np.asarray(self.int_flags[name]).tobytes())
+        for name in STRING_FIELDS:
+            h.update(repr(self.vocab[name]).encode("utf-8"))
+            h.update(self.codes[name].astype(np.int32).tobytes())
+        h.update(self.point_offsets.tobytes())
+        h.update(self.points.tobytes())
+        h.update(np.asarray(self.point_int_flags).tobytes())
+        return h.hexdigest()
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the table"""
+        total = sum(_column_nbytes(a) for a in self.numeric.values())
+        total += sum(_column_nbytes(a) for a in self.codes.values())
+        total += self.point_offsets.nbytes + self.points.nbytes
+        total += sum(f.nbytes for f in (*self.int_flags.values(), self.point_int_flags) if isinstance(f, np.ndarray))
+        total += sum(len(v) for vocab in self.vocab.values() for v in vocab if v)
+        return total
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int) -> ShapeRow:
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        return next(self._decode(index, index + 1))
+
+    def __iter__(self) -> Iterator[ShapeRow]:
+        for start in range(0, self.size, ITER_CHUNK):
+            yield from self._decode(start, min(start + ITER_CHUNK, self.size))
@@ -0,0 +1,135 @@
+"""
+Uniform-grid spatial index over shape bounding boxes.
+
+Boxes come from renderer.raster.shape_bounds, so they already account for
+rotation, stroke width (with miter joins), polyline/arrow points (with
+arrowheads) and estimated text extents. Results are shape indices in paint order, so the last hit of a
+point query is the topmost shape.
+"""
+
+import math
+from collections import defaultdict
+from typing import List, Dict, Any, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from renderer.raster import MITER_LIMIT, shape_bounds, _num, _shape_type
+
+
+BBox = Tuple[float, float, float, float]  # (x0, y0, x1, y1)
+
+# Shapes spanning more cells than this are kept in a list checked on every query
+MAX_CELLS_PER_SHAPE = 256
+
+
+def shape_bbox(shape: Any) -> Optional[BBox]:
+    """World-space box a shape may paint, or None if it paints nothing"""
+    bounds = shape_bounds(shape)
+    if bounds is None:
+        return None
+    x0, y0, x1, y1 = (float(b) for b in bounds)
+    if _shape_type(shape) == "triangle":
+        # The flowchart editor draws triangles scale_y tall rather than equilateral
+        half = abs(_num(shape, "scale_y")) / 2 + MITER_LIMIT * max(_num(shape, "stroke_width"), 0.0) / 2 + 1
+        if _num(shape, "rotation") % 360 == 0:
+            cy = _num(shape, "y")
+            y0, y1 = min(y0, math.floor(cy - half)), max(y1, math.ceil(cy + half) + 1)
+        else:
+            reach = math.hypot(max(abs(_num(shape, "scale_x")) / 2, half), half)
+            cx, cy = _num(shape, "x"), _num(shape, "y")
+            x0, y0 = min(x0, cx - reach), min(y0, cy - reach)
+            x1, y1 = max(x1, cx + reach), max(y1, cy + reach)
+    return (x0, y0, x1, y1)
+
+
+def _as_bbox(region: Sequence[float]) -> BBox:
+    """Point (x, y) or box (x0, y0, x1, y1) as a normalized box"""
+    if len(region) == 2:
+        x, y = float(region[0]), float(region[1])
+        return (x, y, x, y)
+    x0, y0, x1, y1 = (float(v) for v in region)
+    return (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+
+
+class SpatialIndex:
+    """Grid of cell_size squares mapping each cell to the shapes whose boxes touch it"""
+
+    def __init__(self, shapes: Iterable[Any] = (), cell_size: float = 64):
+        if cell_size <= 0:
+            raise ValueError("cell_size must be positive")
+        self.cell_size = float(cell_size)
+        self.shapes: List[Any] = []
+        self._boxes: List[Optional[BBox]] = []
+        self._cells: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        self._oversized: List[int] = []
+        for shape in shapes:
+            self.insert(shape)
+
+    def __len__(self) -> int:
+        return len(self.shapes)
+
+    def _cell_range(self, box: BBox) -> Tuple[int, int, int, int]:
+        s = self.cell_size
+        return (int(math.floor(box[0] / s)), int(math.floor(box[1] / s)),
+                int(math.floor(box[2] / s)), int(math.floor(box[3] / s)))
+
+    def insert(self, shape: Any) -> int:
+        """Add a shape on top of the existing ones; returns its index"""
+        index = len(self.shapes)
+        box = shape_bbox(shape)
+        self.shapes.append(shape)
+        self._boxes.append(box)
+        if box is None:
+            return index
+        c0, r0, c1, r1 = self._cell_range(box)
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > MAX_CELLS_PER_SHAPE:
+            self._oversized.append(index)
+            return index
+        for cx in range(c0, c1 + 1):
+            for cy in range(r0, r1 + 1):
+                self._cells[(cx, cy)].append(index)
+        return index
+
+    def bbox(self, index: int) -> Optional[BBox]:
+        return self._boxes[index]
+
+    def query(self, region: Sequence[float]) -> List[int]:
+        """Indices of shapes whose boxes touch a point (x, y) or box (x0, y0, x1, y1), in paint order"""
+        box = _as_bbox(region)
+        c0, r0, c1, r1 = self._cell_range(box)
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self._cells):
+            candidates = set()
+            for (cx, cy), indices in self._cells.items():
+                if c0 <= cx <= c1 and r0 <= cy <= r1:
+                    candidates.update(indices)
+        else:
+            candidates = set()
+            for cx in range(c0, c1 + 1):
+                for cy in range(r0, r1 + 1):
+                    indices = self._cells.get((cx, cy))
+                    if indices:
+                        candidates.update(indices)
+        candidates.update(self._oversized)
+
+        x0, y0, x1, y1 = box
+        hits = []
+        for i in candidates:
+            b = self._boxes[i]
+            if b[0] <= x1 and x0 <= b[2] and b[1] <= y1 and y0 <= b[3]:
+                hits.append(i)
+        hits.sort()
+        return hits
+
+    def shapes_in(self, region: Sequence[float]) -> List[Any]:
+        """Shapes touching region, in paint order"""
+        return [self.shapes[i] for i in self.query(region)]
+
+    def hit_test(self, point: Sequence[float]) -> Optional[Any]:
+        """Topmost shape whose box contains point"""
+        hits = self.query(point)
+        return self.shapes[hits[-1]] if hits else None
+
+    def boxes(self) -> np.ndarray:
+        """(N, 4) float array of boxes; rows of NaN for shapes that paint nothing"""
+        return np.array([b if b is not None else (np.nan,) * 4 for b in self._boxes],
+                        dtype=np.float64).reshape(-1, 4)
@@ -0,0 +1,951 @@
+"""
+Shared SVG renderer for the agent and the flowchart editor.
+
+Both render_svg.py entry points subclass SVGRenderer and SVGAgent from here
+and only set their dialect:
+
+    CACHE_NAMESPACE        keeps the dialects' render cache entries apart
+    COLOR_NORMALIZER       callable applied to every paint, or None to emit
+                           colors exactly as given
+    EQUILATERAL_TRIANGLES  True: side scale_x; False: base scale_x and
+                           height scale_y
+
+Every shape type has one emitter, registered in EMITTERS when this module is
+imported; an emitter takes (renderer, shape, markers) and returns the SVG
+fragment for the shape. Fragments are written straight into a list of
+strings (no ElementTree), with attributes in the order ElementTree used to
+serialize them, so output is byte-identical to the old tree-based engines.
+Numeric attributes skip escaping since str() of a number never needs it.
+
+compact=True switches to COMPACT_EMITTERS, which trade byte-identity for
+size: numbers rounded to `precision` decimals with trailing zeros dropped,
+attributes equal to their SVG default left out, short hex colors, and paint
+and font properties moved into CSS classes shared by every shape with the
+same style (one <style> block per document).
+
+Theme tokens ("primary", "accent1", ...) in color fields are emitted as slots
+and filled from the renderer's theme on the way out (see renderer.theme), so
+the render cache holds theme-independent SVG and set_theme() never forces a
+re-render.
+"""
+
+import json
+import math
+import re
+from dataclasses import dataclass, field
+from typing import IO, Callable, Iterable, Iterator, List, Dict, Any, Optional, Tuple, Union
+
+from renderer.cache import get_render_cache, shapes_key
+from renderer.daemon import CAIROSVG_AVAILABLE, RasterizeError, get_rasterizer
+from renderer.geometry import Simplifier, SimplifyStats
+from renderer.image import RenderedImage
+from renderer.spatial import SpatialIndex
+from renderer.svg_writer import escape_attr, escape_text
+from renderer.theme import DEFAULT_THEME, THEME_SLOTS, ThemedSVG, fill_slots, get_theme
+from renderer.tiles import export_png_tiled
+from renderer.validation import ShapeError, ShapeSchema
+
+
+@dataclass
+class Shape:
+    """Base class for all shapes"""
+    shape_type: str
+    x: float = 0
+    y: float = 0
+    scale_x: float = 1
+    scale_y: float = 1
+    stroke_color: str = "black"
+    fill_color: str = "none"
+    stroke_width: float = 1
+    rotation: float = 0  # degrees
+    opacity: float = 1.0
+
+    # Text-specific properties
+    text: str = ""
+    font_size: float = 16
+    font_family: str = "Arial, sans-serif"
+    text_color: str = "black"
+    text_anchor: str = "middle"  # start, middle, end
+
+    # Polyline/Arrow-specific properties
+    points: List[List[float]] = field(default_factory=list)  # [[x1,y1], [x2,y2], ...]
+
+    # Arrow-specific properties
+    arrow_start: str = "no"  # arrow at start point
+    arrow_end: str = "no"  # arrow at end point
+    arrowhead_type: str = "triangle"  # triangle, circle, diamond
+    arrowhead_size: float = 10
+
+
+class ArrowheadMarkers:
+    """Per-render registry of arrowhead markers.
+
+    Arrows that share (arrowhead_type, normalized color, size, direction)
+    reference one <marker>. IDs count up from 0 in order of first use, so
+    rendering the same document twice gives the same bytes.
+    """
+
+    def __init__(self):
+        self.ids: Dict[Tuple[str, str, float, bool], str] = {}
+        self.parts: List[str] = []  # serialized markers, in ID order
+
+    def lookup(self, arrowhead_type: str, color: str, size: float, is_start: bool) -> Tuple[str, bool]:
+        """Return (marker_id, is_new); is_new means the caller must emit the marker"""
+        key = (arrowhead_type, color, float(size), is_start)
+        marker_id = self.ids.get(key)
+        if marker_id is not None:
+            return marker_id, False
+        marker_id = f"arrow-{'start' if is_start else 'end'}-{len(self.ids)}"
+        self.ids[key] = marker_id
+        return marker_id, True
+
+
+Emitter = Callable[["SVGRenderer", Shape, ArrowheadMarkers], str]
+
+# shape_type -> emitter; filled once at import by @register_emitter
+EMITTERS: Dict[str, Emitter] = {}
+COMPACT_EMITTERS: Dict[str, Emitter] = {}
+
+
+def register_emitter(shape_type: str, compact: bool = False) -> Callable[[Emitter], Emitter]:
+    """Decorator adding an emitter to EMITTERS (or COMPACT_EMITTERS)"""
+    table = COMPACT_EMITTERS if compact else EMITTERS
+
+    def register(emitter: Emitter) -> Emitter:
+        table[shape_type] = emitter
+        return emitter
+    return register
+
+
+# ---------------------------------------------------------------------------
+# Fragment helpers
+# ---------------------------------------------------------------------------
+
+def _tail(shape: Shape) -> str:
+    """transform attribute for a shape's position and rotation ("" when neither is set)"""
+    x, y, rotation = shape.x, shape.y, shape.rotation
+    if x != 0 or y != 0:
+        if rotation != 0:
+            return f' transform="translate({x},{y}) rotate({rotation})"'
+        return f' transform="translate({x},{y})"'
+    if rotation != 0:
+        return f' transform="rotate({rotation})"'
+    return ""
+
+
+def _styled_tail(renderer: "SVGRenderer", shape: Shape) -> str:
+    """transform plus the inline style used by the closed shapes"""
+    paint = renderer._normalize_paint
+    fill = paint(shape.fill_color) or "none"
+    stroke = paint(shape.stroke_color) or "none"
+    style = f"fill:{fill};stroke:{stroke};stroke-width:{shape.stroke_width};opacity:{shape.opacity}"
+    return f'{_tail(shape)} style="{escape_attr(style)}"'
+
+
+def _stroke_attrs(renderer: "SVGRenderer", shape: Shape) -> str:
+    """fill/stroke/stroke-width/opacity attributes of an open path"""
+    stroke = renderer._normalize_paint(shape.stroke_color)
+    out = ' fill="none"'
+    if stroke is not None:
+        out += f' stroke="{escape_attr(stroke)}"'
+    return f'{out} stroke-width="{shape.stroke_width}" opacity="{shape.opacity}"'
+
+
+def _points_str(points: List[List[float]]) -> str:
+    return " ".join([f"{pt[0]},{pt[1]}" for pt in points])
+
+
+def triangle_points(shape: Shape, equilateral: bool) -> str:
+    """SVG points of a triangle centered at (0,0), apex up.
+
+    Equilateral triangles have side scale_x; otherwise scale_x is the base
+    width and scale_y the height.
+    """
+    if equilateral:
+        base = shape.scale_x * 1
+        height = base * math.sqrt(3) / 2
+    else:
+        base = float(shape.scale_x) * 1.0
+        height = float(shape.scale_y) * 1.0
+    return f"0,{-height/2} {-base/2},{height/2} {base/2},{height/2}"
+
+
+def _arrow_shaft(shape: Shape) -> List[List[float]]:
+    """Arrow points, shortened so the shaft stops at the arrowheads"""
+    points = shape.points.copy()
+
+    # Shorten line at end to prevent overlap with arrowhead
+    if shape.arrow_end == "yes" and len(points) >= 2:
+        last = points[-1]
+        second_last = points[-2]
+        dx = last[0] - second_last[0]
+        dy = last[1] - second_last[1]
+        length = math.sqrt(dx*dx + dy*dy)
+        if length > 0:
+            ratio = (length - shape.arrowhead_size) / length
+            points[-1] = [second_last[0] + dx * ratio, second_last[1] + dy * ratio]
+
+    # Shorten line at start to prevent overlap with arrowhead
+    if shape.arrow_start == "yes" and len(points) >= 2:
+        first = points[0]
+        second = points[1]
+        dx = second[0] - first[0]
+        dy = second[1] - first[1]
+        length = math.sqrt(dx*dx + dy*dy)
+        if length > 0:
+            ratio = shape.arrowhead_size / length
+            points[0] = [first[0] + dx * ratio, first[1] + dy * ratio]
+
+    return points
+
+
+def arrow_points(shape: Shape) -> str:
+    """SVG points string for an arrow, shortened so the shaft stops at the arrowheads"""
+    return _points_str(_arrow_shaft(shape))
+
+
+def _marker(marker_id: str, arrowhead_type: str, color: str, size: float, is_start: bool) -> str:
+    """<marker> definition; start markers point backwards along the path"""
+    orient = "auto-start-reverse" if is_start else "auto"
+    out = (f'<marker id="{marker_id}" markerWidth="{size}" markerHeight="{size}" refX="0" '
+           f'orient="{orient}" refY="{size / 2}" markerUnits="userSpaceOnUse"')
+    color = escape_attr(color)
+    if arrowhead_type == "triangle":
+        child = f'<path d="M 0 0 L {size} {size/2} L 0 {size} Z" fill="{color}" />'
+    elif arrowhead_type == "circle":
+        child = f'<circle cx="{size * 0.5}" cy="{size / 2}" r="{size / 3}" fill="{color}" />'
+    elif arrowhead_type == "diamond":
+        points = f"{size},{size/2} {size*0.6},{size*0.2} {size*0.2},{size/2} {size*0.6},{size*0.8}"
+        child = f'<polygon points="{points}" fill="{color}" />'
+    else:
+        return out + " />"
+    return f"{out}>{child}</marker>"
+
+
+def _arrow_marker(markers: ArrowheadMarkers, shape: Shape, color: str, is_start: bool) -> str:
+    """Marker ID for one end of an arrow, serializing the shared <marker> on first use"""
+    marker_id, is_new = markers.lookup(shape.arrowhead_type, color, shape.arrowhead_size, is_start)
+    if is_new:
+        markers.parts.append(_marker(marker_id, shape.arrowhead_type, color, shape.arrowhead_size, is_start))
+    return marker_id
+
+
+def _marker_color(renderer: "SVGRenderer", shape: Shape) -> str:
+    return renderer._normalize_paint(shape.stroke_color) or "#000000"
+
+
+# ---------------------------------------------------------------------------
+# Emitters
+# ---------------------------------------------------------------------------
+
+@register_emitter("circle")
+def _emit_circle(renderer: "SVGRenderer", shape: Shape, markers: ArrowheadMarkers) -> str:
+    return f'<circle cx="0" cy="0" r="{shape.scale_x * 0.5}"{_styled_tail(renderer, shape)} />'
+
+
+@register_emitter("rectangle")
+def _emit_rectangle(renderer: "SVGRenderer", shape: Shape, markers: ArrowheadMarkers) -> str:
+    width = shape.scale_x * 1
+    height = shape.scale_y * 1
+    return (f'<rect x="{-width/2}" y="{-height/2}" width="{width}" height="{height}"'
+            f'{_styled_tail(renderer, shape)} />')
+
+
+@register_emitter("ellipse")
+def _emit_ellipse(renderer: "SVGRenderer", shape: Shape, markers: ArrowheadMarkers) -> str:
+    return (f'<ellipse cx="0" cy="0" rx="{shape.scale_x * 0.5}" ry="{shape.scale_y * 0.5}"'
+            f'{_styled_tail(renderer, shape)} />')
+
+
+@register_emitter("triangle")
+def _emit_triangle(renderer: "SVGRenderer", shape: Shape, markers: ArrowheadMarkers) -> str:
+    points = triangle_points(shape, renderer.EQUILATERAL_TRIANGLES)
+    return f'<polygon points="{points}"{_styled_tail(renderer, shape)} />'
+
+
+@register_emitter("text")
+def _emit_text(renderer: "SVGRenderer", shape: Shape, markers: ArrowheadMarkers) -> str:
+    # Unrotated text is positioned with x/y so it stays readable in the source
+    x, y, tail = 0, 0, ""
+    if shape.rotation != 0:
+        tail = _tail(shape)
+    else:
+        if shape.x != 0:
+            x = shape.x
+        if shape.y != 0:
+            y = shape.y
+    text_color = renderer._normalize_paint(shape.text_color) or "black"
+    out = (f'<text x="{x}" y="{y}" font-size="{shape.font_size}" '
+           f'font-family="{escape_attr(shape.font_family)}" fill="{escape_attr(text_color)}" '
+           f'text-anchor="{escape_attr(shape.text_anchor)}" opacity="{shape.opacity}" '
+           f'dominant-baseline="middle"{tail}')
+    if shape.text:
+        return f"{out}>{escape_text(shape.text)}</text>"
+    return out + " />"
+
+
+@register_emitter("polyline")
+def _emit_polyline(renderer: "SVGRenderer", shape: Shape, markers: ArrowheadMarkers) -> str:
+    points = f' points="{_points_str(shape.points)}"' if shape.points else ""
+    return f"<polyline{points}{_stroke_attrs(renderer, shape)}{_tail(shape)} />"
+
+
+@register_emitter("arrow")
+def _emit_arrow(renderer: "SVGRenderer", shape: Shape, markers: ArrowheadMarkers) -> str:
+    out = "<polyline"
+    if shape.points:
+        out += f' points="{arrow_points(shape)}"'
+    out += _stroke_attrs(renderer, shape)
+    if shape.arrow_start == "yes" or shape.arrow_end == "yes":
+        color = _marker_color(renderer, shape)
+        if shape.arrow_start == "yes":
+            out += f' marker-start="url(#{_arrow_marker(markers, shape, color, is_start=True)})"'
+        if shape.arrow_end == "yes":
+            out += f' marker-end="url(#{_arrow_marker(markers, shape, color, is_start=False)})"'
+    return out + _tail(shape) + " />"
+
+
+# ---------------------------------------------------------------------------
+# Compact emitters
+# ---------------------------------------------------------------------------
+
+# Default decimals for compact output
+COMPACT_PRECISION = 2
+# Declarations made only of these characters can go into a shared CSS class;
+# anything else (odd raw colors from the agent dialect) stays an inline style.
+# ";" and ":" here are the emitters' own separators: values go through css_value first.
+# \0 delimits theme slots, which are filled with escaped palette colors.
+_CSS_SAFE = re.compile(r"^[A-Za-z0-9#%.,:;()\- _'\"\0]*$")
+# Characters that would end a CSS value and start another declaration or rule
+_CSS_BREAKING = re.compile(r"[;:{}]")
+
+
+def css_value(value: str) -> str:
+    """A raw color or font family made safe to splice into a style; no real one contains ;:{}"""
+    if _CSS_BREAKING.search(value):
+        return _CSS_BREAKING.sub("", value)
+    return value
+
+
+def format_number(value: float, precision: int) -> str:
+    """value rounded to precision decimals, without trailing zeros or a negative zero"""
+    text = f"{value:.{precision}f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text == "-0" else text
+
+
+def short_color(color: str) -> str:
+    """#aabbcc -> #abc; anything else unchanged"""
+    if len(color) == 7 and color[0] == "#" and color[1] == color[2] and color[3] == color[4] and color[5] == color[6]:
+        return "#" + color[1] + color[3] + color[5]
+    return color
+
+
+class CompactDefs(ArrowheadMarkers):
+    """Arrowhead markers plus the CSS classes of one compact render"""
+
+    def __init__(self, precision: int):
+        super().__init__()
+        self.precision = precision
+        self.classes: Dict[str, str] = {}
+        self.rules: List[str] = []
+
+    def style(self, declarations: str) -> str:
+        """class attribute for a CSS declaration list, or an inline style if it cannot be shared"""
+        name = self.classes.get(declarations)
+        if name is None:
+            name = f"s{len(self.rules)}" if _CSS_SAFE.match(declarations) else ""
+            self.classes[declarations] = name
+            if name:
+                self.rules.append(f".{name}{{{declarations}}}")
+        if name:
+            return f' class="{name}"'
+        return f' style="{escape_attr(declarations)}"'
+
+    def stylesheet(self) -> str:
+        return "<style>" + "".join(self.rules) + "</style>" if self.rules else ""
+
+
+def _compact_tail(shape: Shape, p: int) -> str:
+    x, y, rotation = shape.x, shape.y, shape.rotation
+    if x != 0 or y != 0:
+        translate = f"translate({format_number(x, p)},{format_number(y, p)})"
+        if rotation != 0:
+            return f' transform="{translate} rotate({format_number(rotation, p)})"'
+        return f' transform="{translate}"'
+    if rotation != 0:
+        return f' transform="rotate({format_number(rotation, p)})"'
+    return ""
+
+
+def _compact_points(points: List[List[float]], p: int) -> str:
+    return " ".join([f"{format_number(pt[0], p)},{format_number(pt[1], p)}" for pt in points])
+
+
+def _compact_stroke(renderer: "SVGRenderer", shape: Shape, p: int) -> str:
+    """stroke, stroke-width and opacity declarations, leaving out SVG defaults"""
+    stroke = renderer._normalize_paint(shape.stroke_color)
+    out = ""
+    if stroke is not None and stroke != "none":
+        out = f";stroke:{short_color(stroke)}"
+        if shape.stroke_width != 1:
+            out += f";stroke-width:{format_number(shape.stroke_width, p)}"
+    if shape.opacity != 1:
+        out += f";opacity:{format_number(shape.opacity, p)}"
+    return out
+
+
+def _compact_closed(renderer: "SVGRenderer", shape: Shape, defs: CompactDefs) -> str:
+    """transform and class of a filled shape"""
+    p = defs.precision
+    fill = short_color(renderer._normalize_paint(shape.fill_color) or "none")
+    return _compact_tail(shape, p) + defs.style(f"fill:{fill}" + _compact_stroke(renderer, shape, p))
+
+
+@register_emitter("circle", compact=True)
+def _compact_circle(renderer: "SVGRenderer", shape: Shape, defs: CompactDefs) -> str:
+    return f'<circle r="{format_number(shape.scale_x * 0.5, defs.precision)}"{_compact_closed(renderer, shape, defs)}/>'
+
+
+@register_emitter("rectangle", compact=True)
+def _compact_rectangle(renderer: "SVGRenderer", shape: Shape, defs: CompactDefs) -> str:
+    p = defs.precision
+    width = shape.scale_x * 1
+    height = shape.scale_y * 1
+    return (f'<rect x="{format_number(-width/2, p)}" y="{format_number(-height/2, p)}" '
+            f'width="{format_number(width, p)}" height="{format_number(height, p)}"'
+            f'{_compact_closed(renderer, shape, defs)}/>')
+
+
+@register_emitter("ellipse", compact=True)
+def _compact_ellipse(renderer: "SVGRenderer", shape: Shape, defs: CompactDefs) -> str:
+    p = defs.precision
+    return (f'<ellipse rx="{format_number(shape.scale_x * 0.5, p)}" ry="{format_number(shape.scale_y * 0.5, p)}"'
+            f'{_compact_closed(renderer, shape, defs)}/>')
+
+
+@register_emitter("triangle", compact=True)
+def _compact_triangle(renderer: "SVGRenderer", shape: Shape, defs: CompactDefs) -> str:
+    if renderer.EQUILATERAL_TRIANGLES:
+        base = shape.scale_x * 1
+        height = base * math.sqrt(3) / 2
+    else:
+        base = float(shape.scale_x)
+        height = float(shape.scale_y)
+    points = _compact_points([[0, -height / 2], [-base / 2, height / 2], [base / 2, height / 2]], defs.precision)
+    return f'<polygon points="{points}"{_compact_closed(renderer, shape, defs)}/>'
+
+
+@register_emitter("text", compact=True)
+def _compact_text(renderer: "SVGRenderer", shape: Shape, defs: CompactDefs) -> str:
+    p = defs.precision
+    out = "<text"
+    if shape.rotation != 0:
+        out += _compact_tail(shape, p)
+    else:
+        if shape.x != 0:
+            out += f' x="{format_number(shape.x, p)}"'
+        if shape.y != 0:
+            out += f' y="{format_number(shape.y, p)}"'
+    text_color = short_color(renderer._normalize_paint(shape.text_color) or "black")
+    style = f"font-size:{format_number(shape.font_size, p)}px;font-family:{css_value(shape.font_family)};fill:{text_color}"
+    if shape.text_anchor != "start":
+        style += f";text-anchor:{shape.text_anchor}"
+    if shape.opacity != 1:
+        style += f";opacity:{format_number(shape.opacity, p)}"
+    out += defs.style(style + ";dominant-baseline:middle")
+    if shape.text:
+        return f"{out}>{escape_text(shape.text)}</text>"
+    return out + "/>"
+
+
+@register_emitter("polyline", compact=True)
+def _compact_polyline(renderer: "SVGRenderer", shape: Shape, defs: CompactDefs) -> str:
+    p = defs.precision
+    points = f' points="{_compact_points(shape.points, p)}"' if shape.points else ""
+    style = defs.style("fill:none" + _compact_stroke(renderer, shape, p))
+    return f"<polyline{points}{_compact_tail(shape, p)}{style}/>"
+
+
+def _compact_marker(marker_id: str, arrowhead_type: str, color: str, size: float, is_start: bool, p: int) -> str:
+    """_marker with compact numbers; refX and markerUnits keep their non-default values"""
+    orient = "auto-start-reverse" if is_start else "auto"
+    s, half = format_number(size, p), format_number(size / 2, p)
+    out = (f'<marker id="{marker_id}" markerWidth="{s}" markerHeight="{s}" orient="{orient}" '
+           f'refY="{half}" markerUnits="userSpaceOnUse"')
+    color = escape_attr(short_color(color))
+    if arrowhead_type == "triangle":
+        child = f'<path d="M0 0L{s} {half}L0 {s}Z" fill="{color}"/>'
+    elif arrowhead_type == "circle":
+        child = f'<circle cx="{half}" cy="{half}" r="{format_number(size / 3, p)}" fill="{color}"/>'
+    elif arrowhead_type == "diamond":
+        points = _compact_points([[size, size / 2], [size * 0.6, size * 0.2], [size * 0.2, size / 2],
+                                  [size * 0.6, size * 0.8]], p)
+        child = f'<polygon points="{points}" fill="{color}"/>'
+    else:
+        return out + "/>"
+    return f"{out}>{child}</marker>"
+
+
+def _compact_arrow_marker(defs: CompactDefs, shape: Shape, color: str, is_start: bool) -> str:
+    marker_id, is_new = defs.lookup(shape.arrowhead_type, color, shape.arrowhead_size, is_start)
+    if is_new:
+        defs.parts.append(_compact_marker(marker_id, shape.arrowhead_type, color, shape.arrowhead_size,
+                                          is_start, defs.precision))
+    return marker_id
+
+
+@register_emitter("arrow", compact=True)
+def _compact_arrow(renderer: "SVGRenderer", shape: Shape, defs: CompactDefs) -> str:
+    p = defs.precision
+    out = "<polyline"
+    if shape.points:
+        out += f' points="{_compact_points(_arrow_shaft(shape), p)}"'
+    if shape.arrow_start == "yes" or shape.arrow_end == "yes":
+        color = _marker_color(renderer, shape)
+        if shape.arrow_start == "yes":
+            out += f' marker-start="url(#{_compact_arrow_marker(defs, shape, color, is_start=True)})"'
+        if shape.arrow_end == "yes":
+            out += f' marker-end="url(#{_compact_arrow_marker(defs, shape, color, is_start=False)})"'
+    return out + _compact_tail(shape, p) + defs.style("fill:none" + _compact_stroke(renderer, shape, p)) + "/>"
+
+
+# Shape types the renderers can draw; anything else is rejected at validation
+SHAPE_TYPES = tuple(EMITTERS)
+SHAPE_SCHEMA = ShapeSchema(Shape, SHAPE_TYPES)
+
+
+class SVGRenderer:
+    """Renders shapes to SVG format"""
+
+    CACHE_NAMESPACE = "svg"
+    COLOR_NORMALIZER: Optional[Callable[[str], str]] = None
+    EQUILATERAL_TRIANGLES = False
+    EMITTERS = EMITTERS
+    COMPACT_EMITTERS = COMPACT_EMITTERS
+    # Shape fragments joined into each chunk yielded by render_svg_iter
+    STREAM_CHUNK_SHAPES = 256
+
+    def __init__(self, width: int = 800, height: int = 600, background: str = "white", use_cache: bool = True,
+                 compact: bool = False, precision: int = COMPACT_PRECISION, theme: str = DEFAULT_THEME):
+        self.width = width
+        self.height = height
+        self.background = background
+        self.compact = compact
+        self.precision = precision
+        self.emitters = self.COMPACT_EMITTERS if compact else self.EMITTERS
+        # Compact output differs per precision, so it gets cache entries of its own
+        self.cache_namespace = f"{self.CACHE_NAMESPACE}/compact-{precision}" if compact else self.CACHE_NAMESPACE
+        self.shapes: List[Shape] = []
+        self.validation_errors: List[ShapeError] = []
+        self.simplify_stats: Optional[SimplifyStats] = None
+        self._spatial_index: Optional[SpatialIndex] = None
+        self.cache = get_render_cache() if use_cache else None
+        self.set_theme(theme)
+
+    def theme_table_for(self, theme: str) -> Dict[str, str]:
+        """token -> slot text for a theme, as this renderer's dialect writes the colors"""
+        table = {}
+        for token, color in get_theme(theme).items():
+            value = self._normalize_paint(color) or "none"
+            table[token] = escape_attr(short_color(value) if self.compact else value)
+        return table
+
+    def set_theme(self, theme: str) -> None:
+        """Switch to a theme's token table; cached SVG stays valid"""
+        table = self.theme_table_for(theme)
+        self.theme = theme
+        self.theme_table = table
+        # PNGs have the colors baked in, so their cache entries are per palette
+        self._png_namespace = f"{self.cache_namespace}|{','.join(table.values())}"
+
+    def _normalize_paint(self, paint: Optional[str]) -> Optional[str]:
+        if paint is None:
+            return paint
+        slot = THEME_SLOTS.get(paint)
+        if slot is not None:
+            return slot
+        normalize = self.COLOR_NORMALIZER
+        if normalize is None:
+            return css_value(paint)
+        if isinstance(paint, str) and paint.lower() == "none":
+            return "none"
+        return normalize(paint)
+
+    @staticmethod
+    def parse_shapes(shapes_data: Union[List[Dict[str, Any]], Dict[str, Any]],
+                     validated: bool = False) -> List[Shape]:
+        """Build Shape objects without touching renderer state; invalid shapes are skipped.
+
+        validated=True skips validation for dicts that already came out of
+        SHAPE_SCHEMA.validate (or are otherwise known to be clean).
+        """
+        if isinstance(shapes_data, dict):
+            shapes_data = [shapes_data]
+        if validated:
+            return [Shape(**shape_data) for shape_data in shapes_data]
+        result = SHAPE_SCHEMA.validate(shapes_data)
+        if result.errors:
+            print(f"Shape validation: {result.summary()}")
+        return [Shape(**shape_data) for shape_data in result.shapes]
+
+    def add_shape(self, shape_data: Dict[str, Any]) -> bool:
+        """Add a shape from JSON-like dictionary"""
+        return self.add_shapes([shape_data]) == 1
+
+    def add_shapes(self, shapes_data: List[Dict[str, Any]], validated: bool = False,
+                   simplify: Optional[Simplifier] = None) -> int:
+        """Add multiple shapes, returns number successfully added.
+
+        Problems are kept in self.validation_errors as ShapeError records.
+        With simplify, polyline/arrow points go through it after validation
+        and what it removed is kept in self.simplify_stats.
+        """
+        if validated:
+            self.validation_errors = []
+        else:
+            result = SHAPE_SCHEMA.validate(shapes_data)
+            self.validation_errors = result.errors
+            if result.errors:
+                print(f"Shape validation: {result.summary()}")
+            shapes_data = result.shapes
+        self.simplify_stats = None
+        if simplify is not None:
+            shapes_data, self.simplify_stats = simplify.apply(shapes_data)
+        shapes = [Shape(**shape_data) for shape_data in shapes_data]
+        self.shapes.extend(shapes)
+        self._spatial_index = None
+        return len(shapes)
+
+    def render_svg(self, shapes: Optional[List[Shape]] = None) -> str:
+        """Render shapes to SVG string.
+
+        If shapes is given it is rendered instead of self.shapes. Arrowhead
+        markers are deduplicated and numbered per call, so output is
+        deterministic and one renderer can be shared across threads.
+        """
+        return fill_slots(self._render_template(shapes), self.theme_table)
+
+    def render_themed(self, shapes: Optional[List[Shape]] = None) -> ThemedSVG:
+        """The render with its theme slots open; fill() it with any theme_table for that theme's SVG"""
+        return ThemedSVG(self._render_template(shapes))
+
+    def _render_template(self, shapes: Optional[List[Shape]]) -> str:
+        """Cached SVG text with theme slots unfilled.
+
+        Cached as kind "template", apart from the filled "svg" entries that
+        render_batch stores for the same shapes.
+        """
+        if shapes is None:
+            shapes = self.shapes
+
+        key = None
+        if self.cache is not None:
+            key = shapes_key(shapes, self.width, self.height, self.background, "template", self.cache_namespace)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        svg_content = self._build_svg(shapes)
+        if key is not None:
+            self.cache.put(key, svg_content)
+        return svg_content
+
+    def _build_svg(self, shapes: Iterable[Shape], region: Optional[Tuple[float, float, float, float]] = None) -> str:
+        """Serialize shapes; region crops the viewBox to (x0, y0, x1, y1)"""
+        markers = self._new_defs()
+        parts: List[str] = []
+        defs_index = None
+
+        if self.background != "none":
+            parts.append(self._svg_background(region))
+        style_index = len(parts)
+
+        emitters = self.emitters
+        for shape in shapes:
+            emit = emitters.get(shape.shape_type)
+            if emit is None:
+                print(f"Unknown shape type: {shape.shape_type}")
+                continue
+            fragment = emit(self, shape, markers)
+            if defs_index is None and markers.parts:
+                # <defs> goes right before the first shape that needed a marker
+                defs_index = len(parts)
+                parts.append("")
+            parts.append(fragment)
+
+        if defs_index is not None:
+            parts[defs_index] = "<defs>" + "".join(markers.parts) + "</defs>"
+        if self.compact and markers.rules:
+            parts.insert(style_index, markers.stylesheet())
+
+        head = self._svg_head(region)
+        if not parts:
+            return head + " />"
+        return head + ">" + "".join(parts) + "</svg>"
+
+    def _new_defs(self) -> ArrowheadMarkers:
+        """Per-render marker (and, when compact, CSS class) registry"""
+        return CompactDefs(self.precision) if self.compact else ArrowheadMarkers()
+
+    def _svg_head(self, region: Optional[Tuple[float, float, float, float]] = None) -> str:
+        """Opening <svg tag, without the closing bracket; region crops the viewBox"""
+        if region is None:
+            width, height, view_box = self.width, self.height, f"0 0 {self.width} {self.height}"
+        else:
+            x0, y0, x1, y1 = region
+            width, height, view_box = x1 - x0, y1 - y0, f"{x0} {y0} {x1 - x0} {y1 - y0}"
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="{escape_attr(str(width))}" '
+                f'height="{escape_attr(str(height))}" '
+                f'viewBox="{escape_attr(view_box)}" '
+                f'preserveAspectRatio="xMidYMid meet"')
+
+    def _svg_background(self, region: Optional[Tuple[float, float, float, float]] = None) -> str:
+        if region is None:
+            return f'<rect width="100%" height="100%" fill="{escape_attr(self.background)}" />'
+        x0, y0, x1, y1 = region
+        return (f'<rect x="{x0}" y="{y0}" width="{x1 - x0}" height="{y1 - y0}" '
+                f'fill="{escape_attr(self.background)}" />')
+
+    def spatial_index(self) -> SpatialIndex:
+        """Grid index over self.shapes, rebuilt after add_shapes()/clear()"""
+        if self._spatial_index is None or len(self._spatial_index) != len(self.shapes):
+            self._spatial_index = SpatialIndex(self.shapes)
+        return self._spatial_index
+
+    def query(self, region: Union[Tuple[float, float], Tuple[float, float, float, float]]) -> List[Shape]:
+        """Shapes touching a point (x, y) or box (x0, y0, x1, y1), in paint order"""
+        return self.spatial_index().shapes_in(region)
+
+    def render_region(self, bbox: Tuple[float, float, float, float], shapes: Optional[List[Shape]] = None) -> str:
+        """Render only the shapes touching bbox, as an SVG whose viewBox is bbox.
+
+        Shapes outside the box are culled through the spatial index, so a
+        viewport or tile costs roughly what it shows rather than the whole
+        document.
+        """
+        index = self.spatial_index() if shapes is None else SpatialIndex(shapes)
+        x0, y0, x1, y1 = bbox
+        region = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+        return fill_slots(self._build_svg(index.shapes_in(region), region), self.theme_table)
+
+    def render_svg_iter(self, shapes: Optional[Iterable[Shape]] = None) -> Iterator[str]:
+        """Yield the SVG document in chunks instead of building it in memory.
+
+        A first pass collects the arrowhead markers so <defs> can be written
+        where render_svg puts it; the second pass streams shape fragments.
+        Peak memory depends on the number of distinct markers, not shapes,
+        so shapes must be re-iterable (a list or a ShapeTable). The output is
+        identical to render_svg and bypasses the render cache.
+        """
+        if shapes is None:
+            shapes = self.shapes
+
+        table = self.theme_table
+        markers = self._new_defs()
+        emitters = self.emitters
+        drawable = self.background != "none"
+        for shape in shapes:
+            if self.compact:
+                # Classes are numbered in order of first use, so the first pass emits everything
+                emit = emitters.get(shape.shape_type)
+                if emit is not None:
+                    emit(self, shape, markers)
+            elif shape.shape_type == "arrow" and (shape.arrow_start == "yes" or shape.arrow_end == "yes"):
+                color = _marker_color(self, shape)
+                if shape.arrow_start == "yes":
+                    _arrow_marker(markers, shape, color, is_start=True)
+                if shape.arrow_end == "yes":
+                    _arrow_marker(markers, shape, color, is_start=False)
+            if shape.shape_type in emitters:
+                drawable = True
+
+        if not drawable:
+            # Nothing renders (unknown types still report themselves below)
+            for shape in shapes:
+                print(f"Unknown shape type: {shape.shape_type}")
+            yield self._svg_head() + " />"
+            return
+
+        chunk = [self._svg_head() + ">"]
+        if self.background != "none":
+            chunk.append(self._svg_background())
+        if self.compact and markers.rules:
+            chunk.append(fill_slots(markers.stylesheet(), table))
+
+        defs = "<defs>" + "".join(markers.parts) + "</defs>" if markers.parts else None
+        for shape in shapes:
+            emit = emitters.get(shape.shape_type)
+            if emit is None:
+                print(f"Unknown shape type: {shape.shape_type}")
+                continue
+            if defs is not None and shape.shape_type == "arrow" and (shape.arrow_start == "yes" or shape.arrow_end == "yes"):
+                chunk.append(fill_slots(defs, table))
+                defs = None
+            # Markers are all registered already, so this emits the same IDs
+            chunk.append(fill_slots(emit(self, shape, markers), table))
+            if len(chunk) >= self.STREAM_CHUNK_SHAPES:
+                yield "".join(chunk)
+                chunk = []
+
+        chunk.append("</svg>")
+        yield "".join(chunk)
+
+    def write_svg(self, fileobj: IO[str], shapes: Optional[Iterable[Shape]] = None) -> int:
+        """Stream the SVG into a text file object; returns the number of characters written"""
+        written = 0
+        for chunk in self.render_svg_iter(shapes):
+            fileobj.write(chunk)
+            written += len(chunk)
+        return written
+
+    def save_svg(self, filename: str) -> bool:
+        """Save SVG to file"""
+        try:
+            with open(filename, 'w') as f:
+                self.write_svg(f)
+            return True
+        except Exception as e:
+            print(f"Error saving SVG: {e}")
+            return False
+
+    def render_png(self, shapes: Optional[List[Shape]] = None,
+                   width: Optional[int] = None, height: Optional[int] = None) -> Optional[bytes]:
+        """Render shapes to PNG bytes in memory, or None if conversion is unavailable"""
+        if not CAIROSVG_AVAILABLE:
+            print("Error: No PNG conversion library available.")
+            print("Install either: pip install cairosvg")
+            return None
+        if shapes is None:
+            shapes = self.shapes
+        png_width = width or self.width
+        png_height = height or self.height
+
+        key = None
+        if self.cache is not None:
+            key = shapes_key(shapes, png_width, png_height, self.background, "png", self._png_namespace)
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        # Rasterized by the shared worker pool, under its time and memory limits
+        svg_content = self.render_svg(shapes)
+        try:
+            png_bytes = get_rasterizer().rasterize(svg_content, png_width, png_height)
+        except RasterizeError as e:
+            print(f"Error rasterizing PNG: {e}")
+            return None
+        if key is not None:
+            self.cache.put(key, png_bytes)
+        return png_bytes
+
+    def render_image(self, shapes: Optional[List[Shape]] = None,
+                     width: Optional[int] = None, height: Optional[int] = None) -> Optional[RenderedImage]:
+        """Render shapes to an in-memory image (PNG bytes, decoded on demand); nothing touches disk"""
+        png_bytes = self.render_png(shapes, width, height)
+        if png_bytes is None:
+            return None
+        return RenderedImage.from_png(png_bytes)
+
+    def save_png(self, filename: str, width: Optional[int] = None, height: Optional[int] = None,
+                 tiled: bool = False, tile_size: int = 512, workers: Optional[int] = None) -> bool:
+        """Save SVG as PNG file using available conversion library.
+
+        tiled=True splits the canvas into tile_size tiles rasterized across
+        worker processes and streams them into the file (see renderer.tiles),
+        for exports too large to rasterize in one piece.
+        """
+        if tiled:
+            return export_png_tiled(self, filename, width, height, tile_size=tile_size, workers=workers)
+        try:
+            # Use provided dimensions or fall back to canvas dimensions
+            image = self.render_image(width=width, height=height)
+            if image is None:
+                return False
+            image.save(filename)
+            return True
+        except Exception as e:
+            print(f"Error saving PNG: {e}")
+            return False
+
+    def clear(self):
+        """Clear all shapes"""
+        self.shapes = []
+        self._spatial_index = None
+
+
+class SVGAgent:
+    """Agent interface for creating SVG graphics"""
+
+    renderer_class = SVGRenderer
+
+    def __init__(self, canvas_width: int = 800, canvas_height: int = 600, **renderer_options):
+        """renderer_options (use_cache, compact, precision, ...) go to the renderer"""
+        self.renderer = self.renderer_class(canvas_width, canvas_height, **renderer_options)
+
+    def create_from_json(self, json_data: str) -> bool:
+        """Create graphics from JSON string"""
+        try:
+            data = json.loads(json_data)
+            if isinstance(data, list):
+                count = self.renderer.add_shapes(data)
+                print(f"Added {count} shapes")
+                return count > 0
+            elif isinstance(data, dict):
+                return self.renderer.add_shape(data)
+            else:
+                print("JSON must be a shape object or array of shapes")
+                return False
+        except json.JSONDecodeError as e:
+            print(f"Invalid JSON: {e}")
+            return False
+
+    def create_from_dict(self, shape_data: Dict[str, Any], simplify: Optional[Simplifier] = None) -> bool:
+        """Create graphics from dictionary; simplify is passed on to add_shapes"""
+        if isinstance(shape_data, list):
+            count = self.renderer.add_shapes(shape_data, simplify=simplify)
+            return count > 0
+        else:
+            return self.renderer.add_shapes([shape_data], simplify=simplify) == 1
+
+    def render(self) -> str:
+        """Get SVG string"""
+        return self.renderer.render_svg()
+
+    def render_iter(self) -> Iterator[str]:
+        """Get the SVG as a stream of string chunks"""
+        return self.renderer.render_svg_iter()
+
+    def save(self, filename: str) -> bool:
+        """Save to file"""
+        return self.renderer.save_svg(filename)
+
+    def save_png(self, filename: str, width: Optional[int] = None, height: Optional[int] = None) -> bool:
+        """Save as PNG file"""
+        return self.renderer.save_png(filename, width, height)
+
+    def render_image(self, width: Optional[int] = None, height: Optional[int] = None) -> Optional[RenderedImage]:
+        """Render to an in-memory image without writing a file"""
+        return self.renderer.render_image(width=width, height=height)
+
+    def save_json_as_png(self, json_data: str, filename: str, width: Optional[int] = None, height: Optional[int] = None) -> bool:
+        """Create graphics from JSON and save directly as PNG"""
+        # Clear current shapes
+        self.clear()
+
+        # Load shapes from JSON
+        if not self.create_from_json(json_data):
+            print("Failed to parse JSON data")
+            return False
+
+        # Save as PNG
+        return self.save_png(filename, width, height)
+
+    def set_theme(self, theme: str):
+        """Switch the palette theme tokens resolve to"""
+        self.renderer.set_theme(theme)
+
+    def clear(self):
+        """Clear canvas"""
+        self.renderer.clear()
@@ -0,0 +1,36 @@
+"""
+Helpers for emitting SVG as text without building an ElementTree.
+
+The escaping rules match xml.etree.ElementTree's serializer so a string
+emitter can produce byte-identical output to ET.tostring(..., "unicode").
+"""
+
+
+def escape_attr(value: str) -> str:
+    """Escape an attribute value like ElementTree's _escape_attrib"""
+    if "&" in value:
+        value = value.replace("&", "&amp;")
+    if "<" in value:
+        value = value.replace("<", "&lt;")
+    if ">" in value:
+        value = value.replace(">", "&gt;")
+    if "\"" in value:
+        value = value.replace("\"", "&quot;")
+    if "\r" in value:
+        value = value.replace("\r", "&#13;")
+    if "\n" in value:
+        value = value.replace("\n", "&#10;")
+    if "\t" in value:
+        value = value.replace("\t", "&#09;")
+    return value
+
+
+def escape_text(value: str) -> str:
+    """Escape character data like ElementTree's _escape_cdata"""
+    if "&" in value:
+        value = value.replace("&", "&amp;")
+    if "<" in value:
+        value = value.replace("<", "&lt;")
+    if ">" in value:
+        value = value.replace(">", "&gt;")
+    return value
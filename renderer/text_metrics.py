@@ -0,0 +1,261 @@
+"""
+Text metrics for text shapes, without rendering them.
+
+A CSS font-family list ("Arial, sans-serif") resolves to the first family
+with a font file on this machine (or a metric-compatible substitute such as
+Liberation Sans for Arial), then to Pillow's bundled font, and finally to
+fixed em ratios. Each resolved face measures its glyph advances once at a
+reference size; FontMetrics for a (family, size) pair holds those advances
+scaled to the size and caches string widths, so measuring a label is a few
+dict lookups.
+
+Boxes follow what renderer.svg emits: one line, whitespace collapsed,
+positioned by text_anchor and dominant-baseline="middle".
+"""
+
+import os
+import sys
+import threading
+from collections import namedtuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from PIL import ImageFont
+except ImportError:  # metrics then come from the fixed ratios below
+    ImageFont = None
+
+
+DEFAULT_FONT_FAMILY = "Arial, sans-serif"
+
+# Advances and vertical metrics are measured at this size and scaled linearly
+REFERENCE_SIZE = 256
+# Line pitch for multi-line layout, in font sizes
+LINE_SPACING = 1.2
+# Cached string widths per FontMetrics before the cache is dropped
+WIDTH_CACHE_SIZE = 4096
+
+# Em ratios used when no font can be loaded (average advance, ascent, descent, x-height, cap height)
+FALLBACK_METRICS = (0.6, 0.9, 0.25, 0.5, 0.7)
+
+# Family name (lowercase) -> font file names to look for, best match first.
+# Substitutes are metric-compatible where one exists (Liberation for the MS core fonts).
+FAMILY_FILES: Dict[str, Tuple[str, ...]] = {
+    "arial": ("arial.ttf", "liberationsans-regular.ttf", "arimo-regular.ttf", "dejavusans.ttf"),
+    "helvetica": ("helvetica.ttf", "arial.ttf", "liberationsans-regular.ttf", "dejavusans.ttf"),
+    "times new roman": ("times.ttf", "times new roman.ttf", "liberationserif-regular.ttf", "tinos-regular.ttf",
+                        "dejavuserif.ttf"),
+    "times": ("times.ttf", "times new roman.ttf", "liberationserif-regular.ttf", "dejavuserif.ttf"),
+    "courier new": ("cour.ttf", "courier new.ttf", "liberationmono-regular.ttf", "cousine-regular.ttf",
+                    "dejavusansmono.ttf"),
+    "courier": ("cour.ttf", "courier new.ttf", "liberationmono-regular.ttf", "dejavusansmono.ttf"),
+    "georgia": ("georgia.ttf", "gelasio-regular.ttf", "dejavuserif.ttf"),
+    "verdana": ("verdana.ttf", "dejavusans.ttf"),
+    "sans-serif": ("dejavusans.ttf", "liberationsans-regular.ttf", "arial.ttf", "notosans-regular.ttf"),
+    "serif": ("dejavuserif.ttf", "liberationserif-regular.ttf", "times.ttf", "notoserif-regular.ttf"),
+    "monospace": ("dejavusansmono.ttf", "liberationmono-regular.ttf", "cour.ttf", "notosansmono-regular.ttf"),
+}
+
+
+def _font_dirs() -> List[str]:
+    home = os.path.expanduser("~")
+    dirs = ["/usr/share/fonts", "/usr/local/share/fonts", os.path.join(home, ".fonts"),
+            os.path.join(home, ".local", "share", "fonts")]
+    if sys.platform == "darwin":
+        dirs += ["/System/Library/Fonts", "/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    elif sys.platform == "win32":
+        dirs.append(os.path.join(os.environ.get("WINDIR", r"C:\Windows"), "Fonts"))
+    extra = os.environ.get("SVG_FONT_DIRS")
+    if extra:
+        dirs = extra.split(os.pathsep) + dirs
+    return dirs
+
+
+@lru_cache(maxsize=1)
+def _font_files() -> Dict[str, str]:
+    """Lowercase file name -> path for every TrueType/OpenType file under the font directories"""
+    files: Dict[str, str] = {}
+    for root_dir in _font_dirs():
+        for dirpath, _, names in os.walk(root_dir):
+            for name in names:
+                if name.lower().endswith((".ttf", ".otf")):
+                    files.setdefault(name.lower(), os.path.join(dirpath, name))
+    return files
+
+
+class FontFace:
+    """One resolved font: glyph advances and vertical metrics in em units"""
+
+    def __init__(self, name: str, font: Any = None):
+        self.name = name
+        self._font = font
+        self._lock = threading.Lock()
+        self.advances: Dict[str, float] = {}
+        advance, ascent, descent, x_height, cap_height = FALLBACK_METRICS
+        self.default_advance = advance
+        if font is not None:
+            try:
+                ascent, descent = (m / REFERENCE_SIZE for m in font.getmetrics())
+                x_height = -font.getbbox("x", anchor="ls")[1] / REFERENCE_SIZE or x_height
+                cap_height = -font.getbbox("H", anchor="ls")[1] / REFERENCE_SIZE or cap_height
+            except (AttributeError, TypeError, ValueError, OSError):
+                # Bitmap fonts have no anchors; keep the fallback ratios for what they cannot report
+                pass
+            for code in range(32, 127):
+                self.advance(chr(code))
+        self.ascent, self.descent = ascent, descent
+        self.x_height, self.cap_height = x_height, cap_height
+
+    def advance(self, char: str) -> float:
+        """Advance width of one character, in em"""
+        value = self.advances.get(char)
+        if value is None:
+            value = self.default_advance
+            if self._font is not None:
+                with self._lock:
+                    try:
+                        value = self._font.getlength(char) / REFERENCE_SIZE
+                    except (UnicodeError, ValueError, OSError):
+                        pass
+            self.advances[char] = value
+        return value
+
+
+class _ScaledAdvances(dict):
+    """char -> advance in px for one size, filled from the face on first use"""
+
+    def __init__(self, face: FontFace, size: float):
+        super().__init__((ch, adv * size) for ch, adv in face.advances.items())
+        self.face = face
+        self.size = size
+
+    def __missing__(self, char: str) -> float:
+        value = self.face.advance(char) * self.size
+        self[char] = value
+        return value
+
+
+TextLayout = namedtuple("TextLayout", ["lines", "widths", "width", "height", "line_height"])
+
+
+class FontMetrics:
+    """Metrics of one face at one font size, in px"""
+
+    def __init__(self, face: FontFace, size: float):
+        self.face = face
+        self.size = size
+        self.ascent = face.ascent * size
+        self.descent = face.descent * size
+        self.x_height = face.x_height * size
+        self.cap_height = face.cap_height * size
+        self.line_height = size * LINE_SPACING
+        self._advances = _ScaledAdvances(face, size)
+        self._widths: Dict[str, float] = {}
+
+    def width(self, text: str) -> float:
+        """Advance width of a single line"""
+        width = self._widths.get(text)
+        if width is None:
+            width = sum(map(self._advances.__getitem__, text))
+            if len(self._widths) >= WIDTH_CACHE_SIZE:
+                self._widths.clear()
+            self._widths[text] = width
+        return width
+
+    def wrap(self, text: str, max_width: Optional[float] = None) -> List[str]:
+        """Lines of text: explicit newlines split, then words wrap greedily at max_width.
+
+        A word wider than max_width gets a line of its own rather than being broken.
+        """
+        lines: List[str] = []
+        space = self._advances[" "]
+        for paragraph in text.split("\n"):
+            words = paragraph.split()
+            if max_width is None or len(words) <= 1:
+                lines.append(" ".join(words))
+                continue
+            line, line_width = words[0], self.width(words[0])
+            for word in words[1:]:
+                word_width = self.width(word)
+                if line_width + space + word_width <= max_width:
+                    line += " " + word
+                    line_width += space + word_width
+                else:
+                    lines.append(line)
+                    line, line_width = word, word_width
+            lines.append(line)
+        return lines
+
+    def layout(self, text: str, max_width: Optional[float] = None) -> TextLayout:
+        lines = self.wrap(text, max_width)
+        widths = [self.width(line) for line in lines]
+        height = self.line_height * (len(lines) - 1) + self.ascent + self.descent
+        return TextLayout(lines, widths, max(widths, default=0.0), height, self.line_height)
+
+    def box(self, text: str, text_anchor: str = "middle", ink: bool = False) -> Tuple[float, float, float, float]:
+        """(x0, y0, x1, y1) of a rendered <text> relative to its (x, y).
+
+        ink=False gives the line box (ascent to descent), which contains any
+        glyph; ink=True gives cap height to baseline, where most of the ink is.
+        """
+        width = self.width(" ".join(text.split()))
+        if text_anchor == "start":
+            x0 = 0.0
+        elif text_anchor == "end":
+            x0 = -width
+        else:
+            x0 = -width / 2
+        # dominant-baseline="middle" puts y half an x-height above the alphabetic baseline
+        baseline = self.x_height / 2
+        if ink:
+            return (x0, baseline - self.cap_height, x0 + width, baseline)
+        return (x0, baseline - self.ascent, x0 + width, baseline + self.descent)
+
+
+def _load(file_name: str) -> Any:
+    path = _font_files().get(file_name)
+    if path is None:
+        return None
+    try:
+        return ImageFont.truetype(path, REFERENCE_SIZE)
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=64)
+def resolve_face(font_family: str = DEFAULT_FONT_FAMILY) -> FontFace:
+    """The face a CSS font-family list renders with here"""
+    if ImageFont is not None:
+        for family in font_family.split(","):
+            family = family.strip().strip("'\"").lower()
+            for file_name in FAMILY_FILES.get(family, (family + ".ttf",)):
+                font = _load(file_name)
+                if font is not None:
+                    return FontFace(os.path.splitext(file_name)[0], font)
+        try:
+            return FontFace("pillow-default", ImageFont.load_default(REFERENCE_SIZE))
+        except (TypeError, OSError):
+            pass
+    return FontFace("fallback")
+
+
+@lru_cache(maxsize=1024)
+def get_metrics(font_family: str = DEFAULT_FONT_FAMILY, font_size: float = 16) -> FontMetrics:
+    """Cached FontMetrics for one (family, size)"""
+    return FontMetrics(resolve_face(font_family), float(font_size))
+
+
+def text_width(text: str, font_size: float = 16, font_family: str = DEFAULT_FONT_FAMILY) -> float:
+    return get_metrics(font_family, font_size).width(text)
+
+
+def layout_text(text: str, font_size: float = 16, font_family: str = DEFAULT_FONT_FAMILY,
+                max_width: Optional[float] = None) -> TextLayout:
+    """Line breaks, per-line widths and block size for text set at font_size"""
+    return get_metrics(font_family, font_size).layout(text, max_width)
+
+
+def text_box(text: str, font_size: float = 16, font_family: str = DEFAULT_FONT_FAMILY,
+             text_anchor: str = "middle", ink: bool = False) -> Tuple[float, float, float, float]:
+    """Box of a text shape relative to its anchor point; see FontMetrics.box"""
+    return get_metrics(font_family, font_size).box(text, text_anchor, ink)
@@ -0,0 +1,78 @@
+"""
+Theme palettes for the color tokens of the shape grammar.
+
+Any color field may name a token ("primary", "secondary", "accent1" ..
+"accent3") instead of a color. The renderer emits each token as a slot
+("\\0primary\\0"), which never occurs in real SVG text, and fills the slots
+from its theme's token table only when text leaves the renderer. Rendered
+(and cached) SVG is therefore theme-independent: switching themes is a
+table swap plus one pass over the slots, not a re-render.
+"""
+
+from typing import Dict, List, Mapping, Tuple
+
+THEME_TOKENS: Tuple[str, ...] = ("primary", "secondary", "accent1", "accent2", "accent3")
+DEFAULT_THEME = "default"
+
+# Palettes are any color strings the renderer accepts; every one defines all tokens
+THEMES: Dict[str, Dict[str, str]] = {
+    "default": {"primary": "#2c3e50", "secondary": "#3498db", "accent1": "#e74c3c",
+                "accent2": "#f1c40f", "accent3": "#2ecc71"},
+    "pastel": {"primary": "#5b6c8f", "secondary": "#aec6ff", "accent1": "#ffb3ba",
+               "accent2": "#fff4a3", "accent3": "#bfe3b4"},
+    "dark": {"primary": "#ecf0f1", "secondary": "#5dade2", "accent1": "#ec7063",
+             "accent2": "#f4d03f", "accent3": "#58d68d"},
+    "mono": {"primary": "#000000", "secondary": "#404040", "accent1": "#808080",
+             "accent2": "#a0a0a0", "accent3": "#c0c0c0"},
+}
+
+SLOT_MARK = "\0"
+# token -> the slot emitted in its place
+THEME_SLOTS: Dict[str, str] = {token: f"{SLOT_MARK}{token}{SLOT_MARK}" for token in THEME_TOKENS}
+
+
+def register_theme(name: str, colors: Mapping[str, str]) -> None:
+    """Add or replace a theme; tokens it leaves out come from the default theme"""
+    unknown = set(colors) - set(THEME_TOKENS)
+    if unknown:
+        raise ValueError(f"Unknown theme tokens: {', '.join(sorted(unknown))}")
+    # Palette colors are spliced into CSS and slots as they are
+    bad = [token for token, color in colors.items() if any(ch in color for ch in ";:{}\0")]
+    if bad:
+        raise ValueError(f"Theme colors may not contain ';', ':', '{{', '}}' or NUL: {', '.join(sorted(bad))}")
+    THEMES[name] = {**THEMES[DEFAULT_THEME], **colors}
+
+
+def get_theme(name: str) -> Dict[str, str]:
+    try:
+        return THEMES[name]
+    except KeyError:
+        raise ValueError(f"Unknown theme {name!r}; known: {', '.join(sorted(THEMES))}") from None
+
+
+def fill_slots(text: str, table: Mapping[str, str]) -> str:
+    """text with every slot replaced by its token's entry in table"""
+    if SLOT_MARK not in text:
+        return text
+    parts = text.split(SLOT_MARK)
+    parts[1::2] = [table[token] for token in parts[1::2]]
+    return "".join(parts)
+
+
+class ThemedSVG:
+    """SVG text split at its theme slots, for filling with one palette after another"""
+
+    __slots__ = ("parts",)
+
+    def __init__(self, text: str):
+        # Even entries are literal SVG, odd entries token names
+        self.parts: List[str] = text.split(SLOT_MARK)
+
+    @property
+    def tokens(self) -> List[str]:
+        return self.parts[1::2]
+
+    def fill(self, table: Mapping[str, str]) -> str:
+        parts = self.parts[:]
+        parts[1::2] = [table[token] for token in parts[1::2]]
+        return "".join(parts)
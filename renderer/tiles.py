@@ -0,0 +1,210 @@
+"""
+Tiled, multi-process PNG export.
+
+The output canvas is cut into tiles. Each tile is rasterized in a worker
+process from only the shapes that intersect it (culled through the
+renderer's spatial index), and finished rows of tiles are stitched and
+streamed into a PNG encoder. Peak memory is a few rows of tiles rather than
+the full uncompressed image.
+
+Backends:
+    "cairo"  - the tile's render_region() SVG through the shared rasterizer
+               pool (renderer.daemon; RGBA, any scale)
+    "raster" - renderer.raster (grayscale, output size must equal the canvas)
+"""
+
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import IO, List, Any, Optional, Tuple, Union
+
+import numpy as np
+
+import cv2
+
+from renderer.daemon import CAIROSVG_AVAILABLE, get_rasterizer
+from renderer.raster import rasterize_shapes
+from renderer.spatial import SpatialIndex
+
+
+TILE_BACKENDS = ("cairo", "raster")
+
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_PNG_COLOR_TYPES = {1: 0, 3: 2, 4: 6}  # channels -> grayscale, RGB, RGBA
+# Compressed bytes gathered before an IDAT chunk is written
+_IDAT_CHUNK_BYTES = 1 << 16
+
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+
+class PNGStreamWriter:
+    """Writes an 8-bit PNG a band of rows at a time"""
+
+    def __init__(self, fileobj: IO[bytes], width: int, height: int, channels: int = 4, level: int = 6):
+        if channels not in _PNG_COLOR_TYPES:
+            raise ValueError(f"Unsupported channel count: {channels}")
+        self.fileobj = fileobj
+        self.width = width
+        self.height = height
+        self.channels = channels
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(level)
+        self._pending: List[bytes] = []
+        self._pending_bytes = 0
+        header = struct.pack(">IIBBBBB", width, height, 8, _PNG_COLOR_TYPES[channels], 0, 0, 0)
+        fileobj.write(_PNG_SIGNATURE + _png_chunk(b"IHDR", header))
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        rows = np.ascontiguousarray(rows, dtype=np.uint8).reshape(len(rows), -1)
+        if rows.shape[1] != self.width * self.channels:
+            raise ValueError(f"Expected rows of {self.width} pixels x {self.channels} channels")
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError("More rows than the image height")
+        # Filter type 0 (None) byte in front of every scanline
+        raw = np.zeros((len(rows), rows.shape[1] + 1), dtype=np.uint8)
+        raw[:, 1:] = rows
+        self._push(self._compressor.compress(raw.tobytes()))
+        self.rows_written += len(rows)
+
+    def _push(self, data: bytes) -> None:
+        if data:
+            self._pending.append(data)
+            self._pending_bytes += len(data)
+        if self._pending_bytes >= _IDAT_CHUNK_BYTES:
+            self._flush_idat()
+
+    def _flush_idat(self) -> None:
+        if self._pending:
+            self.fileobj.write(_png_chunk(b"IDAT", b"".join(self._pending)))
+            self._pending = []
+            self._pending_bytes = 0
+
+    def close(self) -> None:
+        if self.rows_written != self.height:
+            raise ValueError(f"Wrote {self.rows_written} of {self.height} rows")
+        self._pending.append(self._compressor.flush())
+        self._flush_idat()
+        self.fileobj.write(_png_chunk(b"IEND", b""))
+
+
+def _tile_rows(width: int, height: int, tile_size: int) -> List[List[Tuple[int, int, int, int]]]:
+    """Output-pixel boxes (x0, y0, x1, y1), grouped by tile row"""
+    return [[(x, y, min(x + tile_size, width), min(y + tile_size, height)) for x in range(0, width, tile_size)]
+            for y in range(0, height, tile_size)]
+
+
+def _shape_record(shape: Any) -> Any:
+    """Plain dict so culled shapes pickle without the renderer module"""
+    if isinstance(shape, dict):
+        return shape
+    if hasattr(shape, "to_dict"):
+        return shape.to_dict()
+    return dict(vars(shape))
+
+
+def _render_tile(job: Tuple) -> np.ndarray:
+    """Rasterize one tile to uint8 pixels (cairo: in a thread, via the rasterizer pool; raster: in a worker process)"""
+    backend, payload, tile_w, tile_h = job
+    if backend == "cairo":
+        png = get_rasterizer().rasterize(payload, tile_w, tile_h)
+        image = cv2.imdecode(np.frombuffer(png, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+        if image.ndim == 2:
+            return cv2.cvtColor(image, cv2.COLOR_GRAY2RGBA)
+        if image.shape[2] == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGBA)
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2RGBA)
+    shapes, canvas, background, window = payload
+    return rasterize_shapes(shapes, canvas[0], canvas[1], background=background, window=window)
+
+
+def export_png_tiled(renderer: Any, output: Union[str, IO[bytes]], width: Optional[int] = None,
+                     height: Optional[int] = None, tile_size: int = 512, workers: Optional[int] = None,
+                     backend: str = "cairo") -> bool:
+    """Rasterize renderer.shapes tile by tile across worker processes into a streamed PNG.
+
+    width/height default to the canvas size; the cairo backend scales x and y
+    independently to reach them. workers=1 renders inline without a pool;
+    otherwise cairo tiles are dispatched from threads to the rasterizer pool
+    and raster tiles run in a process pool.
+    """
+    if backend not in TILE_BACKENDS:
+        raise ValueError(f"Unknown tile backend: {backend}")
+    if backend == "cairo" and not CAIROSVG_AVAILABLE:
+        print("Error: No PNG conversion library available.")
+        print("Install either: pip install cairosvg")
+        return False
+    out_w, out_h = width or renderer.width, height or renderer.height
+    if backend == "raster" and (out_w, out_h) != (renderer.width, renderer.height):
+        raise ValueError("The raster backend renders at canvas size only")
+    if tile_size <= 0:
+        raise ValueError("tile_size must be positive")
+
+    sx, sy = out_w / renderer.width, out_h / renderer.height
+    if backend == "raster":
+        index = SpatialIndex(renderer.shapes)
+
+    def job(tile: Tuple[int, int, int, int]) -> Tuple:
+        x0, y0, x1, y1 = tile
+        if backend == "cairo":
+            svg = renderer.render_region((x0 / sx, y0 / sy, x1 / sx, y1 / sy))
+            return backend, svg.encode("utf-8"), x1 - x0, y1 - y0
+        shapes = [_shape_record(s) for s in index.shapes_in((x0, y0, x1, y1))]
+        return backend, (shapes, (out_w, out_h), renderer.background, tile), x1 - x0, y1 - y0
+
+    tile_rows = _tile_rows(out_w, out_h, tile_size)
+    workers = workers or os.cpu_count() or 1
+    try:
+        fileobj = open(output, "wb") if isinstance(output, str) else output
+        try:
+            writer = PNGStreamWriter(fileobj, out_w, out_h, channels=4 if backend == "cairo" else 1)
+            if workers == 1:
+                for row in tile_rows:
+                    writer.write_rows(np.hstack([_render_tile(job(tile)) for tile in row]))
+            else:
+                executor = ThreadPoolExecutor if backend == "cairo" else ProcessPoolExecutor
+                with executor(max_workers=workers) as pool:
+                    _stream_tiles(pool, tile_rows, job, writer, max_in_flight=2 * workers)
+            writer.close()
+        finally:
+            if isinstance(output, str):
+                fileobj.close()
+        return True
+    except BrokenProcessPool as e:
+        print(f"Error exporting tiled PNG (worker died): {e}")
+        return False
+    except Exception as e:
+        print(f"Error exporting tiled PNG: {e}")
+        return False
+
+
+def _stream_tiles(pool: Union[ProcessPoolExecutor, ThreadPoolExecutor], tile_rows, job, writer: PNGStreamWriter, max_in_flight: int) -> None:
+    """Keep at most max_in_flight tiles queued; stitch and write each row as soon as it is complete"""
+    tiles = ((r, tile) for r, row in enumerate(tile_rows) for tile in row)
+    in_flight: deque = deque()
+    row_parts: List[np.ndarray] = []
+    current_row = 0
+
+    def submit_next() -> bool:
+        item = next(tiles, None)
+        if item is None:
+            return False
+        in_flight.append((item[0], pool.submit(_render_tile, job(item[1]))))
+        return True
+
+    while len(in_flight) < max_in_flight and submit_next():
+        pass
+    while in_flight:
+        row, future = in_flight.popleft()
+        pixels = future.result()
+        submit_next()
+        if row != current_row:
+            writer.write_rows(np.hstack(row_parts))
+            row_parts, current_row = [], row
+        row_parts.append(pixels)
+    if row_parts:
+        writer.write_rows(np.hstack(row_parts))
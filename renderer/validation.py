@@ -0,0 +1,234 @@
+"""
+Bulk validation and coercion of shape dicts.
+
+A ShapeSchema is built once from a renderer's Shape dataclass. For every
+shape type it compiles a validator that fills defaults, coerces numeric
+strings and nulls, strips NUL from strings (reserved for theme slots),
+checks enumerated fields and records problems as ShapeError entries
+instead of printing them. Shapes are only dropped when
+they cannot be rendered at all (not a dict, missing or unknown shape_type);
+a bad field falls back to its default and the rest of the shape is kept.
+"""
+
+import dataclasses
+import math
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Callable, Iterable, Optional, Tuple
+
+
+# Allowed values for enumerated fields, enforced only for the shape types that use them
+FIELD_CHOICES = {
+    "text_anchor": ("start", "middle", "end"),
+    "arrow_start": ("yes", "no"),
+    "arrow_end": ("yes", "no"),
+    "arrowhead_type": ("triangle", "circle", "diamond"),
+}
+TYPE_CHOICE_FIELDS = {
+    "text": ("text_anchor",),
+    "arrow": ("arrow_start", "arrow_end", "arrowhead_type"),
+}
+
+
+@dataclass
+class ShapeError:
+    """One validation problem; dropped means the whole shape was rejected"""
+    index: int
+    field: Optional[str]
+    message: str
+    dropped: bool = False
+
+
+@dataclass
+class ValidationResult:
+    """Normalized shape dicts (every field present) plus the problems found"""
+    shapes: List[Dict[str, Any]] = field(default_factory=list)
+    errors: List[ShapeError] = field(default_factory=list)
+
+    @property
+    def dropped(self) -> int:
+        return sum(1 for e in self.errors if e.dropped)
+
+    def summary(self) -> str:
+        return (f"{len(self.shapes)} shapes accepted, {self.dropped} dropped, "
+                f"{len(self.errors) - self.dropped} field problems")
+
+
+def _coerce_number(value: Any, name: str, default: Any, index: int, errors: List[ShapeError]) -> Any:
+    if isinstance(value, float):
+        errors.append(ShapeError(index, name, f"expected a finite number, got {value!r}"))
+        return default
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            number = int(text)
+        except ValueError:
+            try:
+                number = float(text)
+            except ValueError:
+                number = None
+        if number is not None and math.isfinite(number):
+            return number
+    errors.append(ShapeError(index, name, f"expected a number, got {value!r}"))
+    return default
+
+
+def _coerce_string(value: Any, name: str, default: Any, index: int, errors: List[ShapeError]) -> Any:
+    if isinstance(value, str):
+        # NUL is not allowed in XML, and the renderer uses it to mark theme slots;
+        # str subclasses (numpy.str_, str enums) also land here and come back as plain str
+        if "\0" in value:
+            errors.append(ShapeError(index, name, "NUL characters removed"))
+        return str.replace(value, "\0", "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    errors.append(ShapeError(index, name, f"expected a string, got {value!r}"))
+    return default
+
+
+def _coerce_points(value: Any, name: str, default: Any, index: int, errors: List[ShapeError]) -> Any:
+    if not isinstance(value, (list, tuple)):
+        errors.append(ShapeError(index, name, f"expected a list of [x, y] points, got {value!r}"))
+        return default
+    points = []
+    for point in value:
+        if isinstance(point, (list, tuple)) and len(point) >= 2:
+            x = _number_or_none(point[0])
+            y = _number_or_none(point[1])
+            if x is not None and y is not None:
+                points.append([x, y])
+                continue
+        errors.append(ShapeError(index, name, f"skipped invalid point {point!r}"))
+    return points
+
+
+def _number_or_none(value: Any) -> Optional[Any]:
+    if type(value) in (int, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, str):
+        scratch: List[ShapeError] = []
+        number = _coerce_number(value, "", None, 0, scratch)
+        return None if scratch else number
+    return None
+
+
+def _choice_coercer(choices: Tuple[str, ...]) -> Callable:
+    lookup = {c: c for c in choices}
+    if "yes" in lookup:
+        # LLMs write booleans for the yes/no flags
+        lookup.update({True: "yes", False: "no", "true": "yes", "false": "no"})
+
+    def coerce(value: Any, name: str, default: Any, index: int, errors: List[ShapeError]) -> Any:
+        key = value.strip().lower() if isinstance(value, str) else value
+        if key in lookup:
+            return lookup[key]
+        errors.append(ShapeError(index, name, f"expected one of {list(choices)}, got {value!r}"))
+        return default
+
+    return coerce
+
+
+def _all_valid_points(points: list) -> bool:
+    for point in points:
+        if type(point) is not list or len(point) != 2:
+            return False
+        x, y = point
+        if type(x) not in (int, float) or type(y) not in (int, float):
+            return False
+        if not (math.isfinite(x) and math.isfinite(y)):
+            return False
+    return True
+
+
+def _unknown_fields(data: Dict[str, Any], allowed: frozenset, index: int, errors: List[ShapeError]) -> None:
+    for key in data:
+        if key not in allowed:
+            errors.append(ShapeError(index, key, "unknown field ignored"))
+
+
+class ShapeSchema:
+    """Validator for one Shape dataclass, compiled per shape type on first use"""
+
+    def __init__(self, shape_class: type, shape_types: Iterable[str]):
+        self.shape_types = frozenset(shape_types)
+        self.allowed = frozenset(f.name for f in dataclasses.fields(shape_class))
+        self._fields = [f for f in dataclasses.fields(shape_class) if f.name != "shape_type"]
+        self._validators: Dict[str, Callable] = {}
+
+    def _field_code(self, f: dataclasses.Field, shape_type: str, env: Dict[str, Any]) -> List[str]:
+        """Source lines that leave the coerced value of one field in a local of the same name"""
+        name = f.name
+        if f.default_factory is not dataclasses.MISSING:
+            env[f"factory_{name}"] = f.default_factory
+            default = f"factory_{name}()"
+        else:
+            env[f"default_{name}"] = f.default
+            default = f"default_{name}"
+
+        if name in TYPE_CHOICE_FIELDS.get(shape_type, ()):
+            env[f"choices_{name}"] = frozenset(FIELD_CHOICES[name])
+            env[f"coerce_{name}"] = _choice_coercer(FIELD_CHOICES[name])
+            fast = f"v.__class__ is str and v in choices_{name}"
+        elif name == "points":
+            env[f"coerce_{name}"] = _coerce_points
+            fast = "v.__class__ is list and valid_points(v)"
+        elif isinstance(f.default, (int, float)):
+            env[f"coerce_{name}"] = _coerce_number
+            fast = "v.__class__ is int or (v.__class__ is float and finite(v))"
+        else:
+            env[f"coerce_{name}"] = _coerce_string
+            fast = "v.__class__ is str and '\\0' not in v"
+
+        return [
+            f"    v = get({name!r})",
+            f"    if v is None: {name} = {default}",
+            f"    elif {fast}: {name} = v",
+            f"    else: {name} = coerce_{name}(v, {name!r}, {default}, index, errors)",
+        ]
+
+    def _compile(self, shape_type: str) -> Callable:
+        """Generate a straight-line validator for one shape type, like dataclasses does for __init__"""
+        env: Dict[str, Any] = {
+            "allowed": self.allowed, "finite": math.isfinite,
+            "valid_points": _all_valid_points, "unknown_fields": _unknown_fields,
+        }
+        lines = [
+            "def validate(data, index, errors):",
+            "    if not allowed.issuperset(data): unknown_fields(data, allowed, index, errors)",
+            "    get = data.get",
+        ]
+        for f in self._fields:
+            lines.extend(self._field_code(f, shape_type, env))
+        items = ", ".join(f"{f.name!r}: {f.name}" for f in self._fields)
+        lines.append(f"    return {{'shape_type': {shape_type!r}, {items}}}")
+        exec("\n".join(lines), env)
+        return env["validate"]
+
+    def validator(self, shape_type: str) -> Callable:
+        validate = self._validators.get(shape_type)
+        if validate is None:
+            validate = self._validators[shape_type] = self._compile(shape_type)
+        return validate
+
+    def validate(self, shapes_data: Iterable[Any]) -> ValidationResult:
+        """Validate a whole list in one pass; never raises for bad input"""
+        result = ValidationResult()
+        errors = result.errors
+        validators = self._validators
+        for index, data in enumerate(shapes_data):
+            if not isinstance(data, dict):
+                errors.append(ShapeError(index, None, f"expected a shape object, got {type(data).__name__}", True))
+                continue
+            shape_type = data.get("shape_type")
+            validate = validators.get(shape_type) if isinstance(shape_type, str) else None
+            if validate is None:
+                if isinstance(shape_type, str) and shape_type.strip().lower() in self.shape_types:
+                    shape_type = shape_type.strip().lower()
+                elif shape_type is None:
+                    errors.append(ShapeError(index, "shape_type", "missing shape_type", True))
+                    continue
+                else:
+                    errors.append(ShapeError(index, "shape_type", f"unknown shape_type {shape_type!r}", True))
+                    continue
+                validate = self.validator(shape_type)
+            result.shapes.append(validate(data, index, errors))
+        return result